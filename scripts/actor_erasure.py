@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Actor Erasure for Zygo Platform
+Deletes an actor and everything that depends on them (right to be forgotten), following the
+references declared in the schema registry: the educators/service_providers/community_members
+record, feed items and their comments and likes, the actor's own comments and likes,
+actor_relationships on either side, personal credentials, the actor's timeline, and their
+family member record with its milestone and tool data.
+
+Dependents are discovered level by level with indexed equality and chunked "in" queries
+(projected to the few fields the cascade needs) on a thread pool, then deleted in batches of
+500 in parallel per collection, deepest level first, so an interrupted erasure can simply be
+run again. Nothing outside the cascade is deleted:
+    - references in DETACH_FIELDS and array references are cleared instead, e.g. replies by
+      other actors to an erased comment keep their thread position as a top-level comment
+    - a pedagogy profile is only erased with its last member that has an account
+    - like and comment counters of surviving feed items and comments are decremented in the
+      same batch that deletes the like or comment, so a rerun never decrements twice
+    - followers' timelines drop the actor's items and pull_authors entry
+An audit report with counts per collection (no document contents) is stored in _erasures.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from credential_expiry import ExpiryIndex
+from firestore_export import paginate
+from firestore_writer import MAX_BATCH_SIZE, MAX_IN_VALUES, BatchedWriter
+from schema_registry import DEFAULT_SCHEMA_PATH, SchemaRegistry, load_registry
+from sharded_counters import COMMENT_REACTIONS, FEED_STATS, ShardedCounter
+from timeline_fanout import TimelineFanout
+
+AUDIT_COLLECTION = "_erasures"
+
+# References that are set to null when their target is erased, instead of deleting the document
+DETACH_FIELDS = frozenset({("comments", "parent_comment_id"), ("milestone_evidence", "recorded_by")})
+
+# likes.target_id points at feed items or comments depending on target_type
+POLYMORPHIC_REFERENCES = {
+    "feed_items": [("likes", "target_id", "target_type", "feed_item")],
+    "comments": [("likes", "target_id", "target_type", "comment")],
+}
+
+# Fields read for documents in the cascade besides their references
+EXTRA_FIELDS = {
+    "likes": ["target_id", "target_type"],
+    "comments": ["is_deleted"],
+    "personal_credentials": ["expiry_date", "verification_status"],
+    "actor_relationships": ["relationship_type"],
+}
+
+
+class ErasurePlan:
+    def __init__(self, actor_ids: List[str]):
+        """Documents to delete (by collection and discovery level) and references to clear"""
+        self.actor_ids = list(actor_ids)
+        self.documents: Dict[str, Dict[str, Dict[str, Any]]] = {"actors": {actor_id: {} for actor_id in actor_ids}}
+        self.levels: List[Dict[str, List[str]]] = [{"actors": list(actor_ids)}]
+        # (collection, document ID) -> {field: erased IDs}
+        self.detach: Dict[Tuple[str, str], Dict[str, Set[str]]] = {}
+        self.profiles: List[str] = []
+
+    def contains(self, collection: str, doc_id: str) -> bool:
+        return doc_id in self.documents.get(collection, ())
+
+    def counts(self) -> Dict[str, int]:
+        return {collection: len(ids) for collection, ids in self.documents.items() if ids}
+
+    def pending_detaches(self) -> Dict[Tuple[str, str], Dict[str, Set[str]]]:
+        """Detaches of documents that survive the erasure"""
+        return {key: fields for key, fields in self.detach.items() if not self.contains(*key)}
+
+
+class ActorErasure:
+    def __init__(
+        self,
+        db,
+        registry: SchemaRegistry = None,
+        workers: int = 16,
+        page_size: int = 1000,
+        batch_size: int = MAX_BATCH_SIZE,
+    ):
+        """Cascade deletes over the references declared in ``registry``"""
+        self.db = db
+        self.registry = registry or load_registry()
+        self.workers = workers
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+    def _referencing(self, target: str) -> List[Tuple[str, str, Optional[Tuple[str, str]]]]:
+        """(collection, field, extra equality filter) of every query that finds dependents of ``target``"""
+        found = [(collection, field, None) for collection, field in self.registry.referencing(target)]
+        for collection, field, type_field, type_value in POLYMORPHIC_REFERENCES.get(target, ()):
+            found.append((collection, field, (type_field, type_value)))
+        return found
+
+    def _fields(self, collection: str) -> List[str]:
+        spec = self.registry.collection(collection)
+        return sorted(set(spec.references) | set(EXTRA_FIELDS.get(collection, ())))
+
+    def _find(self, collection: str, field: str, ids: List[str], extra: Optional[Tuple[str, str]]):
+        """Snapshots of ``collection`` whose ``field`` holds one of ``ids`` (at most MAX_IN_VALUES)"""
+        if self.registry.collection(collection).fields[field].type == "array":
+            condition = FieldFilter(field, "array_contains_any", ids)
+        elif len(ids) == 1:
+            condition = FieldFilter(field, "==", ids[0])
+        else:
+            condition = FieldFilter(field, "in", ids)
+        query = self.db.collection(collection).where(filter=condition)
+        if extra is not None:
+            query = query.where(filter=FieldFilter(extra[0], "==", extra[1]))
+        found = []
+        for page in paginate(query.select(self._fields(collection)), self.page_size):
+            found.extend(snapshot for snapshot in page if snapshot.id != "_schema")
+        return found
+
+    def _orphaned_profiles(self, plan: ErasurePlan, member_ids: List[str]) -> List[str]:
+        """Profiles of erased members that have no other member with an account"""
+        members = plan.documents["family_members"]
+        candidates = {
+            members[member_id].get("pedagogy_profile_id")
+            for member_id in member_ids
+            if members[member_id].get("actor_id")
+        }
+        orphaned = []
+        for profile_id in sorted(candidates - {None} - set(plan.documents.get("pedagogy_profiles", ()))):
+            query = self.db.collection("family_members").where(
+                filter=FieldFilter("pedagogy_profile_id", "==", profile_id)
+            )
+            guardians = [
+                member.id
+                for member in query.select(["actor_id"]).stream()
+                if (member.to_dict() or {}).get("actor_id") and member.id not in members
+            ]
+            if not guardians:
+                orphaned.append(profile_id)
+        return orphaned
+
+    def discover(self, actor_ids: List[str]) -> ErasurePlan:
+        """Every document the erasure deletes or detaches, without writing anything"""
+        plan = ErasurePlan(actor_ids)
+        frontier = {"actors": list(actor_ids)}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while frontier:
+                queries = []
+                for target, ids in frontier.items():
+                    for collection, field, extra in self._referencing(target):
+                        for start in range(0, len(ids), MAX_IN_VALUES):
+                            chunk = ids[start:start + MAX_IN_VALUES]
+                            future = pool.submit(self._find, collection, field, chunk, extra)
+                            queries.append((collection, field, set(chunk), future))
+
+                level: Dict[str, List[str]] = {}
+                for collection, field, chunk, future in queries:
+                    is_array = self.registry.collection(collection).fields[field].type == "array"
+                    for snapshot in future.result():
+                        if is_array or (collection, field) in DETACH_FIELDS:
+                            value = (snapshot.to_dict() or {}).get(field)
+                            erased = set(value) & chunk if is_array else {value}
+                            key = (collection, snapshot.id)
+                            plan.detach.setdefault(key, {}).setdefault(field, set()).update(erased)
+                        elif not plan.contains(collection, snapshot.id):
+                            plan.documents.setdefault(collection, {})[snapshot.id] = snapshot.to_dict() or {}
+                            level.setdefault(collection, []).append(snapshot.id)
+
+                if level.get("family_members"):
+                    profiles = self._orphaned_profiles(plan, level["family_members"])
+                    if profiles:
+                        plan.profiles.extend(profiles)
+                        plan.documents.setdefault("pedagogy_profiles", {}).update({p: {} for p in profiles})
+                        level["pedagogy_profiles"] = profiles
+                if level:
+                    plan.levels.append(level)
+                frontier = level
+        return plan
+
+    def _delete_chunk(
+        self, plan: ErasurePlan, collection: str, ids: List[str]
+    ) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Delete documents with their subcollections and decrement the counters they were
+        counted in; returns deletes per (sub)collection and counter totals"""
+        spec = self.registry.collection(collection)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        counts: Dict[str, int] = {}
+        counters: Dict[str, int] = {}
+        for doc_id in ids:
+            doc_ref = self.db.collection(collection).document(doc_id)
+            for name, sub in spec.subcollections.items():
+                key = f"{collection}/{name}"
+                if "shard_count" in sub.settings:
+                    # Counter shards have known IDs, so there is nothing to read
+                    refs = [doc_ref.collection(name).document(str(n)) for n in range(sub.settings["shard_count"])]
+                else:
+                    refs = [
+                        snapshot.reference
+                        for page in paginate(doc_ref.collection(name).select([]), self.page_size)
+                        for snapshot in page
+                    ]
+                for ref in refs:
+                    writer.delete(ref)
+                counts[key] = counts.get(key, 0) + len(refs)
+
+            decrements = self._counter_decrements(plan, collection, doc_id)
+            # The delete and its decrements must land in one commit: start a new one if they do not fit
+            if len(writer) + 1 + len(decrements) > self.batch_size:
+                writer.flush()
+            writer.delete(doc_ref)
+            for layout, target_id, field in decrements:
+                ShardedCounter.for_document(self.db, layout, target_id, self.registry).increment(field, -1, writer)
+                counters[f"{layout[0]}.{field}"] = counters.get(f"{layout[0]}.{field}", 0) - 1
+        writer.flush()
+        counts[collection] = len(ids)
+        return counts, counters
+
+    @staticmethod
+    def _counter_decrements(plan: ErasurePlan, collection: str, doc_id: str) -> List[Tuple[Tuple[str, str], str, str]]:
+        """(layout, target ID, field) of surviving counters an erased like or comment is counted in"""
+        data = plan.documents.get(collection, {}).get(doc_id, {})
+        if collection == "likes":
+            if data.get("target_type") == "comment":
+                layout, field = COMMENT_REACTIONS, "counts.like"
+            else:
+                layout, field = FEED_STATS, "likes"
+            if data.get("target_id") and not plan.contains(layout[0], data["target_id"]):
+                return [(layout, data["target_id"], field)]
+        elif collection == "comments":
+            feed_item_id = data.get("feed_item_id")
+            if feed_item_id and not data.get("is_deleted") and not plan.contains("feed_items", feed_item_id):
+                return [(FEED_STATS, feed_item_id, "comments")]
+        return []
+
+    def _detach_updates(self, plan: ErasurePlan, writer: Optional[BatchedWriter]) -> Dict[str, int]:
+        """Clear references to erased documents; only counts them without a ``writer``"""
+        counts: Dict[str, int] = {}
+        for (collection, doc_id), fields in plan.pending_detaches().items():
+            update = {}
+            for field, erased in fields.items():
+                if self.registry.collection(collection).fields[field].type == "array":
+                    update[field] = firestore.ArrayRemove(sorted(erased))
+                else:
+                    update[field] = None
+                counts[f"{collection}.{field}"] = counts.get(f"{collection}.{field}", 0) + 1
+            if writer is not None:
+                writer.update(self.db.collection(collection).document(doc_id), update)
+        return counts
+
+    def _followers(self, plan: ErasurePlan) -> List[Tuple[str, str]]:
+        """(follower, erased author) pairs whose timelines have to forget the author"""
+        pairs = set()
+        for relationship in plan.documents.get("actor_relationships", {}).values():
+            follower = relationship.get("actor_id_1")
+            if (
+                relationship.get("relationship_type") == "follows"
+                and relationship.get("actor_id_2") in plan.actor_ids
+                and follower
+                and not plan.contains("actors", follower)
+            ):
+                pairs.add((follower, relationship["actor_id_2"]))
+        return sorted(pairs)
+
+    def run(self, actor_ids: List[str], dry_run: bool = False, record: bool = True) -> Dict[str, Any]:
+        """Erase ``actor_ids``; returns (and with ``record`` stores) the audit report"""
+        started = datetime.now(timezone.utc)
+        clock = time.monotonic()
+        actors = self.db.collection("actors")
+        missing = [actor_id for actor_id in actor_ids if not actors.document(actor_id).get().exists]
+        plan = self.discover(actor_ids)
+        followers = self._followers(plan)
+        report: Dict[str, Any] = {
+            "actor_ids": list(actor_ids),
+            "missing_actors": missing,
+            "dry_run": dry_run,
+            "started_at": started.isoformat(),
+            "discovery_seconds": round(time.monotonic() - clock, 3),
+            "planned": plan.counts(),
+            "levels": len(plan.levels),
+            "pedagogy_profiles_erased": len(plan.profiles),
+            "timelines": len(followers),
+        }
+        if dry_run:
+            report["detached"] = self._detach_updates(plan, None)
+            report["seconds"] = round(time.monotonic() - clock, 3)
+            return report
+
+        # Detaches and expiry entries first: they need the plan, which a rerun after the deletes
+        # below could no longer rebuild. Both are idempotent, so repeating them is harmless.
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        report["detached"] = self._detach_updates(plan, writer)
+        expiry = ExpiryIndex(self.db, self.registry, batch_size=self.batch_size)
+        for credential_id, credential in plan.documents.get("personal_credentials", {}).items():
+            expiry.untrack(credential_id, credential, batch=writer)
+        writer.flush()
+
+        deleted: Dict[str, int] = {}
+        counters: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            fanout = TimelineFanout(self.db, self.registry, batch_size=self.batch_size)
+            for future in [pool.submit(fanout.on_unfollow, follower, author) for follower, author in followers]:
+                future.result()
+
+            # Deepest level first, so the documents that lead to the rest are deleted last
+            for level in reversed(plan.levels):
+                futures = [
+                    pool.submit(self._delete_chunk, plan, collection, ids[start:start + self.batch_size])
+                    for collection, ids in level.items()
+                    for start in range(0, len(ids), self.batch_size)
+                ]
+                for future in futures:
+                    chunk_deleted, chunk_counters = future.result()
+                    for name, count in chunk_deleted.items():
+                        deleted[name] = deleted.get(name, 0) + count
+                    for name, amount in chunk_counters.items():
+                        counters[name] = counters.get(name, 0) + amount
+
+        report["counters"] = counters
+        report["deleted"] = dict(sorted(deleted.items()))
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        report["seconds"] = round(time.monotonic() - clock, 3)
+        if record:
+            self.db.collection(AUDIT_COLLECTION).document().set(report)
+        return report
+
+
+def main():
+    """Erase Zygo actors and everything that depends on them"""
+    import argparse
+    import json
+    import os
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    parser = argparse.ArgumentParser(description="Erase Zygo actors (right to be forgotten)")
+    parser.add_argument("actor_id", nargs="+", help="IDs of the actors to erase")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--dry-run", help="Only report what would be erased", action="store_true")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--no-record", help=f"Do not store the audit report in {AUDIT_COLLECTION}", action="store_true")
+    parser.add_argument("--output", help="Write the audit report JSON here", default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    erasure = ActorErasure(
+        firestore.client(), load_registry(args.schema), workers=args.workers, page_size=args.page_size
+    )
+    verb = "Planning erasure of" if args.dry_run else "Erasing"
+    print(f"🗑️ {verb} {len(args.actor_id)} actor(s)...")
+    report = erasure.run(args.actor_id, dry_run=args.dry_run, record=not args.no_record)
+
+    for actor_id in report["missing_actors"]:
+        print(f"   ⚠️ actors/{actor_id} does not exist, erasing its dependents anyway")
+    counts = report["planned"] if args.dry_run else report["deleted"]
+    for collection, count in counts.items():
+        print(f"   {collection}: {count:,}")
+    for name, count in report["detached"].items():
+        print(f"   🔗 {name}: {count:,} cleared")
+    for name, amount in report.get("counters", {}).items():
+        print(f"   ➖ {name}: {amount:,}")
+    print(f"   📰 {report['timelines']:,} follower timelines, {report['pedagogy_profiles_erased']} pedagogy profiles")
+    if args.dry_run:
+        print(f"✅ Dry run: {sum(counts.values()):,} documents would be erased")
+    else:
+        print(f"✅ Erased {sum(counts.values()):,} documents in {report['seconds']:.1f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
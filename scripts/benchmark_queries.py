@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Query Benchmark Suite for Zygo Platform
+Seeds the local Firestore emulator at several data sizes and times the canonical queries
+from the query catalog, writing p50/p95/p99 latency, documents read and throughput as JSON
+so results can be compared across commits.
+
+Only runs against the emulator (FIRESTORE_EMULATOR_HOST must be set).
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from emulator_utils import clear_emulator, percentile
+from generate_load_data import GeneratorConfig, LoadDataGenerator, LoadWriter
+from index_coverage import DEFAULT_CATALOG_PATH, QueryShape, load_catalog
+from schema_registry import DEFAULT_SCHEMA_PATH, load_registry
+from thread_paths import SUBTREE_END
+
+# Dataset presets, scaled from the generator defaults
+SIZES = {
+    "small": dict(actors=500, feed_items=2_000, likes=10_000, comments=2_000, families=100, sessions_per_member=20),
+    "medium": dict(actors=5_000, feed_items=20_000, likes=100_000, comments=20_000, families=1_000, sessions_per_member=50),
+    "large": dict(actors=20_000, feed_items=100_000, likes=500_000, comments=100_000, families=5_000, sessions_per_member=100),
+}
+
+# Upper bounds of ranges sampled from a single document, by (collection, field): a sampled
+# comment path pages through that comment's subthread
+RANGE_ENDS = {
+    ("comments", "path"): lambda path: path + SUBTREE_END,
+}
+
+UPPER_BOUND_OPS = ("<", "<=")
+
+
+def field_value(data: Dict[str, Any], path: str) -> Any:
+    """Read a dotted field path such as privacy_settings.visibility"""
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+class ParameterSampler:
+    def __init__(self, queries: List[QueryShape], seed: int):
+        """Pick filter values for each query from documents as they are generated"""
+        self.queries = queries
+        self.rng = random.Random(seed)
+        self.seen: Dict[str, int] = {}
+        self.params: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, documents):
+        """Pass-through generator that reservoir-samples one document per query"""
+        by_collection: Dict[str, List[QueryShape]] = {}
+        for query in self.queries:
+            by_collection.setdefault(query.collection, []).append(query)
+
+        for document in documents:
+            collection, _, data = document
+            for query in by_collection.get(collection, ()):
+                seen = self.seen.get(query.name, 0) + 1
+                self.seen[query.name] = seen
+                if self.rng.randrange(seen) == 0:
+                    self.params[query.name] = {field: field_value(data, field) for field, _ in query.filters}
+            yield document
+
+
+class QueryBenchmark:
+    def __init__(self, db, iterations: int = 50, warmup: int = 5, page_size: int = 20):
+        """Time queries against ``db``"""
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        self.db = db
+        self.field_filter = FieldFilter
+        self.iterations = iterations
+        self.warmup = warmup
+        self.page_size = page_size
+
+    def build_query(self, shape: QueryShape, params: Dict[str, Any]):
+        from google.cloud import firestore
+
+        query = self.db.collection(shape.collection)
+        for field, op in shape.filters:
+            value = params[field]
+            range_end = RANGE_ENDS.get((shape.collection, field))
+            if op in UPPER_BOUND_OPS and range_end is not None:
+                value = range_end(value)
+            # Sampled values are scalars; list operators take a one-element list
+            if op in ("in", "not-in", "array-contains-any") and not isinstance(value, list):
+                value = [value]
+            query = query.where(filter=self.field_filter(field, op, value))
+        for field, direction in shape.order_by:
+            query = query.order_by(
+                field, direction=firestore.Query.DESCENDING if direction == "DESCENDING" else firestore.Query.ASCENDING
+            )
+        return query.limit(self.page_size)
+
+    def run(self, shape: QueryShape, params: Dict[str, Any]) -> Dict[str, Any]:
+        query = self.build_query(shape, params)
+        for _ in range(self.warmup):
+            list(query.stream())
+
+        latencies = []
+        documents = 0
+        billed_reads = 0
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            began = time.perf_counter()
+            results = list(query.stream())
+            latencies.append((time.perf_counter() - began) * 1000)
+            documents += len(results)
+            # Firestore bills at least one read per query, even when nothing matches
+            billed_reads += max(1, len(results))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "query": shape.name,
+            "collection": shape.collection,
+            "iterations": self.iterations,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "documents_returned": documents,
+            "documents_read": billed_reads,
+            "queries_per_second": round(self.iterations / elapsed, 2),
+            "documents_per_second": round(documents / elapsed, 2),
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """p95 regressions beyond ``max_regression`` (a fraction) relative to ``baseline``"""
+    previous = {(r["size"], r["query"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results["results"]:
+        before = previous.get((result["size"], result["query"]))
+        if not before or not before["p95_ms"]:
+            continue
+        ratio = result["p95_ms"] / before["p95_ms"]
+        if ratio > 1 + max_regression:
+            regressions.append(
+                f"{result['size']}/{result['query']}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main():
+    """Seed the emulator and benchmark the catalog queries"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark Zygo queries against the Firestore emulator")
+    parser.add_argument("--project-id", help="Emulator project ID", default="zygo-benchmark")
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--catalog", help="Path to the query catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--sizes", help="Comma separated dataset sizes", default="small,medium")
+    parser.add_argument("--queries", help="Comma separated query names (default: all)", default=None)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", help="Seeding threads", type=int, default=8)
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)", default=None)
+    parser.add_argument("--baseline", help="Previous results JSON to compare against", default=None)
+    parser.add_argument("--max-regression", help="Allowed p95 slowdown vs baseline", type=float, default=0.25)
+
+    args = parser.parse_args()
+
+    host = os.environ.get("FIRESTORE_EMULATOR_HOST")
+    if not host:
+        parser.error("FIRESTORE_EMULATOR_HOST is not set - the benchmark only runs against the emulator")
+
+    sizes = args.sizes.split(",")
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)} (choose from {', '.join(SIZES)})")
+
+    registry = load_registry(args.schema)
+    queries = load_catalog(args.catalog)
+    if args.queries:
+        wanted = set(args.queries.split(","))
+        queries = [query for query in queries if query.name in wanted]
+
+    from google.cloud import firestore
+
+    db = firestore.Client(project=args.project_id)
+    benchmark = QueryBenchmark(db, iterations=args.iterations, warmup=args.warmup, page_size=args.page_size)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "emulator_host": host,
+        "iterations": args.iterations,
+        "page_size": args.page_size,
+        "results": [],
+    }
+
+    for size in sizes:
+        print(f"🌱 Seeding {size} dataset...", file=sys.stderr)
+        clear_emulator(host, args.project_id)
+        generator = LoadDataGenerator(GeneratorConfig(seed=args.seed, **SIZES[size]), registry)
+        sampler = ParameterSampler(queries, args.seed)
+        # Progress lines go to stderr: stdout carries the results JSON
+        seeded = LoadWriter(db, workers=args.workers).write(
+            sampler.observe(generator.generate()), progress_stream=sys.stderr
+        )
+        print(f"   {seeded['written']:,} documents in {seeded['seconds']:.1f}s", file=sys.stderr)
+
+        for query in queries:
+            params = sampler.params.get(query.name)
+            if params is None:
+                print(f"   ⏭️ {query.name}: no generated data for {query.collection}", file=sys.stderr)
+                continue
+            # Only equality filters accept null; a missing field would make the query invalid
+            missing = sorted({field for field, op in query.filters if op not in ("==", "!=") and params[field] is None})
+            if missing:
+                print(f"   ⏭️ {query.name}: no generated values for {', '.join(missing)}", file=sys.stderr)
+                continue
+            result = benchmark.run(query, params)
+            result["size"] = size
+            result["dataset_documents"] = seeded["written"]
+            results["results"].append(result)
+            print(f"   ⏱️ {query.name}: p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms", file=sys.stderr)
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ p95 regressions against baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
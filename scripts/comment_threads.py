@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Materialized Comment Threads for Zygo Platform
+Stores each comment's position in its thread so a page of a thread, in display order, is
+one range query on the (feed_item_id, path) index instead of loading every comment of a
+feed item and rebuilding the tree from parent_comment_id.
+
+    path              segments of the comment and its ancestors joined by ".", root first;
+                      a segment is the creation time in milliseconds (13 digits) plus an
+                      8 hex digit hash of the comment ID, so every segment has the same width
+                      and sorting by path is a depth-first walk with replies oldest first
+    depth             0 for top-level comments
+    ancestor_ids      ancestor comment IDs, root first
+    descendant_count  replies at any depth below the comment
+
+Replies deeper than MAX_DEPTH are shown as replies to their deepest allowed ancestor, which
+keeps paths well below Firestore's 1500 byte index entry limit. The subtree of a comment is
+the path range [path, path + "/"), "/" being the character after the separator.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_export import paginate, partition_queries
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+from schema_registry import DEFAULT_SCHEMA_PATH, SchemaRegistry, load_registry
+from sharded_counters import FEED_STATS, ShardedCounter
+from thread_paths import SUBTREE_END, thread_position
+
+THREAD_FIELDS = ["path", "depth", "ancestor_ids", "descendant_count"]
+
+
+class ThreadError(ValueError):
+    """Raised when a reply cannot be attached to its parent"""
+
+
+class CommentThreads:
+    def __init__(self, db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE):
+        """Thread-aware comment writes and reads"""
+        self.db = db
+        self.registry = registry or load_registry()
+        self.batch_size = batch_size
+        self.comments = db.collection("comments")
+
+    def add_comment(
+        self,
+        feed_item_id: str,
+        author_id: str,
+        content: str,
+        parent_comment_id: Optional[str] = None,
+        author_type: Optional[str] = None,
+        comment_id: Optional[str] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Create a comment with its thread position; returns (comment ID, data)
+
+        One read (the parent, for replies) and one atomic batch: the comment, the
+        descendant_count of every ancestor and the feed item's comment counter.
+        """
+        parent = None
+        if parent_comment_id:
+            snapshot = self.comments.document(parent_comment_id).get()
+            if not snapshot.exists:
+                raise ThreadError(f"comments/{parent_comment_id} does not exist")
+            data = snapshot.to_dict()
+            if data.get("feed_item_id") != feed_item_id:
+                raise ThreadError(f"comments/{parent_comment_id} belongs to another feed item")
+            if not data.get("path"):
+                raise ThreadError(f"comments/{parent_comment_id} has no thread path, run comment_threads.py backfill")
+            parent = (parent_comment_id, data["path"], data.get("ancestor_ids") or [])
+
+        now = datetime.now(timezone.utc)
+        doc_ref = self.comments.document(comment_id) if comment_id else self.comments.document()
+        comment = {
+            "feed_item_id": feed_item_id,
+            "author_id": author_id,
+            "author_type": author_type,
+            "content": content,
+            "parent_comment_id": parent_comment_id,
+            "created_at": now,
+            "updated_at": now,
+            "is_deleted": False,
+            "reactions": {},
+            "descendant_count": 0,
+            **thread_position(doc_ref.id, now, parent),
+        }
+
+        ancestors = comment["ancestor_ids"]
+        try:
+            self._commit_comment(doc_ref, comment, ancestors)
+        except google_exceptions.NotFound:
+            # An ancestor was deleted since the reply was shown; count the ones that remain
+            refs = [self.comments.document(ancestor_id) for ancestor_id in ancestors]
+            existing = {snapshot.id for snapshot in self.db.get_all(refs) if snapshot.exists}
+            self._commit_comment(doc_ref, comment, [ancestor for ancestor in ancestors if ancestor in existing])
+        return doc_ref.id, comment
+
+    def _commit_comment(self, doc_ref, comment: Dict[str, Any], ancestors: List[str]):
+        from firebase_admin import firestore
+
+        batch = self.db.batch()
+        batch.create(doc_ref, comment)
+        for ancestor_id in ancestors:
+            batch.update(self.comments.document(ancestor_id), {"descendant_count": firestore.Increment(1)})
+        counter = ShardedCounter.for_document(self.db, FEED_STATS, comment["feed_item_id"], self.registry)
+        counter.increment("comments", 1, batch)
+        batch.commit()
+
+    def page(
+        self,
+        feed_item_id: str,
+        page_size: int = 50,
+        after: Optional[str] = None,
+        root_path: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """One page of a thread in display order, with one indexed range query
+
+        Pass the previous page's ``next`` as ``after`` to continue, and a comment's path as
+        ``root_path`` to page through that comment and its replies only.
+        """
+        query = self.comments.where(filter=FieldFilter("feed_item_id", "==", feed_item_id))
+        if root_path is not None:
+            query = query.where(filter=FieldFilter("path", ">=", root_path))
+            query = query.where(filter=FieldFilter("path", "<", root_path + SUBTREE_END))
+        query = query.order_by("path")
+        if after is not None:
+            query = query.start_after({"path": after})
+        snapshots = list(query.limit(page_size).stream())
+
+        comments = [dict(snapshot.to_dict(), id=snapshot.id) for snapshot in snapshots]
+        return {"comments": comments, "next": comments[-1]["path"] if len(comments) == page_size else None}
+
+
+class ThreadBackfill:
+    def __init__(
+        self,
+        db,
+        workers: int = 8,
+        partitions: int = 8,
+        page_size: int = 1000,
+        batch_size: int = MAX_BATCH_SIZE,
+        dry_run: bool = False,
+    ):
+        """Compute thread fields of existing comments from parent_comment_id"""
+        self.db = db
+        self.workers = workers
+        self.partitions = partitions
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self._lock = threading.Lock()
+
+    def _scan(self, query, threads: Dict[str, Dict[str, Dict[str, Any]]]):
+        fields = ["feed_item_id", "parent_comment_id", "created_at", *THREAD_FIELDS]
+        for page in paginate(query.select(fields), self.page_size):
+            with self._lock:
+                for snapshot in page:
+                    if snapshot.id == "_schema":
+                        continue
+                    data = snapshot.to_dict() or {}
+                    threads.setdefault(data.get("feed_item_id"), {})[snapshot.id] = data
+
+    @staticmethod
+    def compute(comments: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Thread fields of every comment of one feed item, keyed by comment ID
+
+        Replies to comments that are missing or on another feed item become top-level
+        comments, and so does the first comment reached in a parent cycle.
+        """
+        children: Dict[Optional[str], List[str]] = {}
+        for comment_id, data in comments.items():
+            parent = data.get("parent_comment_id")
+            children.setdefault(parent if parent in comments and parent != comment_id else None, []).append(comment_id)
+
+        result: Dict[str, Dict[str, Any]] = {}
+        pending = list(children.get(None, []))
+        while True:
+            order: List[str] = []
+            while pending:
+                comment_id = pending.pop()
+                if comment_id in result:
+                    continue
+                parent_id = comments[comment_id].get("parent_comment_id")
+                parent = None
+                if parent_id in result:
+                    parent_fields = result[parent_id]
+                    parent = (parent_id, parent_fields["path"], parent_fields["ancestor_ids"])
+                result[comment_id] = thread_position(comment_id, comments[comment_id].get("created_at"), parent)
+                result[comment_id]["descendant_count"] = 0
+                order.append(comment_id)
+                pending.extend(child for child in children.get(comment_id, ()) if child not in result)
+            for comment_id in order:
+                for ancestor_id in result[comment_id]["ancestor_ids"]:
+                    result[ancestor_id]["descendant_count"] += 1
+
+            # Comments in parent cycles are never reached from a root: start one of them as a root
+            unreached = sorted(set(comments) - set(result))
+            if not unreached:
+                return result
+            pending = [unreached[0]]
+            comments = dict(comments)
+            comments[unreached[0]] = dict(comments[unreached[0]], parent_comment_id=None)
+
+    def _write(self, items: List[Tuple[str, Dict[str, Dict[str, Any]]]]) -> Dict[str, int]:
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        counts = {"comments": 0, "updated": 0}
+        comments_ref = self.db.collection("comments")
+        for _, comments in items:
+            for comment_id, fields in self.compute(comments).items():
+                counts["comments"] += 1
+                current = comments[comment_id]
+                if all(current.get(field) == value for field, value in fields.items()):
+                    continue
+                counts["updated"] += 1
+                if not self.dry_run:
+                    writer.update(comments_ref.document(comment_id), fields)
+        writer.flush()
+        return counts
+
+    def run(self) -> Dict[str, Any]:
+        """Backfill every comment; reruns only write comments whose fields changed"""
+        started = time.monotonic()
+        threads: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            queries = partition_queries(self.db, "comments", self.partitions)
+            scans = [pool.submit(self._scan, query, threads) for query in queries]
+            for future in scans:
+                future.result()
+            scanned = time.monotonic() - started
+
+            # Threads never span feed items, so groups of feed items are written independently
+            items = sorted(threads.items(), key=lambda item: str(item[0]))
+            chunk = max(1, len(items) // (self.workers * 4))
+            futures = [pool.submit(self._write, items[start:start + chunk]) for start in range(0, len(items), chunk)]
+            result = {"feed_items": len(items), "comments": 0, "updated": 0}
+            for future in futures:
+                for key, value in future.result().items():
+                    result[key] += value
+
+        result["scan_seconds"] = round(scanned, 2)
+        result["seconds"] = round(time.monotonic() - started, 2)
+        return result
+
+
+def main():
+    """Backfill thread paths, or print a page of a thread"""
+    import argparse
+    import os
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Materialized Zygo comment threads")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill", help="Compute path, depth and counts of existing comments")
+    backfill.add_argument("--workers", type=int, default=8)
+    backfill.add_argument("--partitions", help="Document-ID ranges to scan in parallel", type=int, default=8)
+    backfill.add_argument("--page-size", type=int, default=1000)
+    backfill.add_argument("--dry-run", help="Only count the comments that would change", action="store_true")
+
+    show = commands.add_parser("page", help="Print a page of a feed item's comment thread")
+    show.add_argument("feed_item_id")
+    show.add_argument("--page-size", type=int, default=50)
+    show.add_argument("--after", help="The 'next' path printed by the previous page", default=None)
+    show.add_argument("--root-path", help="Only this comment and its replies", default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+
+    if args.command == "backfill":
+        print("🧵 Backfilling comment threads...")
+        result = ThreadBackfill(
+            db, workers=args.workers, partitions=args.partitions, page_size=args.page_size, dry_run=args.dry_run
+        ).run()
+        verb = "would be updated" if args.dry_run else "updated"
+        print(
+            f"✅ {result['comments']:,} comments on {result['feed_items']:,} feed items, "
+            f"{result['updated']:,} {verb} in {result['seconds']:.1f}s (scan {result['scan_seconds']:.1f}s)"
+        )
+        return
+
+    page = CommentThreads(db, load_registry(args.schema)).page(
+        args.feed_item_id, page_size=args.page_size, after=args.after, root_path=args.root_path
+    )
+    for comment in page["comments"]:
+        indent = "   " * comment.get("depth", 0)
+        replies = comment.get("descendant_count", 0)
+        print(f"{indent}💬 {comment['id']} ({comment.get('author_id')}, {replies} replies): {comment.get('content')}")
+    if page["next"]:
+        print(f"➡️ More: --after {page['next']}")
+
+
+if __name__ == "__main__":
+    main()
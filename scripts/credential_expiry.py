@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Credential Expiry Tracking for Zygo Platform
+Keeps credential_expiry_buckets/{iso_week}/entries/{credential_id} in step with
+personal_credentials, so "what expires in the next N days" and the daily expiry sweep read
+only the weeks that matter instead of range-scanning every credential.
+
+Only credentials in a tracked status (registry setting) with an expiry_date have an entry.
+The sweep re-reads the credentials of each due page before expiring them, so an entry that
+went stale because a credential was renewed is moved to the right week instead of expiring it.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+from schema_registry import SchemaRegistry, load_registry
+
+ENTRY_FIELDS = ["owner_id", "provider_id", "expiry_date", "verification_status"]
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def week_of(day: date) -> Tuple[str, date]:
+    """(ISO week key, Monday) of the week containing ``day``"""
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}", day - timedelta(days=day.weekday())
+
+
+class ExpiryIndex:
+    def __init__(self, db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE, page_size: int = 200):
+        """Maintain and query the bucketed expiry index"""
+        self.db = db
+        spec = (registry or load_registry()).collection("credential_expiry_buckets")
+        self.tracked_statuses = frozenset(spec.settings.get("tracked_statuses", ()))
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.buckets = db.collection("credential_expiry_buckets")
+
+    def _entry_ref(self, week_key: str, credential_id: str):
+        return self.buckets.document(week_key).collection("entries").document(credential_id)
+
+    def _entry_writes(self, credential_id: str, data: Dict[str, Any]) -> List[Tuple[Any, Optional[Dict[str, Any]]]]:
+        """(ref, data) pairs that index ``data``; empty if the credential is not tracked"""
+        expiry = _parse_date(data.get("expiry_date"))
+        if expiry is None or data.get("verification_status") not in self.tracked_statuses:
+            return []
+        week_key, week_start = week_of(expiry)
+        bucket = {"week_key": week_key, "week_start": week_start.isoformat(), "updated_at": datetime.now(timezone.utc)}
+        entry = {"credential_id": credential_id, **{field: data.get(field) for field in ENTRY_FIELDS}}
+        entry["expiry_date"] = expiry.isoformat()
+        return [(self.buckets.document(week_key), bucket), (self._entry_ref(week_key, credential_id), entry)]
+
+    def track(self, credential_id: str, data: Dict[str, Any], previous: Dict[str, Any] = None, batch=None):
+        """Index a created or updated credential
+
+        Pass the credential's ``previous`` data on updates so an entry in another week is
+        removed, and a WriteBatch/Transaction/BatchedWriter to write alongside the credential.
+        """
+        writes = self._entry_writes(credential_id, data)
+        old = _parse_date((previous or {}).get("expiry_date"))
+        if old is not None:
+            old_week, _ = week_of(old)
+            if not writes or writes[1][0].path != self._entry_ref(old_week, credential_id).path:
+                self._apply(batch, "delete", self._entry_ref(old_week, credential_id))
+        for doc_ref, doc in writes:
+            self._apply(batch, "set", doc_ref, doc)
+
+    def untrack(self, credential_id: str, data: Dict[str, Any], batch=None):
+        """Remove the entry of a deleted credential"""
+        expiry = _parse_date(data.get("expiry_date"))
+        if expiry is not None:
+            self._apply(batch, "delete", self._entry_ref(week_of(expiry)[0], credential_id))
+
+    @staticmethod
+    def _apply(batch, op: str, doc_ref, data: Dict[str, Any] = None):
+        if op == "delete":
+            if batch is not None:
+                batch.delete(doc_ref)
+            else:
+                doc_ref.delete()
+        elif batch is not None:
+            batch.set(doc_ref, data, merge=True)
+        else:
+            doc_ref.set(data, merge=True)
+
+    def _pages(self, week_key: str, **bounds: str) -> Iterator[List[Any]]:
+        """Cursor-paginated entries of one bucket, ordered by expiry_date"""
+        query = self.buckets.document(week_key).collection("entries")
+        if "after" in bounds:
+            query = query.where(filter=FieldFilter("expiry_date", ">=", bounds["after"]))
+        if "before" in bounds:
+            query = query.where(filter=FieldFilter("expiry_date", "<", bounds["before"]))
+        query = query.order_by("expiry_date").limit(self.page_size)
+
+        cursor = None
+        while True:
+            page = list((query.start_after(cursor) if cursor is not None else query).stream())
+            if not page:
+                return
+            yield page
+            if len(page) < self.page_size:
+                return
+            cursor = page[-1]
+
+    def _due_buckets(self, until: date) -> List[str]:
+        """Bucket keys whose week starts on or before ``until``, oldest first"""
+        query = self.buckets.where(filter=FieldFilter("week_start", "<=", until.isoformat())).order_by("week_start")
+        return [snapshot.id for snapshot in query.select([]).stream() if snapshot.id != "_schema"]
+
+    def expiring_within(self, days: int, today: date = None) -> Iterator[Dict[str, Any]]:
+        """Entries of tracked credentials expiring from ``today`` through ``today + days``"""
+        today = today or datetime.now(timezone.utc).date()
+        cutoff = today + timedelta(days=days)
+        week = week_of(today)[1]
+        before = (cutoff + timedelta(days=1)).isoformat()
+        while week <= cutoff:
+            for page in self._pages(week_of(week)[0], after=today.isoformat(), before=before):
+                for entry in page:
+                    yield entry.to_dict()
+            week += timedelta(days=7)
+
+    def sweep(self, today: date = None) -> Dict[str, int]:
+        """Expire tracked credentials whose expiry_date is before ``today``
+
+        Reads only buckets of weeks that have started, one page of entries at a time, plus
+        the credentials of each page. Buckets of past weeks are deleted once empty.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        now = datetime.now(timezone.utc)
+        counts = {"buckets": 0, "entries": 0, "expired": 0, "moved": 0, "dropped": 0}
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        credentials = self.db.collection("personal_credentials")
+
+        for week_key in self._due_buckets(today):
+            counts["buckets"] += 1
+            for page in self._pages(week_key, before=today.isoformat()):
+                counts["entries"] += len(page)
+                current = {
+                    snapshot.id: snapshot
+                    for snapshot in self.db.get_all([credentials.document(entry.id) for entry in page])
+                }
+                for entry in page:
+                    snapshot = current.get(entry.id)
+                    data = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+                    expiry = _parse_date((data or {}).get("expiry_date"))
+                    status = (data or {}).get("verification_status")
+                    if data is None or expiry is None or status not in self.tracked_statuses:
+                        writer.delete(entry.reference)
+                        counts["dropped"] += 1
+                    elif expiry >= today:
+                        # Renewed without the index being told - move the entry to its new week
+                        writer.delete(entry.reference)
+                        for doc_ref, doc in self._entry_writes(entry.id, data):
+                            writer.set(doc_ref, doc, merge=True)
+                        counts["moved"] += 1
+                    else:
+                        writer.update(
+                            snapshot.reference,
+                            {
+                                "verification_status": "expired",
+                                "updated_at": now,
+                                "verification_history": firestore.ArrayUnion(
+                                    [{"status": "expired", "previous_status": status, "at": now, "by": "expiry_sweep"}]
+                                ),
+                            },
+                        )
+                        writer.delete(entry.reference)
+                        counts["expired"] += 1
+
+            # Every entry of a week that ended before today was on one of the pages above
+            week_start = date.fromisocalendar(int(week_key[:4]), int(week_key[6:]), 1)
+            if week_start + timedelta(days=6) < today:
+                writer.delete(self.buckets.document(week_key))
+        writer.flush()
+        return counts
+
+
+def rebuild_index(db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE) -> Dict[str, int]:
+    """Recreate every bucket entry from personal_credentials and drop entries with no credential"""
+    index = ExpiryIndex(db, registry, batch_size)
+    writer = BatchedWriter(db, batch_size=batch_size)
+    wanted = set()
+    for snapshot in db.collection("personal_credentials").select(ENTRY_FIELDS).stream():
+        if snapshot.id == "_schema":
+            continue
+        for doc_ref, doc in index._entry_writes(snapshot.id, snapshot.to_dict() or {}):
+            if doc_ref.path not in wanted:
+                wanted.add(doc_ref.path)
+                writer.set(doc_ref, doc)
+
+    stale = 0
+    for bucket in index.buckets.select([]).stream():
+        if bucket.id == "_schema":
+            continue
+        for entry in bucket.reference.collection("entries").select([]).stream():
+            if entry.reference.path not in wanted:
+                writer.delete(entry.reference)
+                stale += 1
+        if bucket.reference.path not in wanted:
+            writer.delete(bucket.reference)
+    writer.flush()
+    return {"entries": len([path for path in wanted if "/entries/" in path]), "stale": stale}
+
+
+def main():
+    """Sweep expired credentials, list upcoming expiries or rebuild the index"""
+    import argparse
+    import os
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    parser = argparse.ArgumentParser(description="Zygo credential expiry tracking")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--page-size", help="Bucket entries read per page", type=int, default=200)
+    parser.add_argument("--rebuild", help="Rebuild the expiry index from personal_credentials", action="store_true")
+    parser.add_argument("--sweep", help="Mark credentials that expired before today as expired", action="store_true")
+    parser.add_argument("--upcoming", help="List credentials expiring in the next N days", type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+    index = ExpiryIndex(db, batch_size=args.batch_size, page_size=args.page_size)
+
+    if args.rebuild:
+        result = rebuild_index(db, batch_size=args.batch_size)
+        print(f"🗂️  Indexed {result['entries']:,} credentials, removed {result['stale']:,} stale entries")
+
+    if args.sweep:
+        counts = index.sweep()
+        print(
+            f"✅ Swept {counts['buckets']} buckets ({counts['entries']:,} due entries): "
+            f"{counts['expired']:,} expired, {counts['moved']:,} moved after renewal, {counts['dropped']:,} dropped"
+        )
+
+    if args.upcoming is not None:
+        entries = list(index.expiring_within(args.upcoming))
+        print(f"⏰ {len(entries):,} credentials expire in the next {args.upcoming} days")
+        for entry in entries:
+            print(f"   {entry['expiry_date']}  {entry['credential_id']}  owner {entry['owner_id']}")
+
+
+if __name__ == "__main__":
+    main()
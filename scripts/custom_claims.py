@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Custom Claims Sync for Zygo Platform
+Denormalizes what the security rules need about the signed-in actor into Firebase Auth
+custom claims, so rules read request.auth.token instead of calling get() on actors (one
+billed read per evaluated request).
+
+Claims live under a single "zygo" key (Auth user uid == actor ID):
+    type      actors.type
+    verified  actors.verification_status == "verified"
+    profiles  pedagogy profiles the actor belongs to (family_members.actor_id)
+    members   every active family member of those profiles
+    centers   service centers the actor works at (service_providers / educators center_id)
+
+The sync reads the source collections with projected queries, lists Auth users in pages of
+1000 and only writes claims that changed. Syncing selected actors reads only their documents
+(indexed "in" queries) and looks their Auth users up by UID. Claims reach clients on their next ID token
+refresh; actors.claims_updated_at is bumped so clients can force one.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_writer import MAX_BATCH_SIZE, MAX_IN_VALUES, BatchedWriter
+from rate_limiter import RateLimiter
+
+CLAIMS_KEY = "zygo"
+
+# Documented in _system/security_rules_template next to the rules that use them
+CLAIM_FIELDS = {
+    "type": "actors.type",
+    "verified": "actors.verification_status == verified",
+    "profiles": "pedagogy_profile_id of family_members linked to the actor",
+    "members": "IDs of all active family_members in those profiles",
+    "centers": "center_id of the actor's service_providers and educators documents",
+}
+
+# Firebase rejects custom claims whose JSON encoding exceeds 1000 bytes
+MAX_CLAIMS_BYTES = 1000
+
+# auth.get_users accepts at most 100 identifiers per call
+MAX_USER_LOOKUPS = 100
+
+ACTOR_FIELDS = ["type", "verification_status"]
+CENTER_FIELDS = ["actor_id", "center_id"]
+MEMBER_FIELDS = ["actor_id", "pedagogy_profile_id", "is_active"]
+
+
+def _stream(db, collection: str, fields: Iterable[str]):
+    for snapshot in db.collection(collection).select(list(fields)).stream():
+        if snapshot.id != "_schema":
+            yield snapshot.id, snapshot.to_dict() or {}
+
+
+def _where_in(db, collection: str, field: str, values: Iterable[str], fields: Iterable[str]):
+    values = sorted(values)
+    for start in range(0, len(values), MAX_IN_VALUES):
+        query = db.collection(collection).where(filter=FieldFilter(field, "in", values[start : start + MAX_IN_VALUES]))
+        for snapshot in query.select(list(fields)).stream():
+            yield snapshot.id, snapshot.to_dict() or {}
+
+
+def compute_claims(db, actor_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Desired ``zygo`` claims for every actor (or only ``actor_ids``), keyed by actor ID"""
+    if actor_ids is None:
+        actors = _stream(db, "actors", ACTOR_FIELDS)
+        staff = [_stream(db, collection, CENTER_FIELDS) for collection in ("service_providers", "educators")]
+        family = _stream(db, "family_members", MEMBER_FIELDS)
+    else:
+        actor_ids = sorted(set(actor_ids))
+        refs = [db.collection("actors").document(actor_id) for actor_id in actor_ids]
+        snapshots = db.get_all(refs, field_paths=ACTOR_FIELDS)
+        actors = ((snapshot.id, snapshot.to_dict() or {}) for snapshot in snapshots if snapshot.exists)
+        staff = [
+            _where_in(db, collection, "actor_id", actor_ids, CENTER_FIELDS)
+            for collection in ("service_providers", "educators")
+        ]
+        # Every member of the actors' own profiles, which includes the actors' member documents
+        own = {
+            member["pedagogy_profile_id"]
+            for _, member in _where_in(db, "family_members", "actor_id", actor_ids, MEMBER_FIELDS)
+            if member.get("pedagogy_profile_id") and member.get("is_active") is not False
+        }
+        family = _where_in(db, "family_members", "pedagogy_profile_id", own, MEMBER_FIELDS)
+
+    claims: Dict[str, Dict[str, Any]] = {}
+    for actor_id, actor in actors:
+        claims[actor_id] = {"type": actor.get("type"), "verified": actor.get("verification_status") == "verified"}
+
+    centers: Dict[str, set] = {}
+    for source in staff:
+        for _, profile in source:
+            if profile.get("actor_id") and profile.get("center_id"):
+                centers.setdefault(profile["actor_id"], set()).add(profile["center_id"])
+
+    profiles_by_actor: Dict[str, set] = {}
+    members_by_profile: Dict[str, set] = {}
+    for member_id, member in family:
+        profile_id = member.get("pedagogy_profile_id")
+        if not profile_id or member.get("is_active") is False:
+            continue
+        members_by_profile.setdefault(profile_id, set()).add(member_id)
+        if member.get("actor_id"):
+            profiles_by_actor.setdefault(member["actor_id"], set()).add(profile_id)
+
+    for actor_id, actor_claims in claims.items():
+        profiles = profiles_by_actor.get(actor_id, set())
+        members = set().union(*(members_by_profile[profile_id] for profile_id in profiles)) if profiles else set()
+        # Empty lists are left out to keep tokens small; rules read them with get(key, [])
+        for name, values in (("profiles", profiles), ("members", members), ("centers", centers.get(actor_id))):
+            if values:
+                actor_claims[name] = sorted(values)
+    return claims
+
+
+def claims_size(claims: Dict[str, Any]) -> int:
+    return len(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+
+
+class ClaimsSync:
+    def __init__(self, db, auth_client=None, workers: int = 8, rate: float = 50.0, batch_size: int = MAX_BATCH_SIZE):
+        """Push computed claims to Firebase Auth; ``rate`` caps set_custom_user_claims calls per second"""
+        if auth_client is None:
+            from firebase_admin import auth as auth_client
+        self.db = db
+        self.auth = auth_client
+        self.workers = workers
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+
+    def _current_claims(self, uids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Existing custom claims of every Auth user (one list call per 1000 users), or of ``uids``"""
+        if uids is None:
+            return {user.uid: dict(user.custom_claims or {}) for user in self.auth.list_users().iterate_all()}
+        uids = sorted(uids)
+        current: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(uids), MAX_USER_LOOKUPS):
+            identifiers = [self.auth.UidIdentifier(uid) for uid in uids[start : start + MAX_USER_LOOKUPS]]
+            for user in self.auth.get_users(identifiers).users:
+                current[user.uid] = dict(user.custom_claims or {})
+        return current
+
+    def _set_claims(self, uid: str, claims: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        self.limiter.acquire()
+        try:
+            self.auth.set_custom_user_claims(uid, claims or None)
+        except Exception as e:
+            return uid, str(e)
+        return None
+
+    def run(self, actor_ids: Optional[Iterable[str]] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Sync every actor (or only ``actor_ids``) and clear claims of users that are no longer actors"""
+        scope = set(actor_ids) if actor_ids is not None else None
+        desired = compute_claims(self.db, scope)
+        current = self._current_claims(scope)
+        if scope is None:
+            scope = set(desired) | set(current)
+
+        updates: Dict[str, Dict[str, Any]] = {}
+        result: Dict[str, Any] = {
+            "actors": len(desired),
+            "unchanged": 0,
+            "no_auth_user": 0,
+            "too_large": [],
+            "errors": [],
+        }
+        for uid in sorted(scope):
+            if uid not in current:
+                if uid in desired:
+                    result["no_auth_user"] += 1
+                continue
+            existing = current[uid]
+            wanted = desired.get(uid)
+            if existing.get(CLAIMS_KEY) == wanted or (wanted is None and CLAIMS_KEY not in existing):
+                result["unchanged"] += 1
+                continue
+            merged = {key: value for key, value in existing.items() if key != CLAIMS_KEY}
+            if wanted is not None:
+                merged[CLAIMS_KEY] = wanted
+            if claims_size(merged) > MAX_CLAIMS_BYTES:
+                result["too_large"].append(uid)
+                continue
+            updates[uid] = merged
+
+        result["updated"] = len(updates)
+        if dry_run or not updates:
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            errors = [error for error in pool.map(lambda item: self._set_claims(*item), updates.items()) if error]
+        result["errors"] = errors
+        failed = {uid for uid, _ in errors}
+
+        # Tell signed-in clients to refresh their ID token
+        now = datetime.now(timezone.utc)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        for uid in updates:
+            if uid in desired and uid not in failed:
+                writer.update(self.db.collection("actors").document(uid), {"claims_updated_at": now})
+        writer.flush()
+        return result
+
+
+def main():
+    """Sync Auth custom claims from Firestore"""
+    import argparse
+    import os
+    import sys
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Sync Zygo Auth custom claims")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--actor", help="Only sync these actor IDs", action="append", default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", help="Maximum claim updates per second", type=float, default=50.0)
+    parser.add_argument("--dry-run", help="Report changes without writing them", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    print("🪪 Syncing custom claims...")
+    result = ClaimsSync(firestore.client(), workers=args.workers, rate=args.rate).run(args.actor, args.dry_run)
+    print(
+        f"✅ {result['actors']:,} actors: {result['updated']:,} {'to update' if args.dry_run else 'updated'}, "
+        f"{result['unchanged']:,} unchanged, {result['no_auth_user']:,} without an Auth user"
+    )
+    for uid in result["too_large"]:
+        print(f"   ⚠️ {uid}: claims exceed {MAX_CLAIMS_BYTES} bytes, not updated")
+    for uid, error in result["errors"]:
+        print(f"   ❌ {uid}: {error}")
+    if result["too_large"] or result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
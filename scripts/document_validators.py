@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Document Validators for Zygo Platform
+Compiles the registry's field specs ("string - verified|pending|unverified", references, ...)
+into one generated Python function per collection, so checking a document is a straight run
+of isinstance/set lookups with no per-field dispatch.
+
+The same validators are used inline (pass a DocumentValidator to BatchedWriter to reject bad
+writes before they are queued) and by the drift audit, which streams whole collections in
+parallel document-ID partitions and reports violation counts per field with sample IDs.
+
+Violations are (field, problem) pairs, with problem one of:
+    type       the value does not have the declared type
+    enum       the value is not one of the enumerated values
+    reference  a reference field does not hold a usable document ID
+    unknown    the field is not declared (strict mode only)
+Missing fields and nulls are not violations - the registry has no notion of required fields.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from firestore_export import paginate, partition_queries
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaRegistry, load_registry
+
+Violation = Tuple[str, str]
+
+# Checks per declared type, as expressions over ``value``; bool is excluded from number
+TYPE_CHECKS = {
+    "string": "value.__class__ is str or isinstance(value, str)",
+    "number": "value.__class__ is int or value.__class__ is float",
+    "boolean": "value.__class__ is bool",
+    "timestamp": "isinstance(value, datetime)",
+    "object": "isinstance(value, dict)",
+    "array": "isinstance(value, list)",
+}
+
+
+class ValidationError(ValueError):
+    """Raised by DocumentValidator when a document about to be written is invalid"""
+
+    def __init__(self, path: str, violations: List[Violation]):
+        self.path = path
+        self.violations = violations
+        problems = ", ".join(f"{field} ({problem})" for field, problem in violations)
+        super().__init__(f"{path}: {problems}")
+
+
+def _transform_types() -> tuple:
+    """Write-time sentinels (Increment, ArrayUnion, SERVER_TIMESTAMP, ...) - never validated"""
+    from google.cloud.firestore_v1 import transforms
+
+    return (
+        transforms.Sentinel,
+        transforms.ArrayUnion,
+        transforms.ArrayRemove,
+        transforms.Increment,
+        transforms.Maximum,
+        transforms.Minimum,
+    )
+
+
+def _is_document_id(value: Any) -> bool:
+    return value.__class__ is str and value != "" and "/" not in value
+
+
+def _source(spec: CollectionSpec, strict: bool) -> str:
+    """Python source of the validator function for ``spec``"""
+    lines = ["def validate(data):", "    problems = []"]
+    for number, (name, field) in enumerate(spec.fields.items()):
+        lines.append(f"    value = data.get({name!r}, MISSING)")
+        lines.append("    if value is not MISSING and value is not None and not isinstance(value, TRANSFORMS):")
+        lines.append(f"        if not ({TYPE_CHECKS[field.type]}):")
+        lines.append(f"            problems.append(({name!r}, 'type'))")
+        if field.enum:
+            lines.append(f"        elif value not in ENUM_{number}:")
+            lines.append(f"            problems.append(({name!r}, 'enum'))")
+        if field.reference and field.type == "string":
+            lines.append("        elif not is_document_id(value):")
+            lines.append(f"            problems.append(({name!r}, 'reference'))")
+        elif field.reference and field.type == "array":
+            lines.append("        elif not all(is_document_id(item) for item in value):")
+            lines.append(f"            problems.append(({name!r}, 'reference'))")
+    if strict:
+        # Update paths like "counts.sessions" belong to their top-level field
+        lines.append("    for key in data:")
+        lines.append("        if key not in DECLARED and key.partition('.')[0] not in DECLARED:")
+        lines.append("            problems.append((key, 'unknown'))")
+    lines.append("    return problems")
+    return "\n".join(lines) + "\n"
+
+
+def compile_validator(spec: CollectionSpec, strict: bool = False) -> Callable[[Dict[str, Any]], List[Violation]]:
+    """A function returning the violations of one document of ``spec``"""
+    namespace: Dict[str, Any] = {
+        "MISSING": object(),
+        "TRANSFORMS": _transform_types(),
+        "DECLARED": frozenset(spec.fields),
+        "datetime": datetime,
+        "is_document_id": _is_document_id,
+    }
+    for number, field in enumerate(spec.fields.values()):
+        if field.enum:
+            namespace[f"ENUM_{number}"] = frozenset(field.enum)
+    source = _source(spec, strict)
+    exec(compile(source, f"<validator {spec.name}>", "exec"), namespace)
+    validate = namespace["validate"]
+    validate.source = source
+    return validate
+
+
+class DocumentValidator:
+    def __init__(self, registry: SchemaRegistry = None, strict: bool = False):
+        """Compiled validators for every collection and subcollection of the registry"""
+        self.strict = strict
+        self.specs: Dict[str, CollectionSpec] = {}
+        for spec in registry or load_registry():
+            self._add(spec)
+        self._compiled: Dict[str, Callable[[Dict[str, Any]], List[Violation]]] = {}
+
+    def _add(self, spec: CollectionSpec):
+        self.specs.setdefault(spec.name, spec)
+        for sub in spec.subcollections.values():
+            self._add(sub)
+
+    def validator(self, collection: str) -> Optional[Callable[[Dict[str, Any]], List[Violation]]]:
+        """The compiled validator of ``collection``, or None for collections outside the registry"""
+        validate = self._compiled.get(collection)
+        if validate is None and collection in self.specs:
+            validate = self._compiled[collection] = compile_validator(self.specs[collection], self.strict)
+        return validate
+
+    def validate(self, collection: str, data: Dict[str, Any]) -> List[Violation]:
+        validate = self.validator(collection)
+        return validate(data) if validate is not None else []
+
+    def __call__(self, doc_ref, data: Dict[str, Any]):
+        """Raise ValidationError if ``data`` may not be written to ``doc_ref``"""
+        if doc_ref.id == "_schema":
+            return
+        violations = self.validate(doc_ref.parent.id, data)
+        if violations:
+            raise ValidationError(doc_ref.path, violations)
+
+
+class CollectionAudit:
+    def __init__(
+        self,
+        db,
+        validator: DocumentValidator,
+        workers: int = 8,
+        partitions: int = 8,
+        page_size: int = 1000,
+        samples: int = 5,
+    ):
+        """Stream collections through their compiled validators"""
+        self.db = db
+        self.validator = validator
+        self.workers = workers
+        self.partitions = partitions
+        self.page_size = page_size
+        self.samples = samples
+        self._lock = threading.Lock()
+
+    def _audit_partition(self, collection: str, query, report: Dict[str, Any]):
+        validate = self.validator.validator(collection)
+        if not self.validator.strict:
+            # Only declared fields can be violated, so read nothing else
+            query = query.select(list(self.validator.specs[collection].fields))
+        documents = invalid = 0
+        counts: Dict[Violation, int] = {}
+        samples: Dict[Violation, List[str]] = {}
+        for page in paginate(query, self.page_size):
+            for snapshot in page:
+                if snapshot.id == "_schema":
+                    continue
+                documents += 1
+                problems = validate(snapshot.to_dict() or {})
+                if not problems:
+                    continue
+                invalid += 1
+                for problem in problems:
+                    counts[problem] = counts.get(problem, 0) + 1
+                    ids = samples.setdefault(problem, [])
+                    if len(ids) < self.samples:
+                        ids.append(snapshot.reference.path)
+
+        with self._lock:
+            report["documents"] += documents
+            report["invalid"] += invalid
+            for (field, problem), count in counts.items():
+                entry = report["violations"].setdefault(f"{field}:{problem}", {"count": 0, "samples": []})
+                entry["count"] += count
+                entry["samples"].extend(samples[(field, problem)][: self.samples - len(entry["samples"])])
+
+    def run(self, collections: List[str]) -> Dict[str, Any]:
+        """Per collection document, invalid document and per field violation counts"""
+        started = time.monotonic()
+        reports = {collection: {"documents": 0, "invalid": 0, "violations": {}} for collection in collections}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            plans = {
+                collection: pool.submit(partition_queries, self.db, collection, self.partitions)
+                for collection in collections
+            }
+            futures = [
+                pool.submit(self._audit_partition, collection, query, reports[collection])
+                for collection, plan in plans.items()
+                for query in plan.result()
+            ]
+            for future in futures:
+                future.result()
+
+        for report in reports.values():
+            report["violations"] = dict(sorted(report["violations"].items(), key=lambda item: -item[1]["count"]))
+        return {"seconds": time.monotonic() - started, "collections": reports}
+
+
+def main():
+    """Audit Zygo collections against the schema registry"""
+    import argparse
+    import json
+    import os
+    import sys
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Audit Zygo documents against the schema registry")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--collection", help="Only audit these collections", action="append", default=None)
+    parser.add_argument("--strict", help="Also report fields the registry does not declare", action="store_true")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--partitions", help="Document-ID ranges per collection", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--samples", help="Offending document paths kept per violation", type=int, default=5)
+    parser.add_argument("--output", help="Write the report JSON here", default=None)
+    parser.add_argument("--show-source", help="Print the compiled validator of each collection", action="store_true")
+
+    args = parser.parse_args()
+
+    registry = load_registry(args.schema)
+    validator = DocumentValidator(registry, strict=args.strict)
+    collections = args.collection or registry.names
+    unknown = [collection for collection in collections if collection not in validator.specs]
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(unknown)}")
+
+    if args.show_source:
+        for collection in collections:
+            print(validator.validator(collection).source)
+        return
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    print(f"🔍 Auditing {len(collections)} collections...")
+    audit = CollectionAudit(
+        firestore.client(),
+        validator,
+        workers=args.workers,
+        partitions=args.partitions,
+        page_size=args.page_size,
+        samples=args.samples,
+    )
+    result = audit.run(collections)
+
+    total = 0
+    for collection, report in result["collections"].items():
+        marker = "⚠️" if report["invalid"] else "✅"
+        print(f"{marker} {collection}: {report['invalid']:,} of {report['documents']:,} documents invalid")
+        for key, entry in report["violations"].items():
+            total += entry["count"]
+            print(f"   {key}: {entry['count']:,}  e.g. {', '.join(entry['samples'])}")
+    print(f"⏱️ Audit finished in {result['seconds']:.1f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    if total:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Firestore emulator helpers for Zygo tooling
+Shared by the emulator-only suites (query benchmarks, security rules tests).
+"""
+
+import math
+import urllib.request
+from typing import List
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def clear_emulator(host: str, project_id: str):
+    """Delete every document in the emulator's default database"""
+    url = f"http://{host}/emulator/v1/projects/{project_id}/databases/(default)/documents"
+    urllib.request.urlopen(urllib.request.Request(url, method="DELETE")).read()
@@ -0,0 +1,73 @@
+"""
+JSON codec for Firestore documents in Zygo exports
+Turns Firestore-specific values (timestamps, geo points, document references, bytes) into
+JSON-safe tagged objects and back, so an export can be restored without losing types.
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+TYPE_KEY = "__type__"
+
+
+def encode_value(value: Any) -> Any:
+    """A Firestore field value as JSON-safe data"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime):
+        # DatetimeWithNanoseconds keeps sub-microsecond precision in rfc3339()
+        if hasattr(value, "rfc3339"):
+            return {TYPE_KEY: "timestamp", "value": value.rfc3339()}
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return {TYPE_KEY: "timestamp", "value": value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, bytes):
+        return {TYPE_KEY: "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {TYPE_KEY: "geopoint", "latitude": value.latitude, "longitude": value.longitude}
+    if hasattr(value, "path") and hasattr(value, "parent"):
+        return {TYPE_KEY: "reference", "path": value.path}
+    raise TypeError(f"Cannot encode Firestore value of type {type(value).__name__}")
+
+
+def decode_value(value: Any, db=None) -> Any:
+    """Inverse of encode_value; ``db`` is needed to rebuild document references"""
+    if isinstance(value, list):
+        return [decode_value(item, db) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get(TYPE_KEY)
+    if kind is None:
+        return {key: decode_value(item, db) for key, item in value.items()}
+    if kind == "timestamp":
+        from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+        return DatetimeWithNanoseconds.from_rfc3339(value["value"])
+    if kind == "bytes":
+        return base64.b64decode(value["value"])
+    if kind == "geopoint":
+        from google.cloud.firestore import GeoPoint
+
+        return GeoPoint(value["latitude"], value["longitude"])
+    if kind == "reference":
+        if db is None:
+            raise ValueError("Decoding a document reference needs a Firestore client")
+        return db.document(value["path"])
+    raise ValueError(f"Unknown encoded type '{kind}'")
+
+
+def encode_document(path: str, data: Dict[str, Any]) -> str:
+    """One export line: the document path and its encoded fields"""
+    return json.dumps({"path": path, "data": encode_value(data)}, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_document(line: str, db=None) -> Dict[str, Any]:
+    """(``path``, ``data``) of an export line, with Firestore types restored"""
+    record = json.loads(line)
+    return {"path": record["path"], "data": decode_value(record["data"], db)}
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Streaming Export for Zygo Platform
+Backs up every collection in the schema registry (and its subcollections, as collection
+groups) to compressed newline-delimited JSON or Parquet shards plus a manifest.json.
+
+Each collection is split into document-ID ranges with get_partitions, and every range is read
+in pages with start_after cursors on a thread pool, so memory is bounded by
+workers x page size no matter how large a collection is, and throughput scales with workers.
+Documents are encoded with firestore_codec so restores keep timestamps, references and geo points.
+
+Layout of an export directory:
+    manifest.json
+    {collection}/part-{partition:05d}-{shard:04d}.ndjson.gz   (or .parquet)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from firestore_codec import encode_document, encode_value
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaRegistry, load_registry
+
+FORMATS = ("ndjson", "parquet")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be written"""
+
+
+def collection_names(registry: SchemaRegistry, only: Optional[List[str]] = None) -> List[str]:
+    """Top-level collections and subcollection groups in registry order"""
+    names: List[str] = []
+
+    def add(spec: CollectionSpec):
+        if spec.name not in names:
+            names.append(spec.name)
+        for sub in spec.subcollections.values():
+            add(sub)
+
+    for spec in registry:
+        if only is None or spec.name in only:
+            add(spec)
+    return names
+
+
+def check_format(fmt: str):
+    """Fail early on an unknown format, or Parquet without pyarrow"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}' (choose from {', '.join(FORMATS)})")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet exports need pyarrow: pip install pyarrow") from None
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partition_queries(db, collection: str, partitions: int) -> List[Any]:
+    """Document-ID range queries that together cover the ``collection`` group"""
+    group = db.collection_group(collection)
+    if partitions > 1:
+        try:
+            return [partition.query() for partition in group.get_partitions(partitions)]
+        except (google_exceptions.InvalidArgument, google_exceptions.MethodNotImplemented):
+            # The emulator does not implement PartitionQuery
+            pass
+    return [group.order_by(FieldPath.document_id())]
+
+
+def paginate(query, page_size: int) -> Iterator[List[Any]]:
+    """Pages of ``query`` read with start_after cursors, so only one page is held at a time"""
+    cursor = None
+    while True:
+        page_query = query.start_after(cursor) if cursor is not None else query
+        page = list(page_query.limit(page_size).stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+class ShardWriter:
+    def __init__(self, directory: str, prefix: str, fmt: str = "ndjson", shard_documents: int = 250_000):
+        """Write encoded documents to rotating shard files ``{prefix}-{n:04d}``"""
+        check_format(fmt)
+        self.directory = directory
+        self.prefix = prefix
+        self.format = fmt
+        self.shard_documents = shard_documents
+        self.shards: List[Dict[str, Any]] = []
+        self._file = None
+        self._path: Optional[str] = None
+        self._count = 0
+
+    def _open(self):
+        extension = "ndjson.gz" if self.format == "ndjson" else "parquet"
+        self._path = os.path.join(self.directory, f"{self.prefix}-{len(self.shards):04d}.{extension}")
+        self._count = 0
+        if self.format == "ndjson":
+            self._file = gzip.open(self._path, "wt", encoding="utf-8", compresslevel=6)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([("path", pa.string()), ("data", pa.string())])
+            self._file = pq.ParquetWriter(self._path, schema, compression="zstd")
+
+    def write_page(self, documents: List[Tuple[str, Dict[str, Any]]]):
+        """Append one page of (path, data) documents"""
+        start = 0
+        while start < len(documents):
+            if self._file is None:
+                self._open()
+            chunk = documents[start:start + self.shard_documents - self._count]
+            if self.format == "ndjson":
+                self._file.write("".join(encode_document(path, data) + "\n" for path, data in chunk))
+            else:
+                import pyarrow as pa
+
+                # Documents have no common schema, so Parquet keeps the encoded fields as JSON per row
+                self._file.write_table(
+                    pa.table(
+                        {
+                            "path": [path for path, _ in chunk],
+                            "data": [json.dumps(encode_value(data), separators=(",", ":")) for _, data in chunk],
+                        }
+                    )
+                )
+            self._count += len(chunk)
+            start += len(chunk)
+            if self._count >= self.shard_documents:
+                self._close_shard()
+
+    def _close_shard(self):
+        self._file.close()
+        self.shards.append(
+            {
+                "file": os.path.relpath(self._path, os.path.dirname(self.directory)),
+                "documents": self._count,
+                "bytes": os.path.getsize(self._path),
+                "sha256": file_digest(self._path),
+            }
+        )
+        self._file = None
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self._file is not None:
+            self._close_shard()
+        return self.shards
+
+
+class CollectionExporter:
+    def __init__(
+        self,
+        db,
+        output_dir: str,
+        fmt: str = "ndjson",
+        workers: int = 8,
+        partitions: int = 8,
+        page_size: int = 1000,
+        shard_documents: int = 250_000,
+    ):
+        """Export collection groups to ``output_dir`` with ``workers`` threads"""
+        check_format(fmt)
+        self.db = db
+        self.output_dir = output_dir
+        self.format = fmt
+        self.workers = workers
+        self.partitions = partitions
+        self.page_size = page_size
+        self.shard_documents = shard_documents
+        self.exported = 0
+        self._lock = threading.Lock()
+
+    def _export_partition(self, collection: str, number: int, query) -> Dict[str, Any]:
+        directory = os.path.join(self.output_dir, collection)
+        writer = ShardWriter(directory, f"part-{number:05d}", self.format, self.shard_documents)
+        documents = 0
+        try:
+            for page in paginate(query, self.page_size):
+                writer.write_page([(snapshot.reference.path, snapshot.to_dict()) for snapshot in page])
+                documents += len(page)
+                with self._lock:
+                    self.exported += len(page)
+        finally:
+            shards = writer.close()
+        return {"collection": collection, "documents": documents, "shards": shards}
+
+    def run(self, collections: List[str], progress_every: float = 30.0) -> Dict[str, Any]:
+        """Export ``collections`` and write the manifest; returns the manifest"""
+        started = datetime.now(timezone.utc)
+        clock = time.monotonic()
+        for collection in collections:
+            os.makedirs(os.path.join(self.output_dir, collection), exist_ok=True)
+
+        results: Dict[str, Dict[str, Any]] = {
+            collection: {"documents": 0, "partitions": 0, "shards": []} for collection in collections
+        }
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Partitioning is itself a request per collection, so it runs on the pool too
+            planned = {
+                pool.submit(partition_queries, self.db, collection, self.partitions): collection
+                for collection in collections
+            }
+            running = set()
+            last_report = clock
+            while planned or running:
+                done, _ = wait(set(planned) | running, timeout=progress_every, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in planned:
+                        collection = planned.pop(future)
+                        queries = future.result()
+                        results[collection]["partitions"] = len(queries)
+                        for number, query in enumerate(queries):
+                            running.add(pool.submit(self._export_partition, collection, number, query))
+                    else:
+                        running.discard(future)
+                        partition = future.result()
+                        summary = results[partition["collection"]]
+                        summary["documents"] += partition["documents"]
+                        summary["shards"].extend(partition["shards"])
+                if time.monotonic() - last_report >= progress_every:
+                    last_report = time.monotonic()
+                    rate = self.exported / (last_report - clock)
+                    print(f"   ⏳ {self.exported:,} documents exported ({rate:,.0f} docs/s)")
+
+        for summary in results.values():
+            summary["shards"].sort(key=lambda shard: shard["file"])
+        elapsed = time.monotonic() - clock
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "project_id": getattr(self.db, "project", None),
+            "format": self.format,
+            "started_at": started.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "seconds": round(elapsed, 2),
+            "documents": sum(summary["documents"] for summary in results.values()),
+            "collections": results,
+        }
+        # Written last and atomically, so a directory with a manifest is a complete export
+        path = os.path.join(self.output_dir, MANIFEST_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+        os.replace(path + ".tmp", path)
+        return manifest
+
+
+def main():
+    """Export Zygo collections to NDJSON or Parquet shards"""
+    import argparse
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Export Zygo Firestore collections")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--output", help="Export directory (default: exports/<UTC timestamp>)", default=None)
+    parser.add_argument("--collection", help="Only export these collections", action="append", default=None)
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--partitions", help="Document-ID ranges per collection", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--shard-documents", help="Documents per shard file", type=int, default=250_000)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    output = args.output or os.path.join("exports", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    if os.path.exists(os.path.join(output, MANIFEST_NAME)):
+        parser.error(f"{output} already contains an export")
+
+    collections = collection_names(load_registry(args.schema), args.collection)
+    print(f"📦 Exporting {len(collections)} collections to {output}...")
+    exporter = CollectionExporter(
+        firestore.client(),
+        output,
+        fmt=args.format,
+        workers=args.workers,
+        partitions=args.partitions,
+        page_size=args.page_size,
+        shard_documents=args.shard_documents,
+    )
+    manifest = exporter.run(collections)
+    for collection, summary in manifest["collections"].items():
+        print(f"   {collection}: {summary['documents']:,} documents in {len(summary['shards'])} shards")
+    print(f"✅ Exported {manifest['documents']:,} documents in {manifest['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
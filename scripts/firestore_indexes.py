@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Firestore Index Generator for Zygo Platform
+Builds firestore.indexes.json from the indexes_needed declared in the schema registry and
+reconciles it against the indexes that actually exist in a Firebase project.
+
+Index entries in the registry are comma separated field lists, each field optionally
+followed by ASC, DESC or ARRAY_CONTAINS (default ASC), e.g. "author_id, created_at DESC".
+An entry can also be an object {"fields": "...", "query_scope": "COLLECTION_GROUP"} for
+collection-group queries.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from schema_registry import DEFAULT_SCHEMA_PATH, SchemaError, SchemaRegistry, load_registry
+
+DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "firestore.indexes.json")
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+CONTAINS = "CONTAINS"
+
+COLLECTION = "COLLECTION"
+COLLECTION_GROUP = "COLLECTION_GROUP"
+
+_MODES = {"ASC": ASCENDING, "DESC": DESCENDING, "ARRAY_CONTAINS": CONTAINS, "CONTAINS": CONTAINS}
+_SHORT_MODES = {ASCENDING: "", DESCENDING: " DESC", CONTAINS: " ARRAY_CONTAINS"}
+
+
+class IndexSpec:
+    __slots__ = ("collection_group", "fields", "query_scope")
+
+    def __init__(self, collection_group: str, fields: Tuple[Tuple[str, str], ...], query_scope: str = COLLECTION):
+        """An index over ``fields``, a tuple of (field path, mode) pairs"""
+        self.collection_group = collection_group
+        self.fields = tuple(fields)
+        self.query_scope = query_scope
+
+    def __eq__(self, other):
+        return isinstance(other, IndexSpec) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"IndexSpec({self.collection_group!r}, {str(self)!r})"
+
+    def __str__(self):
+        text = ", ".join(f"{path}{_SHORT_MODES[mode]}" for path, mode in self.fields)
+        if self.query_scope == COLLECTION_GROUP:
+            text += " (collection group)"
+        return text
+
+    @property
+    def key(self) -> Tuple:
+        return (self.collection_group, self.query_scope, self.fields)
+
+    @property
+    def is_composite(self) -> bool:
+        """Single-field indexes are created automatically by Firestore"""
+        return len(self.fields) > 1
+
+    def to_json(self) -> Dict[str, Any]:
+        """Entry for the ``indexes`` list of firestore.indexes.json"""
+        fields = []
+        for path, mode in self.fields:
+            if mode == CONTAINS:
+                fields.append({"fieldPath": path, "arrayConfig": CONTAINS})
+            else:
+                fields.append({"fieldPath": path, "order": mode})
+        return {"collectionGroup": self.collection_group, "queryScope": self.query_scope, "fields": fields}
+
+
+def parse_index(collection: str, entry: Union[str, Dict[str, Any]]) -> IndexSpec:
+    """Parse an indexes_needed entry into an IndexSpec"""
+    query_scope = COLLECTION
+    if isinstance(entry, dict):
+        query_scope = entry.get("query_scope", COLLECTION)
+        entry = entry["fields"]
+    if query_scope not in (COLLECTION, COLLECTION_GROUP):
+        raise SchemaError(f"{collection}: unknown query scope '{query_scope}'")
+
+    fields = []
+    for part in entry.split(","):
+        tokens = part.split()
+        if not tokens or len(tokens) > 2:
+            raise SchemaError(f"{collection}: cannot parse index field '{part.strip()}' in '{entry}'")
+        mode = ASCENDING
+        if len(tokens) == 2:
+            if tokens[1].upper() not in _MODES:
+                raise SchemaError(f"{collection}: unknown index mode '{tokens[1]}' in '{entry}'")
+            mode = _MODES[tokens[1].upper()]
+        fields.append((tokens[0], mode))
+
+    if sum(1 for _, mode in fields if mode == CONTAINS) > 1:
+        raise SchemaError(f"{collection}: an index can hold at most one ARRAY_CONTAINS field: '{entry}'")
+
+    return IndexSpec(collection, tuple(fields), query_scope)
+
+
+def declared_indexes(registry: SchemaRegistry) -> List[IndexSpec]:
+    """Every index declared in the registry, in declaration order and without duplicates"""
+    indexes = []
+    for collection in registry:
+        for entry in collection.indexes_needed:
+            index = parse_index(collection.name, entry)
+            if index not in indexes:
+                indexes.append(index)
+    return indexes
+
+
+def required_indexes(registry: SchemaRegistry) -> List[IndexSpec]:
+    """Declared indexes that have to be created, i.e. the composite ones"""
+    return [index for index in declared_indexes(registry) if index.is_composite]
+
+
+def build_indexes_file(registry: SchemaRegistry) -> Dict[str, Any]:
+    """Contents of firestore.indexes.json"""
+    return {"indexes": [index.to_json() for index in required_indexes(registry)], "fieldOverrides": []}
+
+
+def render_indexes_file(registry: SchemaRegistry) -> str:
+    return json.dumps(build_indexes_file(registry), indent=2) + "\n"
+
+
+class IndexReconciler:
+    def __init__(self, project_id: str, database: str = "(default)"):
+        """Connect to the Firestore Admin API for ``project_id``"""
+        # Imported here so that generating the indexes file works without the admin client installed
+        from google.cloud import firestore_admin_v1
+
+        self.admin = firestore_admin_v1
+        self.client = firestore_admin_v1.FirestoreAdminClient()
+        self.database_path = f"projects/{project_id}/databases/{database}"
+
+    def existing_indexes(self) -> Dict[IndexSpec, Any]:
+        """Composite indexes currently defined in the project, keyed by spec"""
+        existing = {}
+        for index in self.client.list_indexes(parent=f"{self.database_path}/collectionGroups/-"):
+            # .../collectionGroups/{collection}/indexes/{index_id}
+            collection_group = index.name.split("/")[-3]
+            fields = []
+            for field in index.fields:
+                # Firestore appends __name__ to every composite index, it is not part of the declaration
+                if field.field_path == "__name__":
+                    continue
+                if field.array_config:
+                    fields.append((field.field_path, CONTAINS))
+                else:
+                    fields.append((field.field_path, field.order.name))
+            scope = index.query_scope.name
+            existing[IndexSpec(collection_group, tuple(fields), scope)] = index
+        return existing
+
+    def create_index(self, index: IndexSpec):
+        """Start creating ``index``, returning the long-running operation"""
+        Index = self.admin.Index
+        fields = []
+        for path, mode in index.fields:
+            if mode == CONTAINS:
+                fields.append(Index.IndexField(field_path=path, array_config=Index.IndexField.ArrayConfig.CONTAINS))
+            else:
+                fields.append(Index.IndexField(field_path=path, order=Index.IndexField.Order[mode]))
+
+        return self.client.create_index(
+            parent=f"{self.database_path}/collectionGroups/{index.collection_group}",
+            index=Index(query_scope=Index.QueryScope[index.query_scope], fields=fields),
+        )
+
+    def reconcile(self, declared: List[IndexSpec], dry_run: bool = False) -> Dict[str, List]:
+        """Create missing indexes and report redundant ones - nothing is ever deleted"""
+        existing = self.existing_indexes()
+        report = {"missing": [], "present": [], "redundant": [], "not_ready": []}
+
+        for index in declared:
+            if index in existing:
+                report["present"].append(index)
+                state = existing[index].state.name
+                if state != "READY":
+                    report["not_ready"].append((index, state))
+                continue
+
+            report["missing"].append(index)
+            if not dry_run:
+                self.create_index(index)
+
+        report["redundant"] = [index for index in existing if index not in declared]
+        return report
+
+
+def print_reconcile_report(report: Dict[str, List], dry_run: bool):
+    print(f"✅ {len(report['present'])} declared indexes already exist")
+    for index, state in report["not_ready"]:
+        print(f"   ⏳ {index.collection_group}: {index} ({state})")
+
+    verb = "would be created" if dry_run else "creation started"
+    print(f"➕ {len(report['missing'])} missing indexes {verb}")
+    for index in report["missing"]:
+        print(f"   {index.collection_group}: {index}")
+
+    print(f"⚠️ {len(report['redundant'])} indexes exist but are not declared (cost write amplification)")
+    for index in report["redundant"]:
+        print(f"   {index.collection_group}: {index}")
+
+
+def main():
+    """Generate firestore.indexes.json and optionally reconcile it with a project"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate and deploy Zygo Firestore indexes")
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--output", help="Where to write firestore.indexes.json", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--check", help="Fail if the indexes file is out of date instead of writing it", action="store_true")
+    parser.add_argument("--reconcile", help="Create missing indexes in the Firebase project", action="store_true")
+    parser.add_argument("--project-id", help="Firebase project ID (for --reconcile)", default=None)
+    parser.add_argument("--dry-run", help="With --reconcile, only report what would change", action="store_true")
+
+    args = parser.parse_args()
+    registry = load_registry(args.schema)
+    rendered = render_indexes_file(registry)
+
+    if args.check:
+        current: Optional[str] = None
+        if os.path.exists(args.output):
+            with open(args.output, encoding="utf-8") as f:
+                current = f.read()
+        if current != rendered:
+            print(f"❌ {args.output} is out of date, run scripts/firestore_indexes.py")
+            sys.exit(1)
+        print(f"✅ {args.output} is up to date")
+    elif args.dry_run:
+        print(f"🔍 Dry run: {args.output} left unchanged")
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered)
+        print(f"📋 Wrote {len(required_indexes(registry))} composite indexes to {args.output}")
+
+    if args.reconcile:
+        project_id = args.project_id or os.environ.get("GOOGLE_CLOUD_PROJECT")
+        if not project_id:
+            parser.error("--reconcile needs --project-id or GOOGLE_CLOUD_PROJECT")
+        reconciler = IndexReconciler(project_id)
+        report = reconciler.reconcile(required_indexes(registry), dry_run=args.dry_run)
+        print_reconcile_report(report, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+"""
+Firestore Instrumentation for Zygo tooling
+Wraps a Firestore client so every operation made through it is counted per collection and
+operation: calls, errors, latency histogram, billed document reads/writes/deletes, payload
+bytes and retries. Documents written more often than ``hot_threshold`` times within one
+second are reported as hot (Firestore sustains about one write per second per document).
+
+    metrics = FirestoreMetrics()
+    db = InstrumentedClient(firestore.client(), metrics)
+    ...                                   # use db exactly like the wrapped client
+    print(metrics.to_prometheus())        # or json.dumps(metrics.to_json())
+
+Collection, query, document, batch and BulkWriter objects handed out by the client are
+wrapped too; anything not instrumented is passed through to the wrapped object. Payload
+sizes follow Firestore's storage size rules, so they match what counts against the 1 MiB
+document limit rather than wire bytes.
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, Prometheus style; the +Inf bucket is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_LABELS = (*map(str, LATENCY_BUCKETS), "+Inf")
+
+READ_OPERATIONS = frozenset({"get", "query", "get_all", "aggregate"})
+WRITE_OPERATIONS = frozenset({"set", "update", "create"})
+DELETE_OPERATIONS = frozenset({"delete"})
+
+# Collection label of operations that span collections
+BATCH = "(batch)"
+BULK = "(bulk)"
+
+
+def document_size(value: Any) -> int:
+    """Storage size of a field value (or a whole document's data) per Firestore's size rules"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(key).encode("utf-8")) + 1 + document_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(document_size(item) for item in value)
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return 16
+    if hasattr(value, "path"):
+        return len(value.path.encode("utf-8")) + 1
+    # Write transforms (Increment, SERVER_TIMESTAMP, ...) are resolved server-side
+    return 8
+
+
+def _snapshot_size(snapshot) -> int:
+    if not snapshot.exists:
+        return 0
+    # to_dict() deep-copies the document, the raw field map is enough to measure it
+    data = getattr(snapshot, "_data", None)
+    return document_size(data if data is not None else snapshot.to_dict())
+
+
+class OperationStats:
+    __slots__ = ("calls", "errors", "documents", "bytes", "retries", "buckets", "seconds", "timed")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.documents = 0
+        self.bytes = 0
+        self.retries = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.timed = 0
+
+    def observe(self, seconds: float):
+        for number, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            number = len(LATENCY_BUCKETS)
+        self.buckets[number] += 1
+        self.seconds += seconds
+        self.timed += 1
+
+    def quantile(self, q: float) -> Optional[str]:
+        """Label of the bucket bound below which ``q`` of the timed calls fall"""
+        if not self.timed:
+            return None
+        seen = 0
+        for label, count in zip(BUCKET_LABELS, self.buckets):
+            seen += count
+            if seen >= q * self.timed:
+                return label
+        return BUCKET_LABELS[-1]
+
+
+class FirestoreMetrics:
+    def __init__(self, hot_threshold: int = 1, hot_limit: int = 20):
+        """Thread-safe operation statistics shared by every wrapper of one client"""
+        self.hot_threshold = hot_threshold
+        self.hot_limit = hot_limit
+        self.started = time.monotonic()
+        self.stats: Dict[Tuple[str, str], OperationStats] = {}
+        # Peak writes within one second, per document path above the threshold
+        self.hot: Dict[str, int] = {}
+        self._second = -1
+        self._window: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, collection: str, operation: str) -> OperationStats:
+        key = (collection, operation)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = OperationStats()
+        return stats
+
+    def record(
+        self,
+        collection: str,
+        operation: str,
+        seconds: Optional[float] = None,
+        documents: int = 0,
+        size: int = 0,
+        error: bool = False,
+        calls: int = 1,
+    ):
+        """Count ``calls`` operations; ``seconds`` is observed in the latency histogram when given"""
+        with self._lock:
+            stats = self._stats(collection, operation)
+            stats.calls += calls
+            stats.documents += documents
+            stats.bytes += size
+            if error:
+                stats.errors += 1
+            if seconds is not None:
+                stats.observe(seconds)
+
+    def retry(self, collection: str, operation: str):
+        """Count a retried operation, e.g. a batch commit that hit a transient error"""
+        with self._lock:
+            self._stats(collection, operation).retries += 1
+
+    def written(self, path: str):
+        """Track a write of ``path`` for hot-document detection"""
+        second = int(time.monotonic())
+        with self._lock:
+            if second != self._second:
+                # Only the current second is kept, so memory is bounded by writes per second
+                self._second = second
+                self._window = {}
+            count = self._window[path] = self._window.get(path, 0) + 1
+            if count > self.hot_threshold and count > self.hot.get(path, 0):
+                self.hot[path] = count
+
+    def totals(self) -> Dict[str, int]:
+        """Billed units and bytes over every collection"""
+        totals = {"reads": 0, "writes": 0, "deletes": 0, "bytes_read": 0, "bytes_written": 0, "errors": 0, "retries": 0}
+        with self._lock:
+            for (_, operation), stats in self.stats.items():
+                totals["errors"] += stats.errors
+                totals["retries"] += stats.retries
+                if operation in READ_OPERATIONS:
+                    totals["reads"] += stats.documents
+                    totals["bytes_read"] += stats.bytes
+                elif operation in WRITE_OPERATIONS:
+                    totals["writes"] += stats.documents
+                    totals["bytes_written"] += stats.bytes
+                elif operation in DELETE_OPERATIONS:
+                    totals["deletes"] += stats.documents
+        return totals
+
+    def hot_documents(self) -> List[Tuple[str, int]]:
+        """(path, peak writes per second) of the hottest documents"""
+        with self._lock:
+            return sorted(self.hot.items(), key=lambda item: -item[1])[: self.hot_limit]
+
+    def to_json(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        operations: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (collection, operation), stats in sorted(self.stats.items()):
+                operations.setdefault(collection, {})[operation] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "documents": stats.documents,
+                    "bytes": stats.bytes,
+                    "retries": stats.retries,
+                    "seconds": round(stats.seconds, 6),
+                    "p50": stats.quantile(0.5),
+                    "p99": stats.quantile(0.99),
+                    "buckets": dict(zip(BUCKET_LABELS, stats.buckets)),
+                }
+        totals = self.totals()
+        totals["documents_per_second"] = round((totals["reads"] + totals["writes"] + totals["deletes"]) / elapsed, 1)
+        return {
+            "seconds": round(elapsed, 3),
+            "totals": totals,
+            "collections": operations,
+            "hot_documents": [{"path": path, "peak_writes_per_second": peak} for path, peak in self.hot_documents()],
+        }
+
+    def to_prometheus(self, prefix: str = "zygo_firestore") -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            stats = sorted(self.stats.items())
+        labelled = [(_labels(collection=key[0], operation=key[1]), entry) for key, entry in stats]
+
+        for name, attribute, help_text in (
+            ("operations_total", "calls", "Operations sent to Firestore"),
+            ("errors_total", "errors", "Operations that raised"),
+            ("retries_total", "retries", "Operations retried after a transient error"),
+            ("documents_total", "documents", "Documents read, written or deleted (billed units)"),
+            ("payload_bytes_total", "bytes", "Document bytes read or written"),
+        ):
+            family(name, "counter", help_text)
+            for labels, entry in labelled:
+                lines.append(f"{prefix}_{name}{{{labels}}} {getattr(entry, attribute)}")
+
+        family("operation_seconds", "histogram", "Operation latency")
+        for labels, entry in labelled:
+            if not entry.timed:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKET_LABELS, entry.buckets):
+                cumulative += count
+                lines.append(f'{prefix}_operation_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{prefix}_operation_seconds_sum{{{labels}}} {entry.seconds:.6f}")
+            lines.append(f"{prefix}_operation_seconds_count{{{labels}}} {entry.timed}")
+
+        family("hot_document_writes_per_second", "gauge", "Peak writes within one second of hot documents")
+        for path, peak in self.hot_documents():
+            lines.append(f"{prefix}_hot_document_writes_per_second{{{_labels(path=path)}}} {peak}")
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self):
+        """Billed units, throughput and hot documents, in the scripts' log style"""
+        report = self.to_json()
+        totals = report["totals"]
+        print(
+            f"📊 Firestore: {totals['reads']:,} reads, {totals['writes']:,} writes, {totals['deletes']:,} deletes "
+            f"({totals['bytes_read'] / 1e6:,.1f} MB read, {totals['bytes_written'] / 1e6:,.1f} MB written, "
+            f"{totals['documents_per_second']:,.0f} docs/s, {totals['retries']} retries, {totals['errors']} errors)"
+        )
+        for entry in report["hot_documents"]:
+            print(f"   🔥 {entry['path']}: {entry['peak_writes_per_second']} writes in one second")
+
+    def write(self, path: str):
+        """Write the report as JSON, or as Prometheus text for a .prom/.txt path"""
+        import json
+
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+                f.write("\n")
+
+
+def _labels(**labels: str) -> str:
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+def _unwrap(value: Any) -> Any:
+    return value._target if isinstance(value, _Wrapper) else value
+
+
+class _Wrapper:
+    __slots__ = ("_target", "_metrics", "_collection")
+
+    def __init__(self, target, metrics: FirestoreMetrics, collection: str):
+        self._target = target
+        self._metrics = metrics
+        self._collection = collection
+
+    def __getattr__(self, name: str):
+        return getattr(self._target, name)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._target!r})"
+
+    def _timed(self, operation: str, call, documents: int = 1, size: int = 0):
+        started = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            self._metrics.record(self._collection, operation, time.perf_counter() - started, error=True)
+            raise
+        self._metrics.record(self._collection, operation, time.perf_counter() - started, documents, size)
+        return result
+
+
+class InstrumentedQuery(_Wrapper):
+    __slots__ = ()
+
+    def _chain(self, name: str, *args, **kwargs) -> "InstrumentedQuery":
+        return InstrumentedQuery(getattr(self._target, name)(*args, **kwargs), self._metrics, self._collection)
+
+    def where(self, *args, **kwargs):
+        return self._chain("where", *args, **kwargs)
+
+    def select(self, *args, **kwargs):
+        return self._chain("select", *args, **kwargs)
+
+    def order_by(self, *args, **kwargs):
+        return self._chain("order_by", *args, **kwargs)
+
+    def limit(self, *args, **kwargs):
+        return self._chain("limit", *args, **kwargs)
+
+    def limit_to_last(self, *args, **kwargs):
+        return self._chain("limit_to_last", *args, **kwargs)
+
+    def offset(self, *args, **kwargs):
+        return self._chain("offset", *args, **kwargs)
+
+    def start_at(self, *args, **kwargs):
+        return self._chain("start_at", *args, **kwargs)
+
+    def start_after(self, *args, **kwargs):
+        return self._chain("start_after", *args, **kwargs)
+
+    def end_at(self, *args, **kwargs):
+        return self._chain("end_at", *args, **kwargs)
+
+    def end_before(self, *args, **kwargs):
+        return self._chain("end_before", *args, **kwargs)
+
+    def stream(self, *args, **kwargs) -> Iterator[Any]:
+        """Stream results; latency is the time spent waiting on Firestore, not on the consumer"""
+        seconds = 0.0
+        documents = size = 0
+        error = False
+        started = time.perf_counter()
+        try:
+            iterator = iter(self._target.stream(*args, **kwargs))
+            seconds += time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                try:
+                    snapshot = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - started
+                    break
+                seconds += time.perf_counter() - started
+                documents += 1
+                size += _snapshot_size(snapshot)
+                yield snapshot
+        except Exception:
+            error = True
+            raise
+        finally:
+            # A query that matches nothing is still billed one read
+            self._metrics.record(self._collection, "query", seconds, max(documents, 1), size, error)
+
+    def get(self, *args, **kwargs) -> List[Any]:
+        return list(self.stream(*args, **kwargs))
+
+    def count(self, *args, **kwargs) -> "InstrumentedAggregation":
+        return InstrumentedAggregation(self._target.count(*args, **kwargs), self._metrics, self._collection)
+
+    def get_partitions(self, *args, **kwargs) -> Iterator["InstrumentedPartition"]:
+        for partition in self._target.get_partitions(*args, **kwargs):
+            yield InstrumentedPartition(partition, self._metrics, self._collection)
+
+
+class InstrumentedPartition(_Wrapper):
+    __slots__ = ()
+
+    def query(self) -> InstrumentedQuery:
+        return InstrumentedQuery(self._target.query(), self._metrics, self._collection)
+
+
+class InstrumentedAggregation(_Wrapper):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self._target.get(*args, **kwargs)
+        except Exception:
+            self._metrics.record(self._collection, "aggregate", time.perf_counter() - started, error=True)
+            raise
+        # Aggregations are billed one read per 1000 index entries matched, at least one
+        matched = max((int(aggregation.value) for row in result for aggregation in row), default=0)
+        self._metrics.record(self._collection, "aggregate", time.perf_counter() - started, max(1, -(-matched // 1000)))
+        return result
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    __slots__ = ()
+
+    def document(self, *args, **kwargs) -> "InstrumentedDocument":
+        return InstrumentedDocument(self._target.document(*args, **kwargs), self._metrics, self._collection)
+
+    def add(self, document_data: Dict[str, Any], *args, **kwargs):
+        return self._timed(
+            "create", lambda: self._target.add(document_data, *args, **kwargs), size=document_size(document_data)
+        )
+
+
+class InstrumentedDocument(_Wrapper):
+    __slots__ = ()
+
+    def collection(self, name: str) -> InstrumentedCollection:
+        return InstrumentedCollection(self._target.collection(name), self._metrics, name)
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            snapshot = self._target.get(*args, **kwargs)
+        except Exception:
+            self._metrics.record(self._collection, "get", time.perf_counter() - started, error=True)
+            raise
+        self._metrics.record(self._collection, "get", time.perf_counter() - started, 1, _snapshot_size(snapshot))
+        return snapshot
+
+    def _write(self, operation: str, data: Optional[Dict[str, Any]], call):
+        result = self._timed(operation, call, size=document_size(data) if data is not None else 0)
+        self._metrics.written(self._target.path)
+        return result
+
+    def set(self, document_data: Dict[str, Any], *args, **kwargs):
+        return self._write("set", document_data, lambda: self._target.set(document_data, *args, **kwargs))
+
+    def create(self, document_data: Dict[str, Any], *args, **kwargs):
+        return self._write("create", document_data, lambda: self._target.create(document_data, *args, **kwargs))
+
+    def update(self, field_updates: Dict[str, Any], *args, **kwargs):
+        return self._write("update", field_updates, lambda: self._target.update(field_updates, *args, **kwargs))
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", None, lambda: self._target.delete(*args, **kwargs))
+
+
+class InstrumentedBatch(_Wrapper):
+    __slots__ = ("_writes",)
+
+    def __init__(self, target, metrics: FirestoreMetrics):
+        super().__init__(target, metrics, BATCH)
+        self._writes: List[Tuple[str, str, int]] = []
+
+    def _queue(self, operation: str, reference, data: Optional[Dict[str, Any]]):
+        reference = _unwrap(reference)
+        self._writes.append((operation, reference.path, document_size(data) if data is not None else 0))
+        return reference
+
+    def set(self, reference, document_data: Dict[str, Any], *args, **kwargs):
+        return self._target.set(self._queue("set", reference, document_data), document_data, *args, **kwargs)
+
+    def create(self, reference, document_data: Dict[str, Any]):
+        return self._target.create(self._queue("create", reference, document_data), document_data)
+
+    def update(self, reference, field_updates: Dict[str, Any], *args, **kwargs):
+        return self._target.update(self._queue("update", reference, field_updates), field_updates, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._target.delete(self._queue("delete", reference, None), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        """Commit, then count every write of the batch against its own collection"""
+        result = self._timed("commit", lambda: self._target.commit(*args, **kwargs), documents=len(self._writes))
+        record_writes(self._metrics, self._writes)
+        self._writes = []
+        return result
+
+
+class InstrumentedBulkWriter(_Wrapper):
+    __slots__ = ()
+
+    def __init__(self, target, metrics: FirestoreMetrics):
+        super().__init__(target, metrics, BULK)
+
+    def _enqueue(self, operation: str, reference, data: Optional[Dict[str, Any]]):
+        # BulkWriter commits in the background, so writes are counted when enqueued and only
+        # flush()/close(), where callers actually wait, are timed
+        reference = _unwrap(reference)
+        record_writes(self._metrics, [(operation, reference.path, document_size(data) if data is not None else 0)])
+        return reference
+
+    def set(self, reference, document_data: Dict[str, Any], *args, **kwargs):
+        return self._target.set(self._enqueue("set", reference, document_data), document_data, *args, **kwargs)
+
+    def create(self, reference, document_data: Dict[str, Any], *args, **kwargs):
+        return self._target.create(self._enqueue("create", reference, document_data), document_data, *args, **kwargs)
+
+    def update(self, reference, field_updates: Dict[str, Any], *args, **kwargs):
+        return self._target.update(self._enqueue("update", reference, field_updates), field_updates, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._target.delete(self._enqueue("delete", reference, None), *args, **kwargs)
+
+    def on_write_error(self, handler):
+        """Register ``handler``, counting the retries it asks for and the writes it gives up on"""
+
+        def counted(error, bulk_writer) -> bool:
+            retry = handler(error, bulk_writer)
+            collection = error.operation.reference.parent.id
+            if retry:
+                self._metrics.retry(collection, "bulk_write")
+            else:
+                self._metrics.record(collection, "bulk_write", error=True, calls=0)
+            return retry
+
+        return self._target.on_write_error(counted)
+
+    def flush(self):
+        return self._timed("flush", self._target.flush, documents=0)
+
+    def close(self):
+        return self._timed("close", self._target.close, documents=0)
+
+
+def record_writes(metrics: FirestoreMetrics, writes: List[Tuple[str, str, int]]):
+    """Count committed (operation, document path, payload size) writes per collection"""
+    for operation, path, size in writes:
+        metrics.record(path.rsplit("/", 2)[-2], operation, documents=1, size=size)
+        metrics.written(path)
+
+
+class InstrumentedClient(_Wrapper):
+    __slots__ = ()
+
+    def __init__(self, client, metrics: FirestoreMetrics = None):
+        """Wrap ``client``; the metrics are available as ``.metrics``"""
+        super().__init__(client, metrics or FirestoreMetrics(), "")
+
+    @property
+    def metrics(self) -> FirestoreMetrics:
+        return self._metrics
+
+    def collection(self, *path: str) -> InstrumentedCollection:
+        return InstrumentedCollection(self._target.collection(*path), self._metrics, path[-1].rsplit("/", 1)[-1])
+
+    def collection_group(self, collection_id: str) -> InstrumentedQuery:
+        return InstrumentedQuery(self._target.collection_group(collection_id), self._metrics, collection_id)
+
+    def document(self, *path: str) -> InstrumentedDocument:
+        reference = self._target.document(*path)
+        return InstrumentedDocument(reference, self._metrics, reference.parent.id)
+
+    def batch(self) -> InstrumentedBatch:
+        return InstrumentedBatch(self._target.batch(), self._metrics)
+
+    def bulk_writer(self, *args, **kwargs) -> InstrumentedBulkWriter:
+        return InstrumentedBulkWriter(self._target.bulk_writer(*args, **kwargs), self._metrics)
+
+    def get_all(self, references, *args, **kwargs) -> Iterator[Any]:
+        """Batched document reads, billed one read per requested document"""
+        references = [_unwrap(reference) for reference in references]
+        collections = {reference.parent.id for reference in references}
+        collection = collections.pop() if len(collections) == 1 else BATCH
+        seconds = 0.0
+        size = 0
+        error = False
+        started = time.perf_counter()
+        try:
+            for snapshot in self._target.get_all(references, *args, **kwargs):
+                seconds += time.perf_counter() - started
+                size += _snapshot_size(snapshot)
+                yield snapshot
+                started = time.perf_counter()
+            seconds += time.perf_counter() - started
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._metrics.record(collection, "get_all", seconds, len(references), size, error)
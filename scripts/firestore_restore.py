@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Parallel Restore for Zygo Platform
+Loads an export written by firestore_export.py into a Firestore project or the emulator.
+
+Shards are restored by a process pool, one shard per task and one BulkWriter per process,
+so decoding and gzip/Parquet parsing never compete for a single GIL. Each shard is streamed
+and the writer is flushed every ``flush_every`` documents, which keeps memory per process
+bounded and lets BulkWriter's own rate limiter (500 ops/s ramping up 50% every 5 minutes,
+the 500/50/5 rule) apply backpressure in production.
+
+Finished shards are appended to a checkpoint file next to the manifest, so a rerun skips
+them; a shard interrupted midway is restored again from its start (set() is idempotent).
+"""
+
+import gzip
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from firestore_codec import decode_document, decode_value
+from firestore_export import MANIFEST_NAME, ExportError, check_format, file_digest
+
+CHECKPOINT_NAME = "restore-checkpoint.ndjson"
+
+# The Firestore client of this worker process, created by _init_worker
+_db = None
+
+
+def _init_worker(service_account: Optional[str], project_id: Optional[str]):
+    """Give every pool process its own client - clients cannot be shared across processes"""
+    global _db
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        from google.cloud import firestore
+
+        _db = firestore.Client(project=project_id or "zygo-restore")
+        return
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = project_id
+    cred = credentials.Certificate(service_account) if service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    _db = firestore.client()
+
+
+def read_shard(path: str, fmt: str, db=None) -> Iterator[Dict[str, Any]]:
+    """Decoded {"path", "data"} records of one shard, streamed"""
+    if fmt == "ndjson":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield decode_document(line, db)
+        return
+
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=1000, columns=["path", "data"]):
+        for path_value, data in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+            yield {"path": path_value, "data": decode_value(json.loads(data), db)}
+
+
+def restore_shard(
+    path: str,
+    fmt: str,
+    sha256: Optional[str] = None,
+    merge: bool = False,
+    flush_every: int = 5000,
+    initial_ops: int = 500,
+    max_ops: int = 10_000,
+    max_attempts: int = 5,
+) -> Dict[str, Any]:
+    """Write one shard through a BulkWriter in this worker process"""
+    from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+    if sha256 and file_digest(path) != sha256:
+        raise ExportError(f"{path}: checksum does not match the manifest")
+
+    failed: List[Tuple[str, str]] = []
+
+    def on_error(error, bulk_writer) -> bool:
+        if error.attempts < max_attempts:
+            return True
+        failed.append((error.operation.reference.path, str(error.message)))
+        return False
+
+    started = time.monotonic()
+    writer = _db.bulk_writer(options=BulkWriterOptions(initial_ops_per_second=initial_ops, max_ops_per_second=max_ops))
+    writer.on_write_error(on_error)
+    documents = 0
+    for record in read_shard(path, fmt, _db):
+        writer.set(_db.document(record["path"]), record["data"], merge=merge)
+        documents += 1
+        if documents % flush_every == 0:
+            # Waiting here is the backpressure: reading stops until Firestore caught up
+            writer.flush()
+    writer.close()
+    return {
+        "documents": documents - len(failed),
+        "failed": failed,
+        "bytes": os.path.getsize(path),
+        "seconds": time.monotonic() - started,
+    }
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Finished shards by file name"""
+    done: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    done[entry["file"]] = entry
+    return done
+
+
+class ExportRestorer:
+    def __init__(
+        self,
+        export_dir: str,
+        service_account: Optional[str] = None,
+        project_id: Optional[str] = None,
+        workers: int = 4,
+        merge: bool = False,
+        flush_every: int = 5000,
+        initial_ops: int = 500,
+        max_ops: int = 10_000,
+        checkpoint_path: Optional[str] = None,
+    ):
+        """Restore the export in ``export_dir`` with ``workers`` processes"""
+        with open(os.path.join(export_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.format = self.manifest["format"]
+        check_format(self.format)
+        self.export_dir = export_dir
+        self.service_account = service_account
+        self.project_id = project_id
+        self.workers = workers
+        self.merge = merge
+        self.flush_every = flush_every
+        self.initial_ops = initial_ops
+        self.max_ops = max_ops
+        self.checkpoint_path = checkpoint_path or os.path.join(export_dir, CHECKPOINT_NAME)
+
+    def shards(self, collections: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Manifest shards to restore, largest first so the pool drains evenly"""
+        shards = [
+            dict(shard, collection=collection)
+            for collection, summary in self.manifest["collections"].items()
+            if collections is None or collection in collections
+            for shard in summary["shards"]
+        ]
+        return sorted(shards, key=lambda shard: shard["bytes"], reverse=True)
+
+    def run(self, collections: Optional[List[str]] = None, progress_every: float = 30.0) -> Dict[str, Any]:
+        """Restore every shard not in the checkpoint; returns totals and throughput"""
+        done = load_checkpoint(self.checkpoint_path)
+        pending = [shard for shard in self.shards(collections) if shard["file"] not in done]
+        result: Dict[str, Any] = {
+            "shards": len(pending),
+            "skipped": len(self.shards(collections)) - len(pending),
+            "documents": 0,
+            "bytes": 0,
+            "failed": [],
+        }
+        started = time.monotonic()
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.service_account, self.project_id)
+        ) as pool, open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            # Only ``workers`` shards are in flight; the rest wait here instead of in the pool queue
+            queue = list(pending)
+            running: Dict[Any, Dict[str, Any]] = {}
+            last_report = started
+            while queue or running:
+                while queue and len(running) < self.workers:
+                    shard = queue.pop(0)
+                    future = pool.submit(
+                        restore_shard,
+                        os.path.join(self.export_dir, shard["file"]),
+                        self.format,
+                        shard.get("sha256"),
+                        self.merge,
+                        self.flush_every,
+                        self.initial_ops,
+                        self.max_ops,
+                    )
+                    running[future] = shard
+                finished, _ = wait(running, timeout=progress_every, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    shard = running.pop(future)
+                    stats = future.result()
+                    result["documents"] += stats["documents"]
+                    result["bytes"] += stats["bytes"]
+                    result["failed"].extend(stats["failed"])
+                    if not stats["failed"]:
+                        entry = {
+                            "file": shard["file"],
+                            "documents": stats["documents"],
+                            "seconds": round(stats["seconds"], 2),
+                            "finished_at": datetime.now(timezone.utc).isoformat(),
+                        }
+                        checkpoint.write(json.dumps(entry) + "\n")
+                        checkpoint.flush()
+                if time.monotonic() - last_report >= progress_every:
+                    last_report = time.monotonic()
+                    elapsed = last_report - started
+                    print(
+                        f"   ⏳ {result['documents']:,} documents restored "
+                        f"({result['documents'] / elapsed:,.0f} docs/s, {result['bytes'] / elapsed / 1e6:,.1f} MB/s)"
+                    )
+
+        elapsed = time.monotonic() - started
+        result["seconds"] = elapsed
+        result["docs_per_second"] = result["documents"] / elapsed if elapsed else 0.0
+        result["bytes_per_second"] = result["bytes"] / elapsed if elapsed else 0.0
+        return result
+
+
+def main():
+    """Restore a Zygo export into Firestore or the emulator"""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Restore a Zygo Firestore export")
+    parser.add_argument("export_dir", help="Directory containing manifest.json")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--collection", help="Only restore these collections", action="append", default=None)
+    parser.add_argument("--workers", help="Restore processes", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--merge", help="Merge into existing documents instead of replacing them", action="store_true")
+    parser.add_argument("--flush-every", help="Documents buffered per process before waiting", type=int, default=5000)
+    parser.add_argument("--initial-ops", help="BulkWriter starting ops/s per process", type=int, default=500)
+    parser.add_argument("--max-ops", help="BulkWriter ops/s ceiling per process", type=int, default=10_000)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: next to the manifest)", default=None)
+    parser.add_argument("--restart", help="Ignore the checkpoint and restore every shard", action="store_true")
+
+    args = parser.parse_args()
+
+    restorer = ExportRestorer(
+        args.export_dir,
+        service_account=args.service_account,
+        project_id=args.project_id,
+        workers=args.workers,
+        merge=args.merge,
+        flush_every=args.flush_every,
+        initial_ops=args.initial_ops,
+        max_ops=args.max_ops,
+        checkpoint_path=args.checkpoint,
+    )
+    if args.restart and os.path.exists(restorer.checkpoint_path):
+        os.remove(restorer.checkpoint_path)
+
+    target = os.environ.get("FIRESTORE_EMULATOR_HOST") or args.project_id or "default project"
+    print(f"📥 Restoring {restorer.manifest['documents']:,} exported documents into {target}...")
+    result = restorer.run(args.collection)
+    print(
+        f"✅ Restored {result['documents']:,} documents from {result['shards']} shards "
+        f"({result['skipped']} already done) in {result['seconds']:.1f}s: "
+        f"{result['docs_per_second']:,.0f} docs/s, {result['bytes_per_second'] / 1e6:,.1f} MB/s"
+    )
+    for doc_path, error in result["failed"][:20]:
+        print(f"   ❌ {doc_path}: {error}")
+    if result["failed"]:
+        print(f"   {len(result['failed']):,} documents failed; their shards will be retried on the next run")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
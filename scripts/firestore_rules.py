@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Firestore Security Rules Generator for Zygo Platform
+Renders firestore.rules from the access policies declared on each collection in the schema
+registry, and statically counts document-access calls (get/exists/getAfter/existsAfter) per
+rule so rules that would hit Firestore's 10/20 access limit, or add a read to every
+request, are caught before deployment.
+
+An access policy maps operations (read, create, update, delete, or write for all three) to
+one policy or a list of policies that are OR-ed:
+    public            anyone, signed in or not
+    authenticated     any signed-in user
+    owner             the actor in owner_field ("$id" = document ID, "$parent" = parent ID)
+    profile           a member of the pedagogy profile in profile_field (default pedagogy_profile_id)
+    family_member     a member of the family of family_field (default family_member_id)
+    verified_provider an actor whose verification_status is verified
+    anything else     a raw rules expression; {data} is resource.data, or request.resource.data on create
+Operations without a policy are denied. Collections without an access policy get no match
+block, so clients cannot read them at all (the Admin SDK bypasses rules).
+
+Updates check scoped policies on the stored document, and every scope field of the new
+version must be unchanged or pass its own check, so a write cannot move a document into
+another actor's, profile's or family's scope.
+"""
+
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaError, SchemaRegistry, load_registry
+
+DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "firestore.rules")
+
+OPERATIONS = ("read", "create", "update", "delete")
+WRITE_OPERATIONS = ("create", "update", "delete")
+# Policies scoped by a field of the document: (access key naming the field, default field, rules helper)
+SCOPED_POLICIES = {
+    "owner": ("owner_field", None, "isOwner"),
+    "profile": ("profile_field", "pedagogy_profile_id", "inProfile"),
+    "family_member": ("family_field", "family_member_id", "isFamilyMember"),
+}
+POLICY_KEYS = frozenset(OPERATIONS + ("write",) + tuple(key for key, _, _ in SCOPED_POLICIES.values()))
+
+# Document access calls allowed per request: single document reads/writes and queries, and
+# batched writes/transactions
+SINGLE_DOCUMENT_LIMIT = 10
+MULTI_DOCUMENT_LIMIT = 20
+
+HELPERS = """    function isAuthenticated() {
+      return request.auth != null;
+    }
+
+    function isOwner(actorId) {
+      return isAuthenticated() && request.auth.uid == actorId;
+    }
+
+    // Actor data comes from Auth custom claims (custom_claims.py), not get() reads
+    function claims() {
+      return request.auth.token.get('zygo', {});
+    }
+
+    function getActorType() {
+      return claims().get('type', null);
+    }
+
+    function isProviderVerified() {
+      return isAuthenticated() && claims().get('verified', false) == true;
+    }
+
+    function inProfile(profileId) {
+      return isAuthenticated() && profileId in claims().get('profiles', []);
+    }
+
+    function isFamilyMember(memberId) {
+      return isAuthenticated() && memberId in claims().get('members', []);
+    }
+"""
+
+_DOCUMENT_ACCESS = re.compile(r"(?<![\w.])(get|exists|getAfter|existsAfter)\(\s*/")
+_FUNCTION = re.compile(r"^\s*function (\w+)\(([^)]*)\)\s*\{")
+_CALL = re.compile(r"(?<![\w.])(\w+)\(")
+_MATCH = re.compile(r"^\s*match (\S+)\s*\{")
+_ALLOW = re.compile(r"^\s*allow ([\w, ]+):\s*if (.*)$")
+
+
+def path_variable(name: str) -> str:
+    """Path variable for a collection, e.g. feed_items -> feedItemId"""
+    words = name.split("_")
+    if words[-1].endswith("s") and not words[-1].endswith("ss"):
+        words[-1] = words[-1][:-1]
+    return words[0] + "".join(word.title() for word in words[1:]) + "Id"
+
+
+def scope_field(spec: CollectionSpec, policy: str) -> str:
+    """Field (or "$id"/"$parent") a scoped policy checks"""
+    key, default, _ = SCOPED_POLICIES[policy]
+    field = spec.access.get(key, default)
+    if field is None:
+        raise SchemaError(f"{spec.name}: access policy needs '{key}'")
+    if not field.startswith("$") and field not in spec.fields:
+        raise SchemaError(f"{spec.name}: access field '{field}' is not a declared field")
+    return field
+
+
+def _scope_value(spec: CollectionSpec, policy: str, data: str, variables: Tuple[str, ...]) -> str:
+    field = scope_field(spec, policy)
+    if field == "$id":
+        return variables[-1]
+    if field == "$parent":
+        if len(variables) < 2:
+            raise SchemaError(f"{spec.name}: '$parent' used on a top-level collection")
+        return variables[-2]
+    return f"{data}.{field}"
+
+
+def operation_policies(spec: CollectionSpec, operation: str) -> Optional[List[str]]:
+    """Policies that allow ``operation``, or None when it is denied"""
+    policies = spec.access.get(operation)
+    if policies is None and operation in WRITE_OPERATIONS:
+        policies = spec.access.get("write")
+    if isinstance(policies, str):
+        policies = [policies]
+    return policies
+
+
+def policy_condition(spec: CollectionSpec, operation: str, variables: Tuple[str, ...]) -> Optional[str]:
+    """The rules condition for ``operation``, or None when it is denied"""
+    policies = operation_policies(spec, operation)
+    if policies is None:
+        return None
+
+    data = "request.resource.data" if operation == "create" else "resource.data"
+    terms = []
+    # Checks on the scope fields of the document as it would be after an update
+    kept = []
+    for policy in policies:
+        if policy == "public":
+            return "true"
+        if policy == "authenticated":
+            terms.append("isAuthenticated()")
+        elif policy in SCOPED_POLICIES:
+            helper = SCOPED_POLICIES[policy][2]
+            value = _scope_value(spec, policy, data, variables)
+            terms.append(f"{helper}({value})")
+            if operation == "update" and value.startswith(data):
+                new_value = _scope_value(spec, policy, "request.resource.data", variables)
+                kept.append((f"{helper}({new_value})", f"{new_value} == {value}"))
+        elif policy == "verified_provider":
+            terms.append("isProviderVerified()")
+        elif re.fullmatch(r"[a-z_]+", policy):
+            raise SchemaError(f"{spec.name}: unknown access policy '{policy}'")
+        else:
+            # Raw expressions can only be evaluated for signed-in users
+            terms.append(f"(isAuthenticated() && {policy.replace('{data}', data)})")
+
+    if not kept:
+        return " || ".join(terms)
+    if len(terms) == 1:
+        # The stored document is in scope, so an unchanged field passes the same check
+        return f"{terms[0]} && {kept[0][0]}"
+    guards = [f"({unchanged} || {check})" for check, unchanged in kept]
+    return " && ".join([f"({' || '.join(terms)})"] + guards)
+
+
+def _render_collection(spec: CollectionSpec, variables: Tuple[str, ...], indent: str) -> List[str]:
+    unknown = set(spec.access) - POLICY_KEYS
+    if unknown:
+        raise SchemaError(f"{spec.name}: unknown access keys {sorted(unknown)}")
+    variable = path_variable(spec.name)
+    variables = variables + (variable,)
+    lines = [f"{indent}match /{spec.name}/{{{variable}}} {{"]
+
+    # Operations with the same condition share one allow statement
+    grouped: Dict[str, List[str]] = {}
+    if spec.access:
+        for operation in OPERATIONS:
+            condition = policy_condition(spec, operation, variables)
+            if condition is not None:
+                grouped.setdefault(condition, []).append(operation)
+    for condition, operations in grouped.items():
+        lines.append(f"{indent}  allow {', '.join(operations)}: if {condition};")
+
+    for sub in spec.subcollections.values():
+        if sub.access:
+            lines.append("")
+            lines.extend(_render_collection(sub, variables, indent + "  "))
+    lines.append(f"{indent}}}")
+    return lines
+
+
+def render_rules(registry: SchemaRegistry) -> str:
+    """firestore.rules for every collection with an access policy"""
+    lines = [
+        "// Generated by scripts/firestore_rules.py from scripts/schema/zygo_collections.json - do not edit",
+        "rules_version = '2';",
+        "service cloud.firestore {",
+        "  match /databases/{database}/documents {",
+        HELPERS.rstrip("\n"),
+    ]
+    for group, names in registry.groups.items():
+        specs = [registry.collection(name) for name in names]
+        specs = [spec for spec in specs if spec.access or any(sub.access for sub in spec.subcollections.values())]
+        if not specs:
+            continue
+        lines.append("")
+        lines.append(f"    // {group}")
+        for spec in specs:
+            lines.extend(_render_collection(spec, (), "    "))
+    lines.extend(["  }", "}", ""])
+    return "\n".join(lines)
+
+
+def count_document_calls(rules: str) -> Dict[str, Dict[str, int]]:
+    """Document access calls per match path and operation, following helper functions
+
+    Every call site is counted, so the result is an upper bound of what one request costs.
+    """
+    function_bodies: Dict[str, List[str]] = {}
+    current_function = None
+    function_depth = 0
+    depth = 0
+    path: List[Tuple[str, int]] = []
+    allows: List[Tuple[str, List[str], List[str]]] = []
+    continued = False
+
+    for line in rules.splitlines():
+        stripped = line.split("//", 1)[0]
+        if continued:
+            # Conditions can span lines up to the closing semicolon
+            allows[-1][2].append(stripped)
+            continued = not stripped.rstrip().endswith(";")
+            continue
+        function = _FUNCTION.match(stripped)
+        if function:
+            current_function = function.group(1)
+            function_depth = depth
+            function_bodies[current_function] = [stripped[function.end():]]
+        elif current_function is not None:
+            function_bodies[current_function].append(stripped)
+
+        match = _MATCH.match(stripped)
+        if match:
+            path.append((match.group(1), depth))
+        allow = _ALLOW.match(stripped)
+        if allow and current_function is None:
+            full_path = "".join(segment for segment, _ in path if not segment.startswith("/databases/"))
+            allows.append((full_path, [operation.strip() for operation in allow.group(1).split(",")], [allow.group(2)]))
+            continued = not allow.group(2).rstrip().endswith(";")
+
+        depth += stripped.count("{") - stripped.count("}")
+        if current_function is not None and depth <= function_depth:
+            current_function = None
+        while path and depth <= path[-1][1]:
+            path.pop()
+
+    cache: Dict[str, int] = {}
+
+    def function_cost(name: str, seen: Tuple[str, ...] = ()) -> int:
+        if name in cache:
+            return cache[name]
+        if name in seen:
+            return 0
+        cost = expression_cost("\n".join(function_bodies[name]), seen + (name,))
+        cache[name] = cost
+        return cost
+
+    def expression_cost(expression: str, seen: Tuple[str, ...] = ()) -> int:
+        cost = len(_DOCUMENT_ACCESS.findall(expression))
+        for call in _CALL.findall(expression):
+            if call in function_bodies:
+                cost += function_cost(call, seen)
+        return cost
+
+    counts: Dict[str, Dict[str, int]] = {}
+    for full_path, operations, condition in allows:
+        for operation in operations:
+            counts.setdefault(full_path, {})[operation] = expression_cost("\n".join(condition))
+    return counts
+
+
+def check_document_calls(counts: Dict[str, Dict[str, int]]) -> Tuple[List[str], List[str]]:
+    """(errors, warnings) for rules over the multi- or single-document access limit"""
+    errors, warnings = [], []
+    for path, operations in counts.items():
+        for operation, calls in operations.items():
+            message = f"{path} {operation}: {calls} document access calls"
+            if calls > MULTI_DOCUMENT_LIMIT:
+                errors.append(f"{message} (limit {MULTI_DOCUMENT_LIMIT})")
+            elif calls > SINGLE_DOCUMENT_LIMIT:
+                warnings.append(f"{message} (single-document requests allow {SINGLE_DOCUMENT_LIMIT})")
+            elif calls:
+                warnings.append(f"{message} (each is a billed read and adds latency)")
+    return errors, warnings
+
+
+def main():
+    """Generate firestore.rules and report document access calls"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate Zygo Firestore security rules")
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--output", help="Where to write firestore.rules", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--check", help="Fail if firestore.rules is out of date", action="store_true")
+    parser.add_argument("--strict", help="Treat document access warnings as errors", action="store_true")
+
+    args = parser.parse_args()
+    rendered = render_rules(load_registry(args.schema))
+
+    if args.check:
+        current: Optional[str] = None
+        if os.path.exists(args.output):
+            with open(args.output, encoding="utf-8") as f:
+                current = f.read()
+        if current != rendered:
+            print(f"❌ {args.output} is out of date, run scripts/firestore_rules.py")
+            sys.exit(1)
+        print(f"✅ {args.output} is up to date")
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(rendered)
+        print(f"🔒 Wrote security rules to {args.output}")
+
+    counts = count_document_calls(rendered)
+    errors, warnings = check_document_calls(counts)
+    print(f"🔎 {sum(len(operations) for operations in counts.values())} rules checked for get()/exists() calls")
+    for warning in warnings:
+        print(f"   ⚠️ {warning}")
+    for error in errors:
+        print(f"   ❌ {error}")
+    if errors or (args.strict and warnings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
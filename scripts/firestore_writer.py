@@ -0,0 +1,185 @@
+"""
+Buffered Firestore writer for Zygo tooling
+Collects document writes and flushes them through Firestore WriteBatch commits.
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from google.api_core import exceptions as google_exceptions
+
+from firestore_metrics import BATCH
+
+# Firestore rejects WriteBatch commits with more than 500 writes
+MAX_BATCH_SIZE = 500
+
+# Firestore "in" filters accept at most 30 values
+MAX_IN_VALUES = 30
+
+# Errors worth retrying - a WriteBatch commit is atomic, so a failed chunk can be resent as a whole
+RETRYABLE_ERRORS = (
+    google_exceptions.Aborted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+)
+
+# Top-level fields that change on every run and must not count as a content change
+VOLATILE_FIELDS = frozenset({"created_at", "updated_at", "created_date", "modified_date"})
+
+
+class BatchWriteError(Exception):
+    """Raised when a chunk still fails after all retries"""
+
+    def __init__(self, message: str, committed: int, pending: int):
+        super().__init__(message)
+        self.committed = committed
+        self.pending = pending
+
+
+class BatchedWriter:
+    def __init__(
+        self,
+        db,
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        validator: Callable[[Any, Dict[str, Any]], None] = None,
+    ):
+        """Buffer writes against ``db`` and commit them in chunks of ``batch_size``
+
+        ``validator(doc_ref, data)`` is called before a set/update is queued and may raise,
+        e.g. a document_validators.DocumentValidator.
+        """
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}, got {batch_size}")
+
+        self.db = db
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.validator = validator
+        self._pending: List[Tuple[str, Any, Dict[str, Any], bool]] = []
+        self.committed_writes = 0
+        self.commits = 0
+        self.retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def set(self, doc_ref, data: Dict[str, Any], merge: bool = False):
+        """Queue a set() of ``data`` on ``doc_ref``"""
+        self._queue("set", doc_ref, data, merge)
+
+    def update(self, doc_ref, data: Dict[str, Any]):
+        """Queue an update() of ``data`` on ``doc_ref``"""
+        self._queue("update", doc_ref, data, False)
+
+    def delete(self, doc_ref):
+        """Queue a delete() of ``doc_ref``"""
+        self._queue("delete", doc_ref, None, False)
+
+    def _queue(self, op: str, doc_ref, data, merge: bool):
+        if self.validator is not None and data is not None:
+            self.validator(doc_ref, data)
+        self._pending.append((op, doc_ref, data, merge))
+        if len(self._pending) >= self.batch_size:
+            self._commit_chunk(self._pending[: self.batch_size])
+            del self._pending[: self.batch_size]
+
+    def flush(self) -> int:
+        """Commit everything still buffered, returning the number of writes committed"""
+        committed_before = self.committed_writes
+        while self._pending:
+            chunk = self._pending[: self.batch_size]
+            self._commit_chunk(chunk)
+            del self._pending[: len(chunk)]
+        return self.committed_writes - committed_before
+
+    def _commit_chunk(self, chunk: List[Tuple[str, Any, Dict[str, Any], bool]]):
+        """Commit a single chunk, retrying transient failures with exponential backoff"""
+        attempt = 0
+        while True:
+            batch = self.db.batch()
+            for op, doc_ref, data, merge in chunk:
+                if op == "set":
+                    batch.set(doc_ref, data, merge=merge)
+                elif op == "update":
+                    batch.update(doc_ref, data)
+                else:
+                    batch.delete(doc_ref)
+
+            try:
+                batch.commit()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise BatchWriteError(
+                        f"Batch of {len(chunk)} writes failed after {attempt + 1} attempts: {e}",
+                        committed=self.committed_writes,
+                        pending=len(self._pending),
+                    ) from e
+                attempt += 1
+                self.retries += 1
+                # Instrumented clients (firestore_metrics.InstrumentedClient) count retries too
+                metrics = getattr(self.db, "metrics", None)
+                if metrics is not None:
+                    metrics.retry(BATCH, "commit")
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+                continue
+
+            self.committed_writes += len(chunk)
+            self.commits += 1
+            return
+
+
+def content_hash(data: Dict[str, Any], ignore: Iterable[str] = VOLATILE_FIELDS) -> str:
+    """Stable SHA-256 of a document's content, ignoring volatile top-level fields"""
+    ignore = set(ignore)
+    stable = {key: value for key, value in data.items() if key not in ignore}
+    payload = json.dumps(stable, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def sync_documents(
+    db,
+    writer: BatchedWriter,
+    docs: List[Tuple[Any, Dict[str, Any]]],
+    merge: bool = False,
+    create_defaults: Dict[str, Any] = None,
+) -> Dict[str, int]:
+    """Queue only the documents whose content differs from what is stored
+
+    Existing documents are fetched with a single get_all() call, so a run where nothing
+    changed costs one read per document and no writes. ``create_defaults`` are added only
+    to documents that do not exist yet, e.g. a created_date that updates must not reset.
+    """
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    if not docs:
+        return counts
+
+    existing = {snapshot.reference.path: snapshot for snapshot in db.get_all([ref for ref, _ in docs])}
+
+    for doc_ref, data in docs:
+        snapshot = existing.get(doc_ref.path)
+        if snapshot is None or not snapshot.exists:
+            counts["created"] += 1
+            if create_defaults:
+                data = {**create_defaults, **data}
+        elif content_hash(snapshot.to_dict() or {}) == content_hash(data):
+            counts["unchanged"] += 1
+            continue
+        else:
+            counts["updated"] += 1
+        writer.set(doc_ref, data, merge=merge)
+
+    return counts
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+"""
+Synthetic Load Data Generator for Zygo Platform
+Streams large, reproducible datasets for performance testing: actors, feed items with
+comments and likes, families with milestone progress and tool sessions.
+
+Authors, likes and comments follow Zipf distributions so a handful of actors and posts get
+most of the traffic, which is what reproduces hot-author and hot-feed contention. All
+cross-references point at generated documents, and the same seed always yields the same
+documents in the same order.
+"""
+
+import itertools
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from thread_paths import thread_position
+from rate_limiter import RateLimiter
+from schema_registry import DEFAULT_SCHEMA_PATH, SchemaRegistry, load_registry
+
+Document = Tuple[str, str, Dict[str, Any]]
+
+DEFAULT_START_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+WORDS = (
+    "baby sleep feeding milestone smile crawl first steps toddler nap routine growth play "
+    "story family weekend park bath teething solids latch night cluster support tip help"
+).split()
+
+
+class ZipfSampler:
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        """Sample ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** exponent"""
+        if n <= 0:
+            raise ValueError("ZipfSampler needs at least one item")
+        self.rng = rng
+        self.cumulative = array("d", itertools.accumulate(1.0 / (k ** exponent) for k in range(1, n + 1)))
+        self.total = self.cumulative[-1]
+
+    def weight(self, rank: int) -> float:
+        """Probability of ``rank``"""
+        previous = self.cumulative[rank - 1] if rank else 0.0
+        return (self.cumulative[rank] - previous) / self.total
+
+    def sample(self) -> int:
+        return bisect_left(self.cumulative, self.rng.random() * self.total)
+
+
+class GeneratorConfig:
+    def __init__(
+        self,
+        seed: int = 42,
+        prefix: str = "load",
+        actors: int = 10_000,
+        feed_items: int = 50_000,
+        likes: int = 500_000,
+        comments: int = 100_000,
+        families: int = 2_000,
+        credential_providers: int = 20,
+        credential_definitions: int = 100,
+        milestones: int = 200,
+        progress_per_member: int = 20,
+        sessions_per_member: int = 100,
+        zipf_exponent: float = 1.1,
+        start_date: datetime = DEFAULT_START_DATE,
+        days: int = 365,
+    ):
+        """Sizes and distribution parameters for a generated dataset"""
+        self.seed = seed
+        self.prefix = prefix
+        self.actors = actors
+        self.feed_items = feed_items
+        self.likes = likes
+        self.comments = comments
+        self.families = families
+        self.credential_providers = credential_providers
+        self.credential_definitions = credential_definitions
+        self.milestones = milestones
+        self.progress_per_member = progress_per_member
+        self.sessions_per_member = sessions_per_member
+        self.zipf_exponent = zipf_exponent
+        self.start_date = start_date
+        self.days = days
+
+
+class LoadDataGenerator:
+    def __init__(self, config: GeneratorConfig, registry: SchemaRegistry = None):
+        """Create a generator; enum values are taken from the schema registry"""
+        self.config = config
+        self.registry = registry or load_registry()
+        self.rng = random.Random(config.seed)
+
+        # Actor types are needed again when likes and comments record the user type
+        self.actor_types = bytearray()
+        self.actor_type_names: Tuple[str, ...] = self._enum("actors", "type")
+
+    def _enum(self, collection: str, field: str) -> Tuple[str, ...]:
+        return self.registry.collection(collection).fields[field].enum
+
+    def _id(self, kind: str, number: int) -> str:
+        return f"{self.config.prefix}_{kind}_{number:08d}"
+
+    def _timestamp(self, after: datetime = None) -> datetime:
+        if after is None:
+            return self.config.start_date + timedelta(seconds=self.rng.randrange(self.config.days * 86400))
+        return after + timedelta(seconds=int(self.rng.expovariate(1 / 3600)))
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def _counts(self, total: int, items: int) -> Iterator[int]:
+        """Split ``total`` over ``items`` following the Zipf weights, item 0 being the hottest"""
+        sampler = ZipfSampler(items, self.config.zipf_exponent, self.rng)
+        for rank in range(items):
+            expected = total * sampler.weight(rank)
+            count = int(expected)
+            if self.rng.random() < expected - count:
+                count += 1
+            yield count
+
+    def generate(self) -> Iterator[Document]:
+        """Stream every document as (collection, document id, data)"""
+        yield from self._actors()
+        yield from self._feed()
+        yield from self._credentials()
+        yield from self._milestones()
+        yield from self._families()
+
+    def _actors(self) -> Iterator[Document]:
+        # Mostly community members, with a long tail of providers and educators
+        type_weights = {"community_member": 0.85, "service_provider": 0.10, "educator": 0.05}
+        types = list(self.actor_type_names)
+        weights = [type_weights.get(name, 0.05) for name in types]
+        statuses = self._enum("actors", "verification_status")
+
+        for number in range(self.config.actors):
+            type_index = self.rng.choices(range(len(types)), weights)[0]
+            self.actor_types.append(type_index)
+            created = self._timestamp()
+            yield "actors", self._id("actor", number), {
+                "type": types[type_index],
+                "email": f"{self.config.prefix}.user{number}@example.com",
+                "created_at": created,
+                "updated_at": created,
+                "metadata": {"generated": True, "seed": self.config.seed},
+                "is_active": self.rng.random() > 0.05,
+                "verification_status": self.rng.choice(statuses),
+            }
+
+    def _feed(self) -> Iterator[Document]:
+        config = self.config
+        authors = ZipfSampler(config.actors, config.zipf_exponent, self.rng)
+        commenters = ZipfSampler(config.actors, config.zipf_exponent, self.rng)
+        feed_types = self._enum("feed_items", "type")
+        visibilities = ("public", "public", "public", "family", "private")
+        like_counts = self._counts(config.likes, config.feed_items)
+        comment_counts = self._counts(config.comments, config.feed_items)
+        comment_number = 0
+
+        for number, likes, comments in zip(range(config.feed_items), like_counts, comment_counts):
+            item_id = self._id("feed", number)
+            author = authors.sample()
+            created = self._timestamp()
+            yield "feed_items", item_id, {
+                "type": self.rng.choice(feed_types),
+                "author_id": self._id("actor", author),
+                "author_type": "actor",
+                "title": self._text(5).capitalize(),
+                "description": self._text(12),
+                "content": self._text(40),
+                "created_at": created,
+                "updated_at": created,
+                "source": "load_generator",
+                "stats": {"likes": min(likes, config.actors), "shares": 0, "comments": comments},
+                "privacy_settings": {"visibility": self.rng.choice(visibilities)},
+                "type_specific_data": {},
+                "has_references": False,
+                "peer_likes": {},
+            }
+
+            # Each like comes from a distinct actor
+            for user in self.rng.sample(range(config.actors), min(likes, config.actors)):
+                yield "likes", f"{item_id}_{self._id('actor', user)}", {
+                    "target_id": item_id,
+                    "target_type": "feed_item",
+                    "user_id": self._id("actor", user),
+                    "user_type": self.actor_type_names[self.actor_types[user]],
+                    "created_at": self._timestamp(created),
+                }
+
+            # A feed item's comments are held back until its thread is complete, so every
+            # comment carries its final descendant_count
+            thread: List[str] = []
+            thread_comments: Dict[str, Dict[str, Any]] = {}
+            for _ in range(comments):
+                comment_id = self._id("comment", comment_number)
+                comment_number += 1
+                commenter = commenters.sample()
+                # About a third of comments reply to an earlier comment on the same item
+                parent = self.rng.choice(thread) if thread and self.rng.random() < 0.33 else None
+                comment_created = self._timestamp(created)
+                position = None
+                if parent is not None:
+                    position = (parent, thread_comments[parent]["path"], thread_comments[parent]["ancestor_ids"])
+                comment = thread_comments[comment_id] = {
+                    "feed_item_id": item_id,
+                    "author_id": self._id("actor", commenter),
+                    "author_type": self.actor_type_names[self.actor_types[commenter]],
+                    "content": self._text(15),
+                    "parent_comment_id": parent,
+                    "created_at": comment_created,
+                    "updated_at": comment_created,
+                    "is_deleted": False,
+                    "reactions": {},
+                    "descendant_count": 0,
+                    **thread_position(comment_id, comment_created, position),
+                }
+                for ancestor_id in comment["ancestor_ids"]:
+                    thread_comments[ancestor_id]["descendant_count"] += 1
+                thread.append(comment_id)
+            for comment_id in thread:
+                yield "comments", comment_id, thread_comments[comment_id]
+
+    def _credentials(self) -> Iterator[Document]:
+        config = self.config
+        provider_types = self._enum("credential_providers", "type")
+        definition_types = self._enum("credential_definitions", "type")
+        categories = self._enum("credential_definitions", "category")
+        statuses = self._enum("personal_credentials", "verification_status")
+
+        for number in range(config.credential_providers):
+            yield "credential_providers", self._id("credprovider", number), {
+                "name": f"Credential Provider {number}",
+                "abbreviation": f"CP{number}",
+                "description": self._text(10),
+                "type": self.rng.choice(provider_types),
+                "country": self.rng.choice(("AU", "US", "GB", "NZ")),
+                "website": f"https://provider{number}.example.com",
+                "contact_info": {},
+                "verification_methods": {"online": True, "manual": True, "api": False},
+                "is_active": True,
+                "established_year": self.rng.randrange(1950, 2020),
+                "credentials_issued": [],
+            }
+
+        # Each definition belongs to one provider, personal credentials must agree with it
+        definition_providers = [self.rng.randrange(config.credential_providers) for _ in range(config.credential_definitions)]
+        for number, provider in enumerate(definition_providers):
+            created = self._timestamp()
+            yield "credential_definitions", self._id("creddef", number), {
+                "provider_id": self._id("credprovider", provider),
+                "title": self._text(3).title(),
+                "abbreviation": f"CD{number}",
+                "description": self._text(10),
+                "type": self.rng.choice(definition_types),
+                "category": self.rng.choice(categories),
+                "requirements": {},
+                "duration_months": self.rng.randrange(1, 48),
+                "requires_renewal": True,
+                "renewal_period_months": self.rng.choice((12, 24, 36)),
+                "prerequisites": [],
+                "is_active": True,
+                "created_at": created,
+                "updated_at": created,
+            }
+
+        # Providers and educators hold credentials, community members rarely do
+        credential_number = 0
+        for actor, type_index in enumerate(self.actor_types):
+            owner_type = self.actor_type_names[type_index]
+            held = self.rng.randrange(1, 4) if owner_type != "community_member" else int(self.rng.random() < 0.05)
+            for _ in range(held):
+                definition = self.rng.randrange(config.credential_definitions)
+                issued = self._timestamp() - timedelta(days=self.rng.randrange(0, 1500))
+                expires = issued + timedelta(days=self.rng.choice((365, 730, 1095)))
+                created = self._timestamp()
+                yield "personal_credentials", self._id("credential", credential_number), {
+                    "owner_id": self._id("actor", actor),
+                    "owner_type": owner_type,
+                    "credential_definition_id": self._id("creddef", definition),
+                    "provider_id": self._id("credprovider", definition_providers[definition]),
+                    "verification_status": self.rng.choice(statuses),
+                    "issue_date": issued.date().isoformat(),
+                    "expiry_date": expires.date().isoformat(),
+                    "credential_number": f"{self.rng.randrange(10 ** 8):08d}",
+                    "verification_documents": {},
+                    "created_at": created,
+                    "updated_at": created,
+                    "verification_history": [],
+                }
+                credential_number += 1
+
+    def _milestones(self) -> Iterator[Document]:
+        categories = self._enum("milestones", "category")
+        periods = self._enum("milestones", "period")
+        importance = self._enum("milestones", "importance")
+
+        for number in range(self.config.milestones):
+            start = self.rng.randrange(0, 60)
+            end = start + self.rng.randrange(1, 12)
+            period = self.rng.choice(periods)
+            # Prerequisites always point at earlier milestones so the graph stays acyclic
+            prerequisites = self.rng.sample(range(number), min(self.rng.randrange(3), number))
+            created = self._timestamp()
+            yield "milestones", self._id("milestone", number), {
+                "title": self._text(3).capitalize(),
+                "description": self._text(12),
+                "category": self.rng.choice(categories),
+                "age_range_key": f"{period}_{start}_{end}",
+                "age_range": f"{start}-{end} months",
+                "start_months": start,
+                "end_months": end,
+                "period": period,
+                "importance": self.rng.choice(importance),
+                "is_typical": self.rng.random() > 0.1,
+                "prerequisites": [self._id("milestone", p) for p in prerequisites],
+                "skills": [self.rng.choice(WORDS) for _ in range(2)],
+                "observation_tips": self._text(10),
+                "support_strategies": self._text(10),
+                "red_flags": self._text(8),
+                "resources": self._text(6),
+                "created_date": created,
+                "modified_date": created,
+            }
+
+    def _families(self) -> Iterator[Document]:
+        config = self.config
+        statuses = self._enum("milestone_progress", "status")
+        bf_types = self._enum("breastfeeding_sessions", "session_type")
+        sleep_types = self._enum("sleep_sessions", "sleep_type")
+        sexes = self._enum("family_members", "sex")
+        member_number = 0
+        progress_number = 0
+        session_number = 0
+
+        for family in range(config.families):
+            profile_id = self._id("profile", family)
+            joined = self._timestamp()
+            yield "pedagogy_profiles", profile_id, {
+                "family_id": self._id("family", family),
+                "name": f"Family {family}",
+                "description": self._text(8),
+                "based_on_template": "default",
+                "customizations": {},
+                "created_date": joined,
+                "modified_date": joined,
+            }
+
+            for relationship in ("parent", "child"):
+                member_id = self._id("member", member_number)
+                # Alternate instead of drawing from rng so existing seeds keep producing the same data
+                sex = sexes[member_number % len(sexes)]
+                member_number += 1
+                birth = joined - timedelta(days=self.rng.randrange(30, 400) if relationship == "child" else 11000)
+                yield "family_members", member_id, {
+                    "pedagogy_profile_id": profile_id,
+                    # Parents sign in as a generated actor so custom claims and family rules can be exercised
+                    "actor_id": self._id("actor", family % config.actors) if relationship == "parent" else None,
+                    "name": f"{relationship.title()} {family}",
+                    "relationship": relationship,
+                    "date_of_birth": birth.date().isoformat(),
+                    "sex": sex,
+                    "profile_image": "",
+                    "is_active": True,
+                    "joined_date": joined,
+                    "left_date": None,
+                }
+                if relationship != "child":
+                    continue
+
+                milestones = self.rng.sample(range(config.milestones), min(config.progress_per_member, config.milestones))
+                for milestone in milestones:
+                    status = self.rng.choice(statuses)
+                    started = self._timestamp()
+                    yield "milestone_progress", self._id("progress", progress_number), {
+                        "pedagogy_profile_id": profile_id,
+                        "family_member_id": member_id,
+                        "milestone_id": self._id("milestone", milestone),
+                        "status": status,
+                        "date_started": started,
+                        "date_completed": self._timestamp(started) if status == "completed" else None,
+                        "notes": self._text(6),
+                        "evidence": [],
+                        "custom_adaptations": "",
+                    }
+                    progress_number += 1
+
+                clock = joined
+                for _ in range(config.sessions_per_member):
+                    clock += timedelta(minutes=self.rng.randrange(90, 240))
+                    kind = self.rng.randrange(3)
+                    session_id = self._id("session", session_number)
+                    session_number += 1
+                    if kind == 0:
+                        duration = self.rng.randrange(5, 45)
+                        yield "breastfeeding_sessions", session_id, {
+                            "family_member_id": member_id,
+                            "start_time": clock,
+                            "end_time": clock + timedelta(minutes=duration),
+                            "duration_minutes": duration,
+                            "happiness_level": self.rng.randint(1, 10),
+                            "soreness_level": self.rng.randint(1, 10),
+                            "notes": "",
+                            "session_type": self.rng.choice(bf_types),
+                            "metadata": {},
+                        }
+                    elif kind == 1:
+                        duration = self.rng.randrange(20, 600)
+                        yield "sleep_sessions", session_id, {
+                            "family_member_id": member_id,
+                            "sleep_start": clock,
+                            "sleep_end": clock + timedelta(minutes=duration),
+                            "duration_minutes": duration,
+                            "sleep_type": self.rng.choice(sleep_types),
+                            "quality_rating": self.rng.randint(1, 10),
+                            "notes": "",
+                            "wake_ups": [{"minutes_in": self.rng.randrange(duration)} for _ in range(self.rng.randrange(3))],
+                        }
+                    else:
+                        age_days = (clock - birth).days
+                        yield "growth_measurements", session_id, {
+                            "family_member_id": member_id,
+                            "measured_date": clock,
+                            "weight_kg": round(3.3 + age_days * 0.02 + self.rng.gauss(0, 0.3), 2),
+                            "height_cm": round(50 + age_days * 0.06 + self.rng.gauss(0, 1.0), 1),
+                            "head_circumference_cm": round(35 + age_days * 0.025 + self.rng.gauss(0, 0.5), 1),
+                            "measurement_type": self.rng.choice(self._enum("growth_measurements", "measurement_type")),
+                            "notes": "",
+                            "measured_by": "parent",
+                        }
+
+
+class LoadWriter:
+    def __init__(self, db, workers: int = 4, rate: float = 0, max_attempts: int = 5, queue_size: int = 10_000):
+        """Write documents through one BulkWriter per worker thread"""
+        self.db = db
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.max_attempts = max_attempts
+        # A bounded queue keeps the generator from running ahead of Firestore
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failed = 0
+        self.errors: List[BaseException] = []
+        self._lock = threading.Lock()
+
+    def _on_write_error(self, error, bulk_writer) -> bool:
+        if error.attempts < self.max_attempts:
+            return True
+        with self._lock:
+            self.failed += 1
+        return False
+
+    def _work(self):
+        try:
+            bulk_writer = self.db.bulk_writer()
+            bulk_writer.on_write_error(self._on_write_error)
+            written = 0
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                collection, doc_id, data = item
+                self.limiter.acquire()
+                bulk_writer.set(self.db.collection(collection).document(doc_id), data)
+                written += 1
+            bulk_writer.close()
+            with self._lock:
+                self.written += written
+        except Exception as error:
+            # Recorded for write(), which would otherwise block on the full queue
+            with self._lock:
+                self.errors.append(error)
+
+    def _put(self, item: Document):
+        while True:
+            if self.errors:
+                raise RuntimeError(f"A load writer thread failed: {self.errors[0]}") from self.errors[0]
+            try:
+                self.queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def _shutdown(self, threads: List[threading.Thread]):
+        """Send each worker its stop sentinel and wait for the writes in flight"""
+        pending = len(threads)
+        while pending and any(thread.is_alive() for thread in threads):
+            try:
+                self.queue.put(None, timeout=1.0)
+                pending -= 1
+            except queue.Full:
+                continue
+        for thread in threads:
+            thread.join()
+
+    def write(
+        self,
+        documents: Iterator[Document],
+        progress_every: Optional[int] = 50_000,
+        progress_stream: Optional[TextIO] = None,
+    ) -> Dict[str, float]:
+        """Drain ``documents`` into Firestore and return throughput figures
+
+        Progress goes to ``progress_stream`` (stderr by default, so stdout stays usable for
+        results) every ``progress_every`` documents; None turns it off.
+        """
+        stream = progress_stream or sys.stderr
+        threads = [threading.Thread(target=self._work, name=f"zygo-load-{n}") for n in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        started = time.monotonic()
+        queued = 0
+        try:
+            for document in documents:
+                self._put(document)
+                queued += 1
+                if progress_every and queued % progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    print(f"   ⏳ {queued:,} documents queued ({queued / elapsed:,.0f} docs/s)", file=stream)
+        finally:
+            self._shutdown(threads)
+        if self.errors:
+            raise RuntimeError(f"A load writer thread failed: {self.errors[0]}") from self.errors[0]
+
+        elapsed = time.monotonic() - started
+        written = self.written - self.failed
+        return {
+            "written": written,
+            "failed": self.failed,
+            "seconds": elapsed,
+            "docs_per_second": written / elapsed if elapsed else 0.0,
+        }
+
+
+def main():
+    """Generate a synthetic dataset and write it to Firestore"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate Zygo load-testing data")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--seed", help="Random seed", type=int, default=42)
+    parser.add_argument("--prefix", help="Document ID prefix", default="load")
+    parser.add_argument("--actors", type=int, default=10_000)
+    parser.add_argument("--feed-items", type=int, default=50_000)
+    parser.add_argument("--likes", type=int, default=500_000)
+    parser.add_argument("--comments", type=int, default=100_000)
+    parser.add_argument("--families", type=int, default=2_000)
+    parser.add_argument("--milestones", type=int, default=200)
+    parser.add_argument("--progress-per-member", type=int, default=20)
+    parser.add_argument("--sessions-per-member", type=int, default=100)
+    parser.add_argument("--zipf-exponent", help="Skew of author/like/comment popularity", type=float, default=1.1)
+    parser.add_argument("--workers", help="Parallel BulkWriter threads", type=int, default=4)
+    parser.add_argument("--rate", help="Maximum documents per second (0 = unlimited)", type=float, default=0)
+    parser.add_argument("--dry-run", help="Generate and count documents without writing", action="store_true")
+
+    args = parser.parse_args()
+
+    config = GeneratorConfig(
+        seed=args.seed,
+        prefix=args.prefix,
+        actors=args.actors,
+        feed_items=args.feed_items,
+        likes=args.likes,
+        comments=args.comments,
+        families=args.families,
+        milestones=args.milestones,
+        progress_per_member=args.progress_per_member,
+        sessions_per_member=args.sessions_per_member,
+        zipf_exponent=args.zipf_exponent,
+    )
+    generator = LoadDataGenerator(config, load_registry(args.schema))
+
+    print(f"🎲 Generating load data (seed {args.seed})")
+
+    if args.dry_run:
+        counts: Dict[str, int] = {}
+        for collection, _, _ in generator.generate():
+            counts[collection] = counts.get(collection, 0) + 1
+        for collection, count in counts.items():
+            print(f"   {collection}: {count:,}")
+        return
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    writer = LoadWriter(firestore.client(), workers=args.workers, rate=args.rate)
+    result = writer.write(generator.generate())
+    print(
+        f"✅ Wrote {result['written']:,} documents in {result['seconds']:.1f}s "
+        f"({result['docs_per_second']:,.0f} docs/s, {result['failed']:,} failed)"
+    )
+
+
+if __name__ == "__main__":
+    main()
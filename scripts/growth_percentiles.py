@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Growth Percentiles for Zygo Platform
+Turns growth_measurements into WHO-style z-scores and percentiles with the LMS method,
+vectorized over whole batches with numpy.
+
+Reference tables are not shipped. Convert a long-format CSV with the columns
+indicator,sex,age_days,l,m,s (indicator is weight_for_age, length_for_age or
+head_circumference_for_age; sex is female or male; one row per day, as in the WHO
+expanded tables) once with --convert. The result is a single .npy array of shape
+(indicator, sex, age_days, LMS) that is memory-mapped, so loading it is free and only the
+pages a batch touches are read.
+"""
+
+import math
+import os
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+
+DEFAULT_REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "growth_reference.npy")
+
+SEXES = ("female", "male")
+
+# indicator -> measurement field; the order is the first axis of the reference array
+INDICATORS = {
+    "weight_for_age": "weight_kg",
+    "length_for_age": "height_cm",
+    "head_circumference_for_age": "head_circumference_cm",
+}
+
+# WHO restricts the LMS tails of weight-based indicators beyond |z| = 3, where the skewness
+# of the Box-Cox fit is no longer supported by data; length and head circumference use the plain formula
+RESTRICTED_INDICATORS = frozenset({"weight_for_age"})
+
+DERIVED_FIELDS = ["age_days"] + [f"{indicator}_{suffix}" for indicator in INDICATORS for suffix in ("z", "percentile")]
+
+
+class GrowthReferenceError(Exception):
+    """Raised when the reference table is missing or malformed"""
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise GrowthReferenceError("numpy is required for growth percentiles: pip install numpy") from e
+    return np
+
+
+def convert_reference(csv_path: str, output_path: str = DEFAULT_REFERENCE_PATH) -> Dict[str, int]:
+    """Convert a long-format LMS CSV into the memory-mappable .npy reference array
+
+    Days missing between two tabulated days are linearly interpolated; days outside the
+    tabulated range stay NaN and produce no derived values.
+    """
+    import csv
+
+    np = _numpy()
+    rows = []
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            row = {key.strip().lower(): (value or "").strip() for key, value in row.items()}
+            if row["indicator"] not in INDICATORS:
+                raise GrowthReferenceError(f"line {line}: unknown indicator '{row['indicator']}'")
+            if row["sex"] not in SEXES:
+                raise GrowthReferenceError(f"line {line}: sex must be one of {'|'.join(SEXES)}")
+            rows.append(
+                (
+                    list(INDICATORS).index(row["indicator"]),
+                    SEXES.index(row["sex"]),
+                    int(row["age_days"]),
+                    float(row["l"]),
+                    float(row["m"]),
+                    float(row["s"]),
+                )
+            )
+    if not rows:
+        raise GrowthReferenceError(f"{csv_path} has no rows")
+
+    max_day = max(row[2] for row in rows)
+    table = np.full((len(INDICATORS), len(SEXES), max_day + 1, 3), np.nan)
+    for indicator, sex, day, l, m, s in rows:
+        table[indicator, sex, day] = (l, m, s)
+
+    days = np.arange(max_day + 1)
+    for indicator in range(len(INDICATORS)):
+        for sex in range(len(SEXES)):
+            known = ~np.isnan(table[indicator, sex, :, 1])
+            if known.sum() < 2:
+                continue
+            first, last = days[known][0], days[known][-1]
+            inside = (days >= first) & (days <= last)
+            for parameter in range(3):
+                table[indicator, sex, inside, parameter] = np.interp(
+                    days[inside], days[known], table[indicator, sex, known, parameter]
+                )
+
+    np.save(output_path, table)
+    load_reference.cache_clear()
+    return {"rows": len(rows), "max_day": max_day}
+
+
+@lru_cache(maxsize=None)
+def load_reference(path: str = DEFAULT_REFERENCE_PATH):
+    """Memory-map the reference array once per process"""
+    np = _numpy()
+    if not os.path.exists(path):
+        raise GrowthReferenceError(f"{path} not found - build it with growth_percentiles.py --convert <lms.csv>")
+    table = np.load(path, mmap_mode="r")
+    if table.ndim != 4 or table.shape[:2] != (len(INDICATORS), len(SEXES)) or table.shape[3] != 3:
+        expected = f"({len(INDICATORS)}, {len(SEXES)}, days, 3)"
+        raise GrowthReferenceError(f"{path} has shape {table.shape}, expected {expected}")
+    return table
+
+
+def _normal_cdf(z):
+    """Standard normal CDF via the Abramowitz-Stegun 7.1.26 erf approximation (|error| < 1.5e-7)"""
+    np = _numpy()
+    x = np.abs(z) / math.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+def _lms_value(l, m, s, z):
+    """Measurement at z-score ``z`` for the given LMS parameters"""
+    np = _numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.abs(l) < 1e-9, m * np.exp(s * z), m * np.power(1.0 + l * s * z, 1.0 / l))
+
+
+def z_scores(table, indicator: str, values, age_days, sexes):
+    """LMS z-scores for arrays of measurement values, ages in days and sex codes
+
+    NaN where the value, age or sex is missing or outside the reference table.
+    """
+    np = _numpy()
+    values = np.asarray(values, dtype=np.float64)
+    age_days = np.asarray(age_days, dtype=np.int64)
+    sexes = np.asarray(sexes, dtype=np.int64)
+
+    valid = ~np.isnan(values) & (values > 0) & (age_days >= 0) & (age_days < table.shape[2]) & (sexes >= 0)
+    lms = np.full((len(values), 3), np.nan)
+    lms[valid] = table[list(INDICATORS).index(indicator), sexes[valid], age_days[valid]]
+    l, m, s = lms[:, 0], lms[:, 1], lms[:, 2]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(np.abs(l) < 1e-9, np.log(values / m) / s, (np.power(values / m, l) - 1.0) / (l * s))
+
+        if indicator in RESTRICTED_INDICATORS:
+            sd3_pos = _lms_value(l, m, s, 3.0)
+            sd23_pos = sd3_pos - _lms_value(l, m, s, 2.0)
+            sd3_neg = _lms_value(l, m, s, -3.0)
+            sd23_neg = _lms_value(l, m, s, -2.0) - sd3_neg
+            z = np.where(z > 3.0, 3.0 + (values - sd3_pos) / sd23_pos, z)
+            z = np.where(z < -3.0, -3.0 + (values - sd3_neg) / sd23_neg, z)
+    return z
+
+
+def percentiles(z):
+    """Percentiles (0-100) for z-scores"""
+    return 100.0 * _normal_cdf(z)
+
+
+def compute(table, columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Derived arrays for a batch with columns age_days, sex (codes into SEXES, -1 unknown)
+    and one array per measurement field in INDICATORS"""
+    derived = {}
+    for indicator, field in INDICATORS.items():
+        z = z_scores(table, indicator, columns[field], columns["age_days"], columns["sex"])
+        derived[f"{indicator}_z"] = z
+        derived[f"{indicator}_percentile"] = percentiles(z)
+    return derived
+
+
+def _age_days(measured: Any, birth: Optional[date]) -> int:
+    if birth is None or not isinstance(measured, datetime):
+        return -1
+    if measured.tzinfo is not None:
+        measured = measured.astimezone(timezone.utc)
+    return (measured.date() - birth).days
+
+
+def _birth_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def derive_fields(measurement: Dict[str, Any], member: Dict[str, Any], table=None) -> Dict[str, Any]:
+    """Derived fields for a single new measurement, to store alongside it"""
+    np = _numpy()
+    table = load_reference() if table is None else table
+    age = _age_days(measurement.get("measured_date"), _birth_date(member.get("date_of_birth")))
+    columns = {
+        "age_days": np.array([age]),
+        "sex": np.array([SEXES.index(member["sex"]) if member.get("sex") in SEXES else -1]),
+    }
+    for field in INDICATORS.values():
+        value = measurement.get(field)
+        columns[field] = np.array([value if isinstance(value, (int, float)) else np.nan], dtype=np.float64)
+    derived = compute(table, columns)
+    fields = {"age_days": age if age >= 0 else None}
+    for name, values in derived.items():
+        fields[name] = _rounded(name, values[0])
+    fields["percentiles_computed_at"] = datetime.now(timezone.utc)
+    return fields
+
+
+def _rounded(name: str, value: float) -> Optional[float]:
+    if math.isnan(value):
+        return None
+    # + 0.0 turns -0.0 into 0.0
+    return round(float(value), 2 if name.endswith("_percentile") else 3) + 0.0
+
+
+class GrowthBackfill:
+    def __init__(self, db, table=None, batch_size: int = MAX_BATCH_SIZE):
+        """Write derived percentile fields onto existing growth_measurements"""
+        self.db = db
+        self.table = load_reference() if table is None else table
+        self.batch_size = batch_size
+
+    def _members(self) -> Dict[str, Any]:
+        members = {}
+        for snapshot in self.db.collection("family_members").select(["date_of_birth", "sex"]).stream():
+            data = snapshot.to_dict() or {}
+            sex = data.get("sex")
+            members[snapshot.id] = (_birth_date(data.get("date_of_birth")), SEXES.index(sex) if sex in SEXES else -1)
+        return members
+
+    def run(self, family_member_id: Optional[str] = None) -> Dict[str, int]:
+        """Compute every measurement in one vectorized pass, then update changed documents"""
+        from array import array
+
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        np = _numpy()
+        members = self._members()
+        refs: List[Any] = []
+        existing: List[Dict[str, Any]] = []
+        columns: Dict[str, Any] = {"age_days": array("q"), "sex": array("q")}
+        for field in INDICATORS.values():
+            columns[field] = array("d")
+
+        query = self.db.collection("growth_measurements")
+        if family_member_id:
+            query = query.where(filter=FieldFilter("family_member_id", "==", family_member_id))
+        fields = ["family_member_id", "measured_date"] + list(INDICATORS.values()) + DERIVED_FIELDS
+        for snapshot in query.select(fields).stream():
+            if snapshot.id == "_schema":
+                continue
+            data = snapshot.to_dict() or {}
+            birth, sex = members.get(data.get("family_member_id"), (None, -1))
+            refs.append(snapshot.reference)
+            existing.append({name: data.get(name) for name in DERIVED_FIELDS})
+            columns["age_days"].append(_age_days(data.get("measured_date"), birth))
+            columns["sex"].append(sex)
+            for field in INDICATORS.values():
+                value = data.get(field)
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                columns[field].append(float(value) if is_number else float("nan"))
+
+        arrays = {
+            name: np.frombuffer(values, dtype=np.int64 if values.typecode == "q" else np.float64)
+            for name, values in columns.items()
+        }
+        derived = compute(self.table, arrays) if refs else {}
+
+        now = datetime.now(timezone.utc)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        counts = {"measurements": len(refs), "updated": 0, "unchanged": 0, "no_reference": 0}
+        ages = arrays["age_days"]
+        for row, doc_ref in enumerate(refs):
+            fields = {"age_days": int(ages[row]) if ages[row] >= 0 else None}
+            for name, values in derived.items():
+                fields[name] = _rounded(name, values[row])
+            if all(fields[name] is None for name in derived):
+                counts["no_reference"] += 1
+            if fields == existing[row]:
+                counts["unchanged"] += 1
+                continue
+            writer.update(doc_ref, {**fields, "percentiles_computed_at": now})
+            counts["updated"] += 1
+        writer.flush()
+        return counts
+
+
+def main():
+    """Convert reference tables or backfill derived growth fields"""
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Compute Zygo growth z-scores and percentiles")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--reference", help="Path to the .npy reference array", default=DEFAULT_REFERENCE_PATH)
+    parser.add_argument("--convert", help="Build the reference array from a long-format LMS CSV", default=None)
+    parser.add_argument("--backfill", help="Write derived fields onto growth_measurements", action="store_true")
+    parser.add_argument("--family-member", help="Limit --backfill to one family member", default=None)
+
+    args = parser.parse_args()
+
+    try:
+        if args.convert:
+            result = convert_reference(args.convert, args.reference)
+            print(f"📈 Converted {result['rows']:,} LMS rows (days 0-{result['max_day']}) to {args.reference}")
+
+        if args.backfill:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+
+            if args.project_id:
+                os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+            if args.service_account:
+                cred = credentials.Certificate(args.service_account)
+            else:
+                cred = credentials.ApplicationDefault()
+            try:
+                firebase_admin.initialize_app(cred)
+            except ValueError:
+                # App already initialized
+                pass
+
+            started = time.monotonic()
+            backfill = GrowthBackfill(firestore.client(), load_reference(args.reference), batch_size=args.batch_size)
+            counts = backfill.run(args.family_member)
+            print(
+                f"✅ {counts['measurements']:,} measurements in {time.monotonic() - started:.1f}s: "
+                f"{counts['updated']:,} updated, {counts['unchanged']:,} unchanged, "
+                f"{counts['no_reference']:,} without reference data (missing sex, birth date or age out of range)"
+            )
+    except GrowthReferenceError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Milestone CSV Importer for Zygo Platform
+Streams a milestones CSV (the comprehensive-milestones.csv layout used by the web app,
+camelCase or snake_case headers) into the milestones collection.
+
+The file is read twice, row by row: the first pass only collects document IDs so that
+prerequisites can point at rows further down the file, the second pass validates each row
+against the milestones field spec in the schema registry and upserts it. Rows whose content
+is unchanged are not rewritten, so re-imports only cost reads for untouched rows.
+"""
+
+import csv
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter, sync_documents
+from schema_registry import CollectionSpec, SchemaRegistry, load_registry
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_SLUG_INVALID = re.compile(r"[^a-z0-9]+")
+
+TRUE_VALUES = ("true", "yes", "1", "y")
+FALSE_VALUES = ("false", "no", "0", "n", "")
+
+
+class RowError(ValueError):
+    """A CSV row that cannot be imported"""
+
+
+def snake_case(header: str) -> str:
+    return _CAMEL_BOUNDARY.sub("_", header.strip()).lower()
+
+
+def slugify(text: str) -> str:
+    return _SLUG_INVALID.sub("_", text.lower()).strip("_")
+
+
+def milestone_id(row: Dict[str, str]) -> str:
+    """Stable document ID: the CSV id column, or the title slug plus the age range
+
+    "Social smiling" in age range "infancy_0_6" becomes "social_smiling_0_6", matching the
+    sample milestone written by the setup script.
+    """
+    if row.get("id"):
+        return row["id"].strip()
+    title = slugify(row.get("title", ""))
+    if not title:
+        raise RowError("row has neither an id nor a title")
+    age_suffix = "_".join(re.findall(r"\d+", row.get("age_range_key", "")))
+    return f"{title}_{age_suffix}" if age_suffix else title
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (line number, row) with snake_case keys, one row at a time"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [snake_case(name) for name in reader.fieldnames or []]
+        for row in reader:
+            if not any((value or "").strip() for value in row.values()):
+                continue
+            yield reader.line_num, row
+
+
+class MilestoneRowParser:
+    def __init__(self, spec: CollectionSpec):
+        """Convert and validate CSV rows using the milestones field spec"""
+        self.spec = spec
+
+    def parse(self, row: Dict[str, str]) -> Dict[str, Any]:
+        record: Dict[str, Any] = {}
+        for name, field in self.spec.fields.items():
+            raw = (row.get(name) or "").strip()
+            if field.type == "timestamp":
+                if raw:
+                    record[name] = self._timestamp(name, raw)
+                continue
+            if field.type == "number":
+                record[name] = self._number(name, raw)
+            elif field.type == "boolean":
+                record[name] = self._boolean(name, raw)
+            elif field.type == "array":
+                record[name] = [item.strip() for item in raw.split(",") if item.strip()]
+            else:
+                record[name] = raw
+
+            if field.enum and record[name] not in field.enum:
+                raise RowError(f"{name} '{record[name]}' is not one of {'|'.join(field.enum)}")
+
+        if not record.get("title"):
+            raise RowError("title is required")
+        if record["start_months"] > record["end_months"]:
+            raise RowError(f"start_months {record['start_months']} is after end_months {record['end_months']}")
+        return record
+
+    @staticmethod
+    def _number(name: str, raw: str):
+        if not raw:
+            raise RowError(f"{name} is required")
+        try:
+            value = float(raw)
+        except ValueError:
+            raise RowError(f"{name} '{raw}' is not a number") from None
+        return int(value) if value.is_integer() else value
+
+    @staticmethod
+    def _boolean(name: str, raw: str) -> bool:
+        lowered = raw.lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        raise RowError(f"{name} '{raw}' is not a boolean")
+
+    @staticmethod
+    def _timestamp(name: str, raw: str) -> datetime:
+        try:
+            value = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        except ValueError:
+            raise RowError(f"{name} '{raw}' is not an ISO date") from None
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class MilestoneImporter:
+    def __init__(self, db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE):
+        """Import milestones into ``db``; pass db=None for a validation-only dry run"""
+        self.db = db
+        self.parser = MilestoneRowParser((registry or load_registry()).collection("milestones"))
+        self.batch_size = batch_size
+        self.counts = {"rows": 0, "valid": 0, "created": 0, "updated": 0, "unchanged": 0, "invalid": 0}
+        self.errors: List[Tuple[int, str]] = []
+
+    def collect_ids(self, path: str) -> Set[str]:
+        """First pass - every ID in the file plus the milestones already in Firestore"""
+        ids: Set[str] = set()
+        duplicates: Set[str] = set()
+        for _, row in read_rows(path):
+            try:
+                doc_id = milestone_id(row)
+            except RowError:
+                continue
+            if doc_id in ids:
+                duplicates.add(doc_id)
+            ids.add(doc_id)
+        if duplicates:
+            raise RowError(f"duplicate milestone IDs in {path}: {', '.join(sorted(duplicates)[:10])}")
+
+        if self.db is not None:
+            for snapshot in self.db.collection("milestones").select([]).stream():
+                ids.add(snapshot.id)
+        ids.discard("_schema")
+        return ids
+
+    def validated(self, path: str, known_ids: Set[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Second pass - yield (doc_id, record) for every valid row, recording the rest"""
+        for line, row in read_rows(path):
+            self.counts["rows"] += 1
+            try:
+                doc_id = milestone_id(row)
+                record = self.parser.parse(row)
+                missing = [prerequisite for prerequisite in record["prerequisites"] if prerequisite not in known_ids]
+                if missing:
+                    raise RowError(f"unknown prerequisites: {', '.join(missing)}")
+                if doc_id in record["prerequisites"]:
+                    raise RowError("milestone lists itself as a prerequisite")
+            except RowError as e:
+                self.counts["invalid"] += 1
+                self.errors.append((line, str(e)))
+                continue
+            self.counts["valid"] += 1
+            yield doc_id, record
+
+    def run(self, path: str, progress_every: int = 1000) -> Dict[str, int]:
+        started = time.monotonic()
+        known_ids = self.collect_ids(path)
+        now = datetime.now(timezone.utc)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size) if self.db is not None else None
+        chunk: List[Tuple[Any, Dict[str, Any]]] = []
+
+        def upsert():
+            counts = sync_documents(self.db, writer, chunk, merge=True, create_defaults={"created_date": now})
+            for key, value in counts.items():
+                self.counts[key] += value
+            chunk.clear()
+
+        for doc_id, record in self.validated(path, known_ids):
+            if writer is None:
+                continue
+            record.setdefault("modified_date", now)
+            chunk.append((self.db.collection("milestones").document(doc_id), record))
+            if len(chunk) >= self.batch_size:
+                upsert()
+            if self.counts["rows"] % progress_every == 0:
+                elapsed = time.monotonic() - started
+                print(
+                    f"   ⏳ {self.counts['rows']:,} rows ({self.counts['rows'] / elapsed:,.0f} rows/s) - "
+                    f"{self.counts['created']:,} created, {self.counts['updated']:,} updated, "
+                    f"{self.counts['unchanged']:,} unchanged, {self.counts['invalid']:,} invalid"
+                )
+
+        if writer is not None:
+            upsert()
+            writer.flush()
+        return self.counts
+
+
+def main():
+    """Import a milestones CSV"""
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(description="Import Zygo milestones from CSV")
+    parser.add_argument("csv_path", help="Path to the milestones CSV")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--dry-run", help="Validate the file without touching Firestore", action="store_true")
+    parser.add_argument("--max-errors", help="Number of row errors to print", type=int, default=50)
+
+    args = parser.parse_args()
+
+    db: Optional[Any] = None
+    if not args.dry_run:
+        if args.project_id:
+            os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+        try:
+            firebase_admin.initialize_app(cred)
+        except ValueError:
+            # App already initialized
+            pass
+        db = firestore.client()
+
+    print(f"📥 Importing milestones from {args.csv_path}")
+    importer = MilestoneImporter(db, batch_size=args.batch_size)
+    try:
+        counts = importer.run(args.csv_path)
+    except RowError as e:
+        print(f"❌ Import aborted: {e}")
+        sys.exit(1)
+
+    for line, error in importer.errors[: args.max_errors]:
+        print(f"   ⚠️ line {line}: {error}")
+    if len(importer.errors) > args.max_errors:
+        print(f"   ... and {len(importer.errors) - args.max_errors} more")
+
+    print(
+        f"✅ {counts['rows']:,} rows ({counts['valid']:,} valid): {counts['created']:,} created, "
+        f"{counts['updated']:,} updated, {counts['unchanged']:,} unchanged, {counts['invalid']:,} invalid"
+    )
+    if counts["invalid"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
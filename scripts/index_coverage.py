@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Index Coverage Analyzer for Zygo Platform
+Checks a catalog of the app's query shapes against the indexes declared in the schema
+registry. Runs entirely offline so it can gate merges.
+
+Queries are described in schema/query_catalog.json as a collection, a list of
+"field op" filters and a list of "field [ASC|DESC]" order-bys.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from firestore_indexes import ASCENDING, COLLECTION, CONTAINS, DESCENDING, IndexSpec, declared_indexes
+from schema_registry import DEFAULT_SCHEMA_PATH, SchemaError, load_registry
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "query_catalog.json")
+
+EQUALITY_OPS = ("==", "in")
+ARRAY_OPS = ("array-contains", "array-contains-any")
+RANGE_OPS = ("<", "<=", ">", ">=", "!=", "not-in")
+
+_FLIP = {ASCENDING: DESCENDING, DESCENDING: ASCENDING}
+
+
+class QueryShape:
+    __slots__ = ("name", "collection", "query_scope", "filters", "equality", "array_field", "range_field", "order_by")
+
+    def __init__(self, definition: Dict[str, Any]):
+        """Parse a query catalog entry"""
+        self.name = definition["name"]
+        self.collection = definition["collection"]
+        self.query_scope = definition.get("query_scope", COLLECTION)
+        self.filters: List[Tuple[str, str]] = []
+        self.equality: List[str] = []
+        self.array_field: Optional[str] = None
+        self.range_field: Optional[str] = None
+
+        for clause in definition.get("where", []):
+            field, _, op = clause.rpartition(" ")
+            if not field:
+                raise SchemaError(f"{self.name}: cannot parse filter '{clause}'")
+            self.filters.append((field, op))
+            if op in EQUALITY_OPS:
+                self.equality.append(field)
+            elif op in ARRAY_OPS:
+                if self.array_field is not None:
+                    raise SchemaError(f"{self.name}: only one array-contains filter is allowed")
+                self.array_field = field
+            elif op in RANGE_OPS:
+                if self.range_field not in (None, field):
+                    raise SchemaError(f"{self.name}: range filters on more than one field need separate analysis")
+                self.range_field = field
+            else:
+                raise SchemaError(f"{self.name}: unknown operator '{op}'")
+
+        self.order_by: List[Tuple[str, str]] = []
+        for clause in definition.get("order_by", []):
+            tokens = clause.split()
+            direction = DESCENDING if len(tokens) == 2 and tokens[1].upper() == "DESC" else ASCENDING
+            # Ordering on a field pinned by an equality filter is a no-op
+            if tokens[0] not in self.equality:
+                self.order_by.append((tokens[0], direction))
+
+        if self.range_field and not self.order_by:
+            self.order_by = [(self.range_field, ASCENDING)]
+        if self.range_field and self.order_by[0][0] != self.range_field:
+            raise SchemaError(f"{self.name}: the first order_by must be the range field '{self.range_field}'")
+
+    def needs_composite_index(self) -> bool:
+        """False when Firestore's automatic single-field indexes (and index merging) serve the query"""
+        prefix_fields = len(self.equality) + (1 if self.array_field else 0)
+        if not self.order_by:
+            # Equality-only queries are served by merging single-field indexes
+            return False
+        return prefix_fields > 0 or len(self.order_by) > 1
+
+    def required_index(self) -> IndexSpec:
+        """The smallest composite index serving this query"""
+        fields = [(field, ASCENDING) for field in sorted(self.equality)]
+        if self.array_field:
+            fields.append((self.array_field, CONTAINS))
+        fields.extend(self.order_by)
+        return IndexSpec(self.collection, tuple(fields), self.query_scope)
+
+    def is_served_by(self, index: IndexSpec) -> bool:
+        """Whether ``index`` can serve this query"""
+        if index.collection_group != self.collection or index.query_scope != self.query_scope:
+            return False
+
+        prefix = set(self.equality)
+        if self.array_field:
+            prefix.add(self.array_field)
+        if len(index.fields) != len(prefix) + len(self.order_by):
+            return False
+
+        # Equality fields can appear in any order and direction, array fields must be CONTAINS
+        head, tail = index.fields[: len(prefix)], index.fields[len(prefix) :]
+        if {field for field, _ in head} != prefix:
+            return False
+        for field, mode in head:
+            if (field == self.array_field) != (mode == CONTAINS):
+                return False
+
+        # Order-by fields must match exactly, or be reversed as a whole
+        order = tuple(self.order_by)
+        reversed_order = tuple((field, _FLIP[direction]) for field, direction in order)
+        return tuple(tail) in (order, reversed_order)
+
+
+def load_catalog(path: str = DEFAULT_CATALOG_PATH) -> List[QueryShape]:
+    with open(path, encoding="utf-8") as f:
+        return [QueryShape(query) for query in json.load(f)["queries"]]
+
+
+def analyze(queries: List[QueryShape], indexes: List[IndexSpec]) -> Dict[str, List]:
+    """Match every query against the index set"""
+    report = {"covered": [], "automatic": [], "missing": [], "unused": [], "single_field": []}
+    used = set()
+
+    for query in queries:
+        if not query.needs_composite_index():
+            report["automatic"].append(query)
+            continue
+
+        serving = [index for index in indexes if index.is_composite and query.is_served_by(index)]
+        if serving:
+            used.update(serving)
+            report["covered"].append((query, serving[0]))
+        else:
+            report["missing"].append((query, query.required_index()))
+
+    for index in indexes:
+        if not index.is_composite:
+            report["single_field"].append(index)
+        elif index not in used:
+            report["unused"].append(index)
+
+    return report
+
+
+def report_to_json(report: Dict[str, List]) -> Dict[str, Any]:
+    return {
+        "covered": [{"query": query.name, "index": str(index)} for query, index in report["covered"]],
+        "automatic": [query.name for query in report["automatic"]],
+        "missing": [
+            {"query": query.name, "collection": query.collection, "suggested_index": str(index)}
+            for query, index in report["missing"]
+        ],
+        "unused": [{"collection": index.collection_group, "index": str(index)} for index in report["unused"]],
+        "single_field": [{"collection": index.collection_group, "index": str(index)} for index in report["single_field"]],
+    }
+
+
+def print_report(report: Dict[str, List]):
+    print(f"✅ {len(report['covered'])} queries served by a declared composite index")
+    print(f"⚡ {len(report['automatic'])} queries served by automatic single-field indexes")
+
+    if report["missing"]:
+        print(f"❌ {len(report['missing'])} queries have no serving index:")
+        for query, index in report["missing"]:
+            print(f"   {query.name} ({query.collection}) needs: {index}")
+
+    if report["unused"]:
+        print(f"⚠️ {len(report['unused'])} composite indexes are not used by any query (write amplification):")
+        for index in report["unused"]:
+            print(f"   {index.collection_group}: {index}")
+
+    if report["single_field"]:
+        print(f"ℹ️ {len(report['single_field'])} declared single-field indexes are created automatically:")
+        for index in report["single_field"]:
+            print(f"   {index.collection_group}: {index}")
+
+
+def main():
+    """Analyze index coverage and exit non-zero when a query is not served"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check Zygo query shapes against declared Firestore indexes")
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--catalog", help="Path to the query catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--json", help="Print the report as JSON", action="store_true")
+    parser.add_argument("--strict", help="Also fail on unused composite indexes", action="store_true")
+
+    args = parser.parse_args()
+    registry = load_registry(args.schema)
+    queries = load_catalog(args.catalog)
+
+    unknown = sorted({query.collection for query in queries} - set(registry.names))
+    if unknown:
+        parser.error(f"catalog references unknown collections: {', '.join(unknown)}")
+
+    report = analyze(queries, declared_indexes(registry))
+
+    if args.json:
+        print(json.dumps(report_to_json(report), indent=2))
+    else:
+        print_report(report)
+
+    if report["missing"] or (args.strict and report["unused"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
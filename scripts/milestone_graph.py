@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Milestone Prerequisite Graph for Zygo Platform
+Precomputes the prerequisite DAG of the milestones collection into milestone_graph, one
+document per period, so the app can load the graph once, cache it, and answer
+"what can this child work on next" from a single milestone_progress query.
+
+Each shard stores the period's milestones in topological order with their direct
+prerequisites, their transitive prerequisites (ancestors) and their age range. Cycles and
+prerequisites that point at unknown milestones are reported and left out of the graph.
+"""
+
+import heapq
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter, content_hash, sync_documents
+from schema_registry import SchemaRegistry, load_registry
+
+# Progress statuses that satisfy a prerequisite
+DONE_STATUSES = ("completed", "not_applicable")
+
+MILESTONE_FIELDS = ["prerequisites", "period", "start_months", "end_months"]
+
+
+class GraphError(ValueError):
+    """Raised when the graph cannot be stored"""
+
+
+class MilestoneGraph:
+    def __init__(self, milestones: Dict[str, Dict[str, Any]], external: Iterable[str] = ()):
+        """Build the DAG from {milestone_id: {prerequisites, period, start_months, end_months}}
+
+        ``external`` are valid milestone IDs that are not part of this (partially loaded)
+        graph; they still gate eligibility but are not nodes. Topological order uses Kahn's
+        algorithm with a heap keyed on (start_months, id), so the order is deterministic and
+        follows age where prerequisites allow. Ancestor sets are Python int bitsets over
+        topological positions, OR-ed along the order.
+        """
+        self.milestones = milestones
+        external = set(external)
+        self.missing: List[Tuple[str, str]] = []
+        self.prerequisites: Dict[str, Tuple[str, ...]] = {}
+        self.external_prerequisites: Dict[str, Tuple[str, ...]] = {}
+        for milestone_id, data in milestones.items():
+            known = []
+            outside = []
+            for prerequisite in data.get("prerequisites") or []:
+                if prerequisite in milestones:
+                    known.append(prerequisite)
+                elif prerequisite in external:
+                    outside.append(prerequisite)
+                else:
+                    self.missing.append((milestone_id, prerequisite))
+            self.prerequisites[milestone_id] = tuple(dict.fromkeys(known))
+            if outside:
+                self.external_prerequisites[milestone_id] = tuple(outside)
+
+        self.dependents: Dict[str, List[str]] = {milestone_id: [] for milestone_id in milestones}
+        for milestone_id, prerequisites in self.prerequisites.items():
+            for prerequisite in prerequisites:
+                self.dependents[prerequisite].append(milestone_id)
+
+        self.order = self._topological_order()
+        self.cycles = self._find_cycles() if len(self.order) < len(milestones) else []
+        self.position = {milestone_id: number for number, milestone_id in enumerate(self.order)}
+        self._ancestor_bits = self._closure()
+
+    def _sort_key(self, milestone_id: str) -> Tuple[float, str]:
+        return (self.milestones[milestone_id].get("start_months") or 0, milestone_id)
+
+    def _topological_order(self) -> List[str]:
+        remaining = {milestone_id: len(prerequisites) for milestone_id, prerequisites in self.prerequisites.items()}
+        ready = [self._sort_key(milestone_id) for milestone_id, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, milestone_id = heapq.heappop(ready)
+            order.append(milestone_id)
+            for dependent in self.dependents[milestone_id]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, self._sort_key(dependent))
+        return order
+
+    def _find_cycles(self) -> List[List[str]]:
+        """One representative cycle per strongly connected knot left over by Kahn's algorithm"""
+        ordered = set(self.order)
+        unresolved = [milestone_id for milestone_id in self.milestones if milestone_id not in ordered]
+        seen: Set[str] = set()
+        cycles = []
+        for start in sorted(unresolved):
+            if start in seen:
+                continue
+            # Every unresolved node has an unresolved prerequisite, so walking them must loop
+            path: List[str] = []
+            on_path: Dict[str, int] = {}
+            node = start
+            while node not in on_path and node not in seen:
+                on_path[node] = len(path)
+                path.append(node)
+                node = next(p for p in self.prerequisites[node] if p not in ordered)
+            if node in on_path:
+                cycles.append(path[on_path[node] :] + [node])
+            seen.update(path)
+        return cycles
+
+    def _closure(self) -> Dict[str, int]:
+        bits: Dict[str, int] = {}
+        for milestone_id in self.order:
+            value = 0
+            for prerequisite in self.prerequisites[milestone_id]:
+                value |= bits[prerequisite] | (1 << self.position[prerequisite])
+            bits[milestone_id] = value
+        return bits
+
+    def _decode(self, bits: int) -> List[str]:
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(self.order[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def ancestors(self, milestone_id: str) -> List[str]:
+        """Every transitive prerequisite of ``milestone_id`` in topological order"""
+        return self._decode(self._ancestor_bits.get(milestone_id, 0))
+
+    def shards(self) -> Dict[str, Dict[str, Any]]:
+        """milestone_graph documents keyed by period"""
+        graph_hash = content_hash({"prerequisites": {k: list(v) for k, v in self.prerequisites.items()}})
+        shards: Dict[str, Dict[str, Any]] = {}
+        for milestone_id in self.order:
+            data = self.milestones[milestone_id]
+            period = data.get("period") or "unassigned"
+            shard = shards.setdefault(
+                period,
+                {
+                    "period": period,
+                    "milestone_ids": [],
+                    "prerequisites": {},
+                    "ancestors": {},
+                    "age_ranges": {},
+                    "graph_hash": graph_hash,
+                },
+            )
+            shard["milestone_ids"].append(milestone_id)
+            shard["prerequisites"][milestone_id] = list(self.prerequisites[milestone_id])
+            shard["ancestors"][milestone_id] = self.ancestors(milestone_id)
+            shard["age_ranges"][milestone_id] = [data.get("start_months"), data.get("end_months")]
+        return shards
+
+    @classmethod
+    def from_shards(cls, shards: Iterable[Dict[str, Any]]) -> "MilestoneGraph":
+        """Rebuild the graph from stored shards, e.g. on app start
+
+        Prerequisites living in shards that were not loaded are kept as external IDs.
+        """
+        milestones = {}
+        referenced: Set[str] = set()
+        for shard in shards:
+            for milestone_id in shard["milestone_ids"]:
+                start_months, end_months = shard["age_ranges"][milestone_id]
+                milestones[milestone_id] = {
+                    "prerequisites": shard["prerequisites"][milestone_id],
+                    "period": shard["period"],
+                    "start_months": start_months,
+                    "end_months": end_months,
+                }
+                referenced.update(shard["prerequisites"][milestone_id])
+        return cls(milestones, external=referenced - milestones.keys())
+
+    def next_eligible(
+        self, done: Set[str], age_months: Optional[float] = None, lookahead_months: float = 3
+    ) -> List[str]:
+        """Milestones not yet done whose direct prerequisites are all done
+
+        With ``age_months`` only milestones whose age range overlaps
+        [age_months, age_months + lookahead_months] are returned. Pure in-memory work -
+        ``done`` usually comes from ``done_milestones``.
+        """
+        eligible = []
+        for milestone_id in self.order:
+            if milestone_id in done:
+                continue
+            prerequisites = self.prerequisites[milestone_id] + self.external_prerequisites.get(milestone_id, ())
+            if not all(prerequisite in done for prerequisite in prerequisites):
+                continue
+            if age_months is not None:
+                data = self.milestones[milestone_id]
+                start_months = data.get("start_months") or 0
+                end_months = data.get("end_months")
+                if start_months > age_months + lookahead_months:
+                    continue
+                if end_months is not None and end_months < age_months:
+                    continue
+            eligible.append(milestone_id)
+        return eligible
+
+    def blocking(self, milestone_id: str, done: Set[str]) -> List[str]:
+        """Transitive prerequisites of ``milestone_id`` within this graph that are still outstanding"""
+        return [ancestor for ancestor in self.ancestors(milestone_id) if ancestor not in done]
+
+
+def read_milestones(db) -> Dict[str, Dict[str, Any]]:
+    """The graph-relevant fields of every milestone - one projected read per document"""
+    milestones = {}
+    for snapshot in db.collection("milestones").select(MILESTONE_FIELDS).stream():
+        if snapshot.id != "_schema":
+            milestones[snapshot.id] = snapshot.to_dict() or {}
+    return milestones
+
+
+def store_graph(
+    db, graph: MilestoneGraph, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE
+) -> Dict[str, int]:
+    """Write the period shards, skipping unchanged ones and deleting shards of vanished periods"""
+    spec = (registry or load_registry()).collection("milestone_graph")
+    max_bytes = spec.settings.get("max_shard_bytes", 900000)
+    collection = db.collection("milestone_graph")
+    now = datetime.now(timezone.utc)
+
+    docs = []
+    for period, shard in graph.shards().items():
+        size = len(json.dumps(shard).encode("utf-8"))
+        if size > max_bytes:
+            raise GraphError(f"milestone_graph/{period} would be {size:,} bytes, over the {max_bytes:,} byte limit")
+        docs.append((collection.document(period), {**shard, "updated_at": now}))
+
+    writer = BatchedWriter(db, batch_size=batch_size)
+    counts = sync_documents(db, writer, docs)
+    periods = {doc_ref.id for doc_ref, _ in docs}
+    counts["deleted"] = 0
+    for snapshot in collection.select([]).stream():
+        if snapshot.id not in periods and snapshot.id != "_schema":
+            writer.delete(snapshot.reference)
+            counts["deleted"] += 1
+    writer.flush()
+    return counts
+
+
+def load_graph(db, periods: Optional[Iterable[str]] = None) -> MilestoneGraph:
+    """Load the stored graph - every shard, or only those of ``periods``"""
+    collection = db.collection("milestone_graph")
+    if periods is None:
+        snapshots = [snapshot for snapshot in collection.stream() if snapshot.id != "_schema"]
+    else:
+        snapshots = [snapshot for snapshot in db.get_all([collection.document(period) for period in periods])]
+    return MilestoneGraph.from_shards(snapshot.to_dict() for snapshot in snapshots if snapshot.exists)
+
+
+def done_milestones(db, family_member_id: str) -> Set[str]:
+    """Milestones a family member has completed or marked not applicable - a single query"""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        db.collection("milestone_progress")
+        .where(filter=FieldFilter("family_member_id", "==", family_member_id))
+        .where(filter=FieldFilter("status", "in", list(DONE_STATUSES)))
+        .select(["milestone_id"])
+    )
+    return {snapshot.get("milestone_id") for snapshot in query.stream()}
+
+
+def print_report(graph: MilestoneGraph):
+    edges = sum(len(prerequisites) for prerequisites in graph.prerequisites.values())
+    depth = max((len(graph.ancestors(milestone_id)) for milestone_id in graph.order), default=0)
+    print(f"🕸️  {len(graph.milestones):,} milestones, {edges:,} prerequisite edges, longest chain {depth}")
+    for milestone_id, prerequisite in graph.missing:
+        print(f"   ⚠️ {milestone_id}: unknown prerequisite {prerequisite}")
+    for cycle in graph.cycles:
+        print(f"   ❌ cycle: {' -> '.join(cycle)}")
+    unresolved = len(graph.milestones) - len(graph.order)
+    if unresolved:
+        print(f"   ❌ {unresolved} milestones are on or behind a cycle and were left out")
+
+
+def main():
+    """Build the milestone graph or list next-eligible milestones"""
+    import argparse
+    import os
+    import sys
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Build the Zygo milestone prerequisite graph")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--build", help="Rebuild milestone_graph from the milestones collection", action="store_true")
+    parser.add_argument("--dry-run", help="With --build, report on the graph without writing it", action="store_true")
+    parser.add_argument("--next", help="List next-eligible milestones for a family member ID", default=None)
+    parser.add_argument("--age-months", help="Child age in months for --next", type=float, default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+
+    if args.build:
+        graph = MilestoneGraph(read_milestones(db))
+        print_report(graph)
+        if not args.dry_run:
+            counts = store_graph(db, graph, batch_size=args.batch_size)
+            print(
+                f"✅ milestone_graph: {counts['created']} created, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged, {counts['deleted']} deleted"
+            )
+        if graph.cycles:
+            sys.exit(1)
+
+    if args.next:
+        graph = load_graph(db)
+        done = done_milestones(db, args.next)
+        eligible = graph.next_eligible(done, args.age_months)
+        print(f"🎯 {len(eligible)} eligible milestones for {args.next} ({len(done)} done)")
+        for milestone_id in eligible:
+            print(f"   {milestone_id}")
+
+
+if __name__ == "__main__":
+    main()
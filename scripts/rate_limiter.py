@@ -0,0 +1,26 @@
+"""
+Rate limiting for Zygo tooling
+Token bucket shared by worker threads that call rate-limited APIs (Firestore bulk loads,
+Firebase Auth admin calls).
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        """Token bucket shared by all writer threads; ``rate`` <= 0 disables limiting"""
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Reference Data Cache for Zygo Platform
+Keeps small, read-mostly collections (milestones, credential definitions and providers,
+service centers - every collection with a ``reference_cache`` setting in the registry) in
+memory, so request paths look them up without billed reads.
+
+Each collection is loaded once into slotted records generated from its registry fields and
+indexed on the fields listed in ``reference_cache.indexes``. With ``listen`` an on_snapshot
+listener applies every change as it happens; without it the whole collection is reloaded
+once it is older than ``ttl_seconds``. Collections with ``max_entries`` are not loaded
+fully but read through an LRU of that size, with ``ttl_seconds`` per entry.
+
+The cache can be saved to and warm-started from a gzip JSON snapshot on disk: a snapshot
+younger than ``max_snapshot_age`` is served without reading Firestore at all, an older one
+is served until the first load or listener snapshot replaces it.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_codec import decode_value, encode_value
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaRegistry, load_registry
+
+SNAPSHOT_VERSION = 1
+CACHE_SETTING = "reference_cache"
+
+
+class CacheError(Exception):
+    """Raised when a lookup cannot be answered by the cache"""
+
+
+class Record:
+    __slots__ = ("id",)
+    fields: Tuple[str, ...] = ()
+
+    def __init__(self, doc_id: str, data: Dict[str, Any]):
+        self.id = doc_id
+        for field in self.fields:
+            setattr(self, field, data.get(field))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id!r})"
+
+    def get(self, field: str, default: Any = None) -> Any:
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Declared fields that are set - undeclared fields are not kept"""
+        return {field: getattr(self, field) for field in self.fields if getattr(self, field) is not None}
+
+
+def record_class(spec: CollectionSpec) -> type:
+    """A Record subclass with one slot per declared field of ``spec``"""
+    name = "".join(part.title() for part in spec.name.split("_")) + "Record"
+    return type(name, (Record,), {"__slots__": tuple(spec.fields), "fields": tuple(spec.fields)})
+
+
+def cached_collections(registry: SchemaRegistry) -> List[CollectionSpec]:
+    """Collections the registry marks as cacheable reference data"""
+    return [spec for spec in registry if CACHE_SETTING in spec.settings]
+
+
+class CachedCollection:
+    def __init__(
+        self,
+        db,
+        spec: CollectionSpec,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        """One collection's records, indexes and hit/miss counters"""
+        settings = spec.settings.get(CACHE_SETTING, {})
+        self.db = db
+        self.name = spec.name
+        self.record_type = record_class(spec)
+        self.index_fields = tuple(settings.get("indexes", ()))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.get("ttl_seconds")
+        self.max_entries = max_entries if max_entries is not None else settings.get("max_entries")
+        # doc ID -> (record, loaded at); in LRU order when bounded
+        self.records: "OrderedDict[str, Tuple[Record, float]]" = OrderedDict()
+        self.indexes: Dict[str, Dict[Any, Dict[str, Record]]] = {field: {} for field in self.index_fields}
+        self.complete = False
+        self.loaded_at = 0.0
+        self.listening = False
+        self.ready = threading.Event()
+        self.stats = {"hits": 0, "misses": 0, "reads": 0, "changes": 0}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._watch = None
+        self._synced = False
+
+    @property
+    def bounded(self) -> bool:
+        return bool(self.max_entries)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _put(self, doc_id: str, data: Dict[str, Any], loaded_at: float):
+        self._drop(doc_id)
+        record = self.record_type(doc_id, data)
+        self.records[doc_id] = (record, loaded_at)
+        for field in self.index_fields:
+            value = getattr(record, field)
+            if value is not None:
+                self.indexes[field].setdefault(value, {})[doc_id] = record
+        if self.bounded:
+            while len(self.records) > self.max_entries:
+                self._drop(next(iter(self.records)))
+
+    def _drop(self, doc_id: str):
+        entry = self.records.pop(doc_id, None)
+        if entry is None:
+            return
+        for field in self.index_fields:
+            value = getattr(entry[0], field)
+            bucket = self.indexes[field].get(value)
+            if bucket is not None:
+                bucket.pop(doc_id, None)
+                if not bucket:
+                    del self.indexes[field][value]
+
+    def replace(self, documents: Iterable[Tuple[str, Dict[str, Any]]], loaded_at: Optional[float] = None):
+        """Swap in the full contents of the collection"""
+        loaded_at = loaded_at if loaded_at is not None else time.time()
+        with self._lock:
+            self.records = OrderedDict()
+            self.indexes = {field: {} for field in self.index_fields}
+            for doc_id, data in documents:
+                if doc_id != "_schema":
+                    self._put(doc_id, data, loaded_at)
+            self.complete = not self.bounded
+            self.loaded_at = loaded_at
+        self.ready.set()
+
+    def load(self):
+        """Read the whole collection - one billed read per document"""
+        documents = [(snapshot.id, snapshot.to_dict() or {}) for snapshot in self.db.collection(self.name).stream()]
+        with self._lock:
+            self.stats["reads"] += max(len(documents), 1)
+        self.replace(documents)
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        """Listener callback, run on the listener's thread"""
+        now = time.time()
+        with self._lock:
+            if not self._synced:
+                # The first snapshot is the whole collection
+                self._synced = True
+                self.stats["reads"] += max(len(snapshots), 1)
+                self.replace(((snapshot.id, snapshot.to_dict() or {}) for snapshot in snapshots), now)
+                return
+            self.stats["reads"] += len(changes)
+            for change in changes:
+                self.stats["changes"] += 1
+                document = change.document
+                if document.id == "_schema":
+                    continue
+                if change.type.name == "REMOVED":
+                    self._drop(document.id)
+                else:
+                    self._put(document.id, document.to_dict() or {}, now)
+            self.loaded_at = now
+
+    def listen(self):
+        """Keep the collection fresh with an on_snapshot listener (full collections only)"""
+        if self.bounded:
+            raise CacheError(f"{self.name}: bounded caches are read through, they cannot listen")
+        if self._watch is None:
+            self._synced = False
+            self.listening = True
+            self._watch = self.db.collection(self.name).on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+            self.listening = False
+
+    def _expired(self, loaded_at: float) -> bool:
+        return self.ttl_seconds is not None and not self.listening and time.time() - loaded_at > self.ttl_seconds
+
+    def _refresh(self):
+        """Load an unbounded collection on first use, and again once its contents expired"""
+        if self.bounded or self.listening or (self.complete and not self._expired(self.loaded_at)):
+            return
+        with self._load_lock:
+            # Threads that waited here find the collection loaded by the first one
+            if not self.complete or self._expired(self.loaded_at):
+                self.load()
+
+    def get(self, doc_id: str) -> Optional[Record]:
+        """Record ``doc_id``, or None if the document does not exist"""
+        self._refresh()
+        with self._lock:
+            entry = self.records.get(doc_id)
+            if entry is not None and not (self.bounded and self._expired(entry[1])):
+                self.stats["hits"] += 1
+                if self.bounded:
+                    self.records.move_to_end(doc_id)
+                return entry[0]
+            self.stats["misses"] += 1
+            if self.complete:
+                # A complete collection is authoritative: a miss costs no read
+                return None
+
+        snapshot = self.db.collection(self.name).document(doc_id).get()
+        with self._lock:
+            self.stats["reads"] += 1
+            if not snapshot.exists:
+                self._drop(doc_id)
+                return None
+            self._put(doc_id, snapshot.to_dict() or {}, time.time())
+            return self.records[doc_id][0]
+
+    def find(self, field: str, value: Any) -> List[Record]:
+        """Records whose ``field`` equals ``value``, in document ID order"""
+        if field not in self.index_fields:
+            raise CacheError(f"{self.name}.{field} is not indexed (add it to settings.{CACHE_SETTING}.indexes)")
+        self._refresh()
+        with self._lock:
+            if self.complete:
+                self.stats["hits"] += 1
+                return sorted(self.indexes[field].get(value, {}).values(), key=lambda record: record.id)
+            self.stats["misses"] += 1
+
+        # Bounded caches cannot know every match, so the query runs and refreshes the entries it returns
+        query = self.db.collection(self.name).where(filter=FieldFilter(field, "==", value))
+        snapshots = [snapshot for snapshot in query.stream() if snapshot.id != "_schema"]
+        now = time.time()
+        with self._lock:
+            self.stats["reads"] += max(len(snapshots), 1)
+            for snapshot in snapshots:
+                self._put(snapshot.id, snapshot.to_dict() or {}, now)
+        return sorted((self.record_type(s.id, s.to_dict() or {}) for s in snapshots), key=lambda record: record.id)
+
+    def export(self) -> Dict[str, Any]:
+        """Encoded records for an on-disk snapshot"""
+        with self._lock:
+            return {
+                "loaded_at": self.loaded_at,
+                "documents": {doc_id: encode_value(record.to_dict()) for doc_id, (record, _) in self.records.items()},
+            }
+
+    def all(self) -> List[Record]:
+        """Every record of a complete collection"""
+        self._refresh()
+        if not self.complete:
+            raise CacheError(f"{self.name} is a bounded cache and does not hold the whole collection")
+        with self._lock:
+            return [record for record, _ in self.records.values()]
+
+
+class ReferenceCache:
+    def __init__(
+        self,
+        db,
+        registry: SchemaRegistry = None,
+        collections: Optional[List[str]] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        """Caches for ``collections`` (default: every collection marked in the registry)"""
+        registry = registry or load_registry()
+        specs = cached_collections(registry)
+        if collections is not None:
+            specs = [registry.collection(name) for name in collections]
+        self.collections: Dict[str, CachedCollection] = {
+            spec.name: CachedCollection(db, spec, ttl_seconds, max_entries) for spec in specs
+        }
+
+    def __getitem__(self, collection: str) -> CachedCollection:
+        try:
+            return self.collections[collection]
+        except KeyError:
+            raise CacheError(f"'{collection}' is not cached") from None
+
+    def get(self, collection: str, doc_id: str) -> Optional[Record]:
+        return self[collection].get(doc_id)
+
+    def find(self, collection: str, field: str, value: Any) -> List[Record]:
+        return self[collection].find(field, value)
+
+    def load(self):
+        """Read every unbounded collection now instead of on first access"""
+        for cached in self.collections.values():
+            if not cached.bounded:
+                cached.load()
+
+    def listen(self, timeout: Optional[float] = 30.0) -> bool:
+        """Attach listeners to every unbounded collection; True once all delivered their first snapshot"""
+        listened = [cached for cached in self.collections.values() if not cached.bounded]
+        for cached in listened:
+            cached.listen()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for cached in listened:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not cached.ready.wait(remaining):
+                return False
+        return True
+
+    def stop(self):
+        for cached in self.collections.values():
+            cached.stop()
+
+    def save(self, path: str):
+        """Write the unbounded collections to a gzip JSON snapshot, atomically"""
+        snapshot: Dict[str, Any] = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "collections": {},
+        }
+        for name, cached in self.collections.items():
+            if cached.complete:
+                snapshot["collections"][name] = cached.export()
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def warm_start(self, path: str, max_snapshot_age: Optional[float] = None) -> List[str]:
+        """Fill collections from a snapshot; returns the ones fresh enough to skip loading"""
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return []
+
+        fresh = []
+        for name, saved in snapshot["collections"].items():
+            cached = self.collections.get(name)
+            if cached is None or cached.bounded:
+                continue
+            documents = ((doc_id, decode_value(data)) for doc_id, data in saved["documents"].items())
+            cached.replace(documents, saved["loaded_at"])
+            if max_snapshot_age is not None and time.time() - saved["loaded_at"] <= max_snapshot_age:
+                fresh.append(name)
+            else:
+                # Not authoritative: hits are served, misses read Firestore until a load or the
+                # first listener snapshot replaces it
+                cached.complete = False
+        return fresh
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: dict(
+                cached.stats,
+                records=len(cached),
+                complete=cached.complete,
+                listening=cached.listening,
+                indexes={field: len(values) for field, values in cached.indexes.items()},
+            )
+            for name, cached in self.collections.items()
+        }
+
+
+def main():
+    """Load the reference data cache, optionally listening for changes, and save a snapshot"""
+    import argparse
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Warm and inspect the Zygo reference data cache")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--collection", help="Only cache these collections", action="append", default=None)
+    parser.add_argument("--snapshot", help="Warm-start from and save to this .json.gz file", default=None)
+    parser.add_argument("--max-snapshot-age", help="Seconds a snapshot is trusted without reloading", type=float)
+    parser.add_argument("--listen", help="Keep listening for changes for N seconds", type=float, default=0)
+    parser.add_argument("--find", help="Look up collection.field=value", action="append", default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    cache = ReferenceCache(firestore.client(), load_registry(args.schema), args.collection)
+    fresh = cache.warm_start(args.snapshot, args.max_snapshot_age) if args.snapshot else []
+    if fresh:
+        print(f"♻️ Warm start from {args.snapshot}: {', '.join(fresh)}")
+
+    started = time.monotonic()
+    if args.listen:
+        if not cache.listen():
+            print("⚠️ Not every listener delivered its first snapshot in time")
+    else:
+        for name, cached in cache.collections.items():
+            if name not in fresh and not cached.bounded:
+                cached.load()
+    print(f"📚 Reference data ready in {time.monotonic() - started:.2f}s")
+
+    for lookup in args.find or []:
+        target, _, value = lookup.partition("=")
+        collection, _, field = target.partition(".")
+        records = cache.find(collection, field, value)
+        print(f"🔎 {lookup}: {len(records)} records")
+        for record in records[:10]:
+            print(f"   {record.id}: {record.to_dict()}")
+
+    if args.listen:
+        time.sleep(args.listen)
+        cache.stop()
+
+    for name, stats in cache.stats().items():
+        indexes = ", ".join(f"{field} ({count} values)" for field, count in stats["indexes"].items())
+        print(f"   {name}: {stats['records']:,} records, {stats['reads']:,} reads, {stats['changes']} changes")
+        if indexes:
+            print(f"      indexed by {indexes}")
+    if args.snapshot:
+        cache.save(args.snapshot)
+        print(f"💾 Saved snapshot to {args.snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Referential Integrity Checker for Zygo Platform
+Finds dangling string foreign keys (educators.actor_id, milestone_progress.milestone_id, ...)
+for every reference declared in the schema registry, subcollections included.
+
+Each referenced collection is streamed once, IDs only, into a compact in-memory set: a
+sorted array of 64-bit ID hashes (8 bytes per document), or a Bloom filter for collections
+larger than ``bloom_above``. Each referencing collection is then streamed once, projected to
+its reference fields, and checked a page at a time with vectorized lookups, so a full check
+costs one read per document and never a get() per reference.
+
+Hash collisions and Bloom false positives can only hide a dangling reference, never report
+a valid one, so repairs are safe. Repair modes, applied per page with batched writes:
+    clear       set dangling scalar references to null, remove dangling array entries
+    quarantine  move documents with dangling references to _quarantine/{path with __}
+"""
+
+import hashlib
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from firestore_export import paginate, partition_queries
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaRegistry, load_registry
+
+REPAIR_MODES = ("clear", "quarantine")
+QUARANTINE_COLLECTION = "_quarantine"
+
+
+class IntegrityError(Exception):
+    """Raised when the integrity check cannot run"""
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise IntegrityError("numpy is required for integrity checks: pip install numpy") from e
+    return np
+
+
+def hash_ids(ids: List[str], digest_size: int = 8):
+    """uint64 hashes of ``ids`` (two columns when ``digest_size`` is 16)"""
+    np = _numpy()
+    digests = b"".join(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=digest_size).digest() for doc_id in ids)
+    hashes = np.frombuffer(digests, dtype="<u8")
+    return hashes.reshape(-1, digest_size // 8) if digest_size > 8 else hashes
+
+
+class SortedIdSet:
+    def __init__(self):
+        """Exact-enough ID set: sorted unique 64-bit hashes, searched with searchsorted"""
+        self._chunks: List[Any] = []
+        self._hashes = None
+
+    def add(self, ids: List[str]):
+        self._chunks.append(hash_ids(ids))
+
+    def freeze(self):
+        np = _numpy()
+        self._hashes = np.unique(np.concatenate(self._chunks)) if self._chunks else np.empty(0, dtype="<u8")
+        self._chunks = []
+
+    def __len__(self):
+        return len(self._hashes)
+
+    @property
+    def nbytes(self) -> int:
+        return self._hashes.nbytes
+
+    def contains(self, ids: List[str]):
+        """Boolean array: which of ``ids`` are in the set"""
+        np = _numpy()
+        hashes = hash_ids(ids)
+        if not len(self._hashes):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.searchsorted(self._hashes, hashes).clip(max=len(self._hashes) - 1)
+        return self._hashes[positions] == hashes
+
+
+class BloomIdSet:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """Bloom filter sized for ``capacity`` IDs at ``error_rate`` false positives"""
+        np = _numpy()
+        capacity = max(capacity, 1)
+        self.bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self._count = 0
+
+    def _positions(self, ids: List[str]):
+        np = _numpy()
+        # Double hashing: position_i = h1 + i * h2
+        pairs = hash_ids(ids, digest_size=16)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (pairs[:, :1] + steps * pairs[:, 1:]) % np.uint64(self.bits)
+
+    def add(self, ids: List[str]):
+        np = _numpy()
+        positions = self._positions(ids).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self._array, positions >> np.uint64(3), masks)
+        self._count += len(ids)
+
+    def freeze(self):
+        pass
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._array.nbytes
+
+    def contains(self, ids: List[str]):
+        np = _numpy()
+        positions = self._positions(ids)
+        bits = (self._array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+
+class Relation:
+    __slots__ = ("collection", "field", "target", "is_array")
+
+    def __init__(self, collection: str, field: str, target: str, is_array: bool):
+        """A declared foreign key: ``collection.field`` holds IDs of ``target``"""
+        self.collection = collection
+        self.field = field
+        self.target = target
+        self.is_array = is_array
+
+    @property
+    def name(self) -> str:
+        return f"{self.collection}.{self.field} -> {self.target}"
+
+
+def relations(registry: SchemaRegistry) -> List[Relation]:
+    """Every reference in the registry, subcollections (as collection groups) included"""
+    found: List[Relation] = []
+
+    def add(spec: CollectionSpec):
+        for field, target in spec.references.items():
+            found.append(Relation(spec.name, field, target, spec.fields[field].type == "array"))
+        for sub in spec.subcollections.values():
+            add(sub)
+
+    for spec in registry:
+        add(spec)
+    return found
+
+
+class IntegrityChecker:
+    def __init__(
+        self,
+        db,
+        workers: int = 8,
+        partitions: int = 8,
+        page_size: int = 1000,
+        bloom_above: int = 20_000_000,
+        samples: int = 10,
+        repair: Optional[str] = None,
+        batch_size: int = MAX_BATCH_SIZE,
+    ):
+        """Check (and optionally repair) references against ID sets built in memory"""
+        if repair is not None and repair not in REPAIR_MODES:
+            raise IntegrityError(f"Unknown repair mode '{repair}' (choose from {', '.join(REPAIR_MODES)})")
+        _numpy()
+        self.db = db
+        self.workers = workers
+        self.partitions = partitions
+        self.page_size = page_size
+        self.bloom_above = bloom_above
+        self.samples = samples
+        self.repair = repair
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def _stream(self, pool, collection: str, fields: List[str], handle):
+        """Run ``handle(page)`` for every page of ``collection`` across its partitions"""
+
+        def scan(query):
+            for page in paginate(query.select(fields), self.page_size):
+                handle(page)
+
+        futures = [pool.submit(scan, query) for query in partition_queries(self.db, collection, self.partitions)]
+        for future in futures:
+            future.result()
+
+    def build_id_set(self, pool, collection: str):
+        """IDs of every document in ``collection``, streamed once with an empty projection"""
+        count = self.db.collection(collection).count().get()[0][0].value
+        id_set = BloomIdSet(count) if count > self.bloom_above else SortedIdSet()
+
+        def handle(page):
+            ids = [snapshot.id for snapshot in page if snapshot.id != "_schema"]
+            with self._lock:
+                id_set.add(ids)
+
+        self._stream(pool, collection, [], handle)
+        id_set.freeze()
+        return id_set
+
+    def _check_page(self, page, checks: List[Tuple[Relation, Any]], report: Dict[str, Dict[str, Any]], writer):
+        dangling_by_doc: Dict[str, Tuple[Any, Dict[str, List[str]]]] = {}
+        for relation, id_set in checks:
+            owners, values = [], []
+            for snapshot in page:
+                if snapshot.id == "_schema":
+                    continue
+                value = (snapshot.to_dict() or {}).get(relation.field)
+                if relation.is_array and isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, str) and item:
+                            owners.append(snapshot)
+                            values.append(item)
+                elif isinstance(value, str) and value:
+                    owners.append(snapshot)
+                    values.append(value)
+            if not values:
+                continue
+            found = id_set.contains(values)
+            entry = report[relation.name]
+            with self._lock:
+                entry["checked"] += len(values)
+                for snapshot, value, ok in zip(owners, values, found):
+                    if ok:
+                        continue
+                    entry["dangling"] += 1
+                    if len(entry["samples"]) < self.samples:
+                        entry["samples"].append(f"{snapshot.reference.path} -> {value}")
+                    dangling_by_doc.setdefault(snapshot.reference.path, (snapshot.reference, {}))[1].setdefault(
+                        relation.field, []
+                    ).append(value)
+
+        if writer is not None and dangling_by_doc:
+            self._repair(dangling_by_doc, checks, writer)
+
+    def _repair(self, dangling_by_doc, checks: List[Tuple[Relation, Any]], writer):
+        from firebase_admin import firestore
+
+        arrays = {relation.field for relation, _ in checks if relation.is_array}
+        if self.repair == "clear":
+            with self._lock:
+                for doc_ref, fields in dangling_by_doc.values():
+                    writer.update(
+                        doc_ref,
+                        {
+                            field: firestore.ArrayRemove(values) if field in arrays else None
+                            for field, values in fields.items()
+                        },
+                    )
+            return
+
+        # Quarantine keeps the full document, fetched in one batched read per page
+        now = datetime.now(timezone.utc)
+        snapshots = list(self.db.get_all([ref for ref, _ in dangling_by_doc.values()]))
+        with self._lock:
+            for snapshot in snapshots:
+                if not snapshot.exists:
+                    continue
+                path = snapshot.reference.path
+                quarantined = {
+                    "path": path,
+                    "data": snapshot.to_dict(),
+                    "dangling": dangling_by_doc[path][1],
+                    "quarantined_at": now,
+                }
+                writer.set(self.db.collection(QUARANTINE_COLLECTION).document(path.replace("/", "__")), quarantined)
+                writer.delete(snapshot.reference)
+
+    def run(self, checked: List[Relation]) -> Dict[str, Any]:
+        """Check ``checked`` relations; per relation counts and sample dangling references"""
+        started = time.monotonic()
+        report = {relation.name: {"checked": 0, "dangling": 0, "samples": []} for relation in checked}
+        id_sets: Dict[str, Dict[str, Any]] = {}
+        by_collection: Dict[str, List[Relation]] = {}
+        for relation in checked:
+            by_collection.setdefault(relation.collection, []).append(relation)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            sets = {}
+            for target in sorted({relation.target for relation in checked}):
+                sets[target] = self.build_id_set(pool, target)
+                id_sets[target] = {
+                    "documents": len(sets[target]),
+                    "kind": type(sets[target]).__name__,
+                    "bytes": sets[target].nbytes,
+                }
+                print(f"   🧮 {target}: {len(sets[target]):,} IDs in {sets[target].nbytes / 1e6:,.1f} MB")
+
+            writer = BatchedWriter(self.db, batch_size=self.batch_size) if self.repair else None
+            for collection, collection_relations in by_collection.items():
+                checks = [(relation, sets[relation.target]) for relation in collection_relations]
+                fields = sorted({relation.field for relation in collection_relations})
+
+                def handle(page, checks=checks):
+                    self._check_page(page, checks, report, writer)
+
+                self._stream(pool, collection, fields, handle)
+            if writer is not None:
+                writer.flush()
+
+        return {"seconds": time.monotonic() - started, "id_sets": id_sets, "relations": report}
+
+
+def main():
+    """Check the references declared in the schema registry"""
+    import argparse
+    import json
+    import os
+    import sys
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Check Zygo referential integrity")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--relation", help="Only check collection.field (repeatable)", action="append", default=None)
+    parser.add_argument("--repair", help="Fix dangling references", choices=REPAIR_MODES, default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--partitions", help="Document-ID ranges per collection", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--bloom-above", help="Use a Bloom filter for larger collections", type=int, default=20_000_000)
+    parser.add_argument("--samples", help="Dangling references kept per relation", type=int, default=10)
+    parser.add_argument("--output", help="Write the report JSON here", default=None)
+
+    args = parser.parse_args()
+
+    checked = relations(load_registry(args.schema))
+    if args.relation:
+        wanted = set(args.relation)
+        unknown = wanted - {f"{relation.collection}.{relation.field}" for relation in checked}
+        if unknown:
+            parser.error(f"unknown relations: {', '.join(sorted(unknown))}")
+        checked = [relation for relation in checked if f"{relation.collection}.{relation.field}" in wanted]
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+
+    print(f"🔗 Checking {len(checked)} relations...")
+    checker = IntegrityChecker(
+        firestore.client(),
+        workers=args.workers,
+        partitions=args.partitions,
+        page_size=args.page_size,
+        bloom_above=args.bloom_above,
+        samples=args.samples,
+        repair=args.repair,
+    )
+    result = checker.run(checked)
+
+    dangling = 0
+    for name, entry in result["relations"].items():
+        dangling += entry["dangling"]
+        marker = "⚠️" if entry["dangling"] else "✅"
+        print(f"{marker} {name}: {entry['dangling']:,} dangling of {entry['checked']:,}")
+        for sample in entry["samples"]:
+            print(f"   {sample}")
+    action = {"clear": " (cleared)", "quarantine": f" (moved to {QUARANTINE_COLLECTION})"}.get(args.repair, "")
+    print(f"⏱️ {dangling:,} dangling references{action} in {result['seconds']:.1f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    if dangling and not args.repair:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Security Rules Emulator Tests for Zygo Platform
+Loads the generated firestore.rules into the local Firestore emulator and checks, for every
+collection with an access policy, that each operation is allowed for exactly the actors the
+policy names and denied for everyone else. Requests go through the REST API with unsigned
+ID tokens carrying the same "zygo" custom claims custom_claims.py sets in production.
+
+Besides allow/deny, every rule path reports its document access calls (get/exists, counted
+statically from the rules) and the emulator's evaluation latency, and the run fails when a
+rule exceeds the access limits.
+
+Only runs against the emulator (FIRESTORE_EMULATOR_HOST must be set).
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from custom_claims import CLAIMS_KEY
+from emulator_utils import clear_emulator, percentile
+from firestore_rules import (
+    OPERATIONS,
+    SCOPED_POLICIES,
+    check_document_calls,
+    count_document_calls,
+    operation_policies,
+    path_variable,
+    render_rules,
+    scope_field,
+)
+from schema_registry import DEFAULT_SCHEMA_PATH, CollectionSpec, SchemaRegistry, load_registry
+
+OWNER_ID = "actor-owner"
+PROFILE_ID = "profile-1"
+MEMBER_ID = "member-1"
+
+# Test actors: uid (None = signed out) and zygo claims
+ACTORS = {
+    "anonymous": (None, None),
+    "stranger": ("actor-stranger", {"type": "community_member", "verified": False}),
+    "owner": (OWNER_ID, {"type": "community_member", "verified": False}),
+    "profile": ("actor-parent", {"type": "community_member", "verified": False, "profiles": [PROFILE_ID]}),
+    "family_member": ("actor-relative", {"type": "community_member", "verified": False, "members": [MEMBER_ID]}),
+    "verified_provider": ("actor-provider", {"type": "service_provider", "verified": True}),
+}
+SCOPE_VALUES = {"owner": OWNER_ID, "profile": PROFILE_ID, "family_member": MEMBER_ID}
+# IDs no test actor owns or belongs to
+FOREIGN_VALUES = {"owner": "actor-other", "profile": "profile-other", "family_member": "member-other"}
+
+
+def unsigned_token(uid: str, claims: Dict[str, Any], project_id: str) -> str:
+    """An alg=none ID token - the emulator accepts these, production never does"""
+    now = int(time.time())
+    header = {"alg": "none", "typ": "JWT"}
+    payload = {
+        "iss": f"https://securetoken.google.com/{project_id}",
+        "aud": project_id,
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+        "sub": uid,
+        "user_id": uid,
+        "firebase": {"sign_in_provider": "custom", "identities": {}},
+        CLAIMS_KEY: claims,
+    }
+
+    def encode(part: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(part).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+    return f"{encode(header)}.{encode(payload)}."
+
+
+def encode_value(value: Any) -> Dict[str, Any]:
+    """A Python value as a Firestore REST Value"""
+    if value is None:
+        return {"nullValue": None}
+    if isinstance(value, bool):
+        return {"booleanValue": value}
+    if isinstance(value, int):
+        return {"integerValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, datetime):
+        return {"timestampValue": value.isoformat()}
+    if isinstance(value, dict):
+        return {"mapValue": {"fields": {key: encode_value(item) for key, item in value.items()}}}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [encode_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class RuleCase:
+    __slots__ = ("path", "rule_path", "operation", "actor", "data", "expected", "stored")
+
+    def __init__(
+        self,
+        path: str,
+        rule_path: str,
+        operation: str,
+        actor: str,
+        data: Dict[str, Any],
+        expected: bool,
+        stored: Optional[Dict[str, Any]] = None,
+    ):
+        """One request and whether the rules must allow it; ``stored`` is the document seeded
+        before the request (default ``data``)"""
+        self.path = path
+        self.rule_path = rule_path
+        self.operation = operation
+        self.actor = actor
+        self.data = data
+        self.expected = expected
+        self.stored = stored if stored is not None else data
+
+
+def allowed_actors(policies: Optional[List[str]]) -> set:
+    """Test actors a policy list lets through
+
+    Raw expressions are not modelled; the seeded documents never satisfy them, so they
+    must not widen access for any actor.
+    """
+    allowed = set()
+    for policy in policies or ():
+        if policy == "public":
+            return set(ACTORS)
+        if policy == "authenticated":
+            allowed.update(actor for actor, (uid, _) in ACTORS.items() if uid is not None)
+        elif policy in ACTORS:
+            allowed.add(policy)
+    return allowed
+
+
+def _document(spec: CollectionSpec) -> Tuple[str, Dict[str, Any]]:
+    """(document ID, data) that satisfies every scoped policy of ``spec``"""
+    doc_id, data = "doc-1", {}
+    used = {policy for operation in OPERATIONS for policy in operation_policies(spec, operation) or ()}
+    for policy in SCOPED_POLICIES:
+        if policy not in used:
+            continue
+        field = scope_field(spec, policy)
+        if field == "$id":
+            doc_id = SCOPE_VALUES[policy]
+        elif field != "$parent":
+            data[field] = SCOPE_VALUES[policy]
+    data["created_at"] = datetime(2024, 1, 1)
+    return doc_id, data
+
+
+def build_cases(registry: SchemaRegistry) -> List[RuleCase]:
+    """Every (collection, operation, actor) combination of the registry's access policies"""
+    cases = []
+
+    def add(spec: CollectionSpec, prefix: str, rule_prefix: str):
+        doc_id, data = _document(spec)
+        path = f"{prefix}{spec.name}/{doc_id}"
+        # Same form as the match paths count_document_calls reports
+        rule_path = f"{rule_prefix}/{spec.name}/{{{path_variable(spec.name)}}}"
+        for operation in OPERATIONS:
+            allowed = allowed_actors(operation_policies(spec, operation))
+            for actor in ACTORS:
+                cases.append(RuleCase(path, rule_path, operation, actor, data, actor in allowed))
+
+        # Updates must not move a document into a scope its writer does not hold
+        update_policies = operation_policies(spec, "update") or ()
+        if "public" not in update_policies and "authenticated" not in update_policies:
+            for policy in update_policies:
+                if policy not in SCOPED_POLICIES or scope_field(spec, policy).startswith("$"):
+                    continue
+                moved = dict(data, **{scope_field(spec, policy): FOREIGN_VALUES[policy]})
+                for actor in allowed_actors(update_policies):
+                    cases.append(RuleCase(path, rule_path, "update", actor, moved, False, stored=data))
+        for sub in spec.subcollections.values():
+            if sub.access:
+                add(sub, f"{path}/", rule_path)
+
+    for name in registry.collections:
+        spec = registry.collection(name)
+        if spec.access or any(sub.access for sub in spec.subcollections.values()):
+            add(spec, "", "")
+    return cases
+
+
+class RulesEmulator:
+    def __init__(self, host: str, project_id: str):
+        """REST client for the Firestore emulator"""
+        self.host = host
+        self.project_id = project_id
+        self.documents_url = f"http://{host}/v1/projects/{project_id}/databases/(default)/documents"
+
+    def _request(self, method: str, url: str, body: Any = None, token: Optional[str] = None) -> int:
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def load_rules(self, rules: str):
+        url = f"http://{self.host}/emulator/v1/projects/{self.project_id}:securityRules"
+        status = self._request("PUT", url, {"rules": {"files": [{"name": "firestore.rules", "content": rules}]}})
+        if status != 200:
+            raise RuntimeError(f"Emulator rejected the rules (HTTP {status})")
+
+    def coverage(self) -> Dict[str, Any]:
+        """The emulator's rule coverage report for every request made so far"""
+        url = f"http://{self.host}/emulator/v1/projects/{self.project_id}:ruleCoverage"
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read())
+
+    def _url(self, path: str, **params: str) -> str:
+        query = f"?{urllib.parse.urlencode(params)}" if params else ""
+        return f"{self.documents_url}/{path}{query}"
+
+    def admin_set(self, path: str, data: Dict[str, Any]):
+        # "Bearer owner" bypasses security rules on the emulator
+        self._request("PATCH", self._url(path), {"fields": encode_value(data)["mapValue"]["fields"]}, "owner")
+
+    def admin_delete(self, path: str):
+        self._request("DELETE", self._url(path), token="owner")
+
+    def attempt(self, case: RuleCase) -> Tuple[bool, float]:
+        """Run ``case`` as its actor; (allowed, seconds)"""
+        if case.operation == "create":
+            self.admin_delete(case.path)
+        else:
+            self.admin_set(case.path, case.stored)
+
+        uid, claims = ACTORS[case.actor]
+        token = unsigned_token(uid, claims, self.project_id) if uid else None
+        fields = {"fields": encode_value(case.data)["mapValue"]["fields"]}
+        start = time.perf_counter()
+        if case.operation == "read":
+            status = self._request("GET", self._url(case.path), token=token)
+        elif case.operation == "create":
+            status = self._request("PATCH", self._url(case.path, **{"currentDocument.exists": "false"}), fields, token)
+        elif case.operation == "update":
+            status = self._request("PATCH", self._url(case.path, **{"currentDocument.exists": "true"}), fields, token)
+        else:
+            status = self._request("DELETE", self._url(case.path), token=token)
+        elapsed = time.perf_counter() - start
+        if status not in (200, 403):
+            raise RuntimeError(f"{case.operation} {case.path} as {case.actor}: unexpected HTTP {status}")
+        return status == 200, elapsed
+
+
+def run_cases(emulator: RulesEmulator, cases: List[RuleCase]) -> Dict[str, Any]:
+    """Run every case; failures and per rule path latency"""
+    failures = []
+    timings: Dict[str, List[float]] = {}
+    for case in cases:
+        allowed, elapsed = emulator.attempt(case)
+        timings.setdefault(case.rule_path, []).append(elapsed * 1000)
+        if allowed != case.expected:
+            expected = "allowed" if case.expected else "denied"
+            failures.append(f"{case.rule_path} {case.operation} as {case.actor}: expected {expected}")
+    latency = {
+        path: {"p50_ms": round(percentile(sorted(values), 50), 2), "max_ms": round(max(values), 2)}
+        for path, values in timings.items()
+    }
+    return {"cases": len(cases), "failures": failures, "latency": latency}
+
+
+def main():
+    """Test the generated security rules against the Firestore emulator"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Test Zygo security rules against the Firestore emulator")
+    parser.add_argument("--project-id", help="Emulator project ID", default="zygo-rules-test")
+    parser.add_argument("--schema", help="Path to the schema registry definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--collection", help="Only test these collections", action="append", default=None)
+    parser.add_argument("--coverage", help="Write the emulator's rule coverage report JSON here", default=None)
+
+    args = parser.parse_args()
+
+    host = os.environ.get("FIRESTORE_EMULATOR_HOST")
+    if not host:
+        parser.error("FIRESTORE_EMULATOR_HOST is not set - rules tests only run against the emulator")
+
+    registry = load_registry(args.schema)
+    rules = render_rules(registry)
+    emulator = RulesEmulator(host, args.project_id)
+    clear_emulator(host, args.project_id)
+    emulator.load_rules(rules)
+
+    cases = build_cases(registry)
+    if args.collection:
+        cases = [case for case in cases if case.path.split("/")[0] in args.collection]
+    print(f"🧪 Running {len(cases):,} rule cases...")
+    result = run_cases(emulator, cases)
+
+    calls = count_document_calls(rules)
+    errors, warnings = check_document_calls(calls)
+    for path, latency in sorted(result["latency"].items()):
+        access = max(calls.get(path, {}).values(), default=0)
+        print(f"   {path}: {access} document access calls, p50 {latency['p50_ms']}ms, max {latency['max_ms']}ms")
+    for warning in warnings:
+        print(f"   ⚠️ {warning}")
+    for error in errors:
+        print(f"   ❌ {error}")
+    for failure in result["failures"]:
+        print(f"   ❌ {failure}")
+
+    if args.coverage:
+        with open(args.coverage, "w", encoding="utf-8") as f:
+            json.dump(emulator.coverage(), f, indent=2)
+        print(f"📄 Rule coverage report written to {args.coverage}")
+
+    if result["failures"] or errors:
+        sys.exit(1)
+    print(f"✅ {result['cases']:,} cases passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Zygo Schema Registry
+Loads the declarative collection definitions once into a compact in-memory model.
+
+The registry only depends on the standard library, so validators, index generators and
+load generators can use it without importing firebase_admin or touching Firestore.
+"""
+
+import importlib.util
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "zygo_collections.json")
+
+FIELD_TYPES = ("string", "number", "boolean", "timestamp", "object", "array")
+
+# "verified|pending|unverified" style descriptions are enumerations
+_ENUM_PATTERN = re.compile(r"^[a-z0-9_]+(\|[a-z0-9_]+)+$")
+
+
+class SchemaError(ValueError):
+    """Raised when a schema definition is malformed"""
+
+
+class FieldSpec:
+    __slots__ = ("name", "type", "description", "enum", "reference", "raw")
+
+    def __init__(self, name: str, raw: str, reference: Optional[str] = None):
+        """Parse a ``"type - description"`` field string"""
+        type_name, _, description = raw.partition(" - ")
+        type_name = type_name.strip()
+        if type_name not in FIELD_TYPES:
+            raise SchemaError(f"Field '{name}' has unknown type '{type_name}'")
+
+        description = description.strip()
+        self.name = name
+        self.type = type_name
+        self.description = description
+        self.enum = tuple(description.split("|")) if _ENUM_PATTERN.match(description) else None
+        self.reference = reference
+        self.raw = raw
+
+    def __repr__(self):
+        return f"FieldSpec({self.name!r}, {self.raw!r})"
+
+
+class CollectionSpec:
+    __slots__ = (
+        "name",
+        "group",
+        "description",
+        "fields",
+        "indexes_needed",
+        "references",
+        "settings",
+        "access",
+        "subcollections",
+    )
+
+    def __init__(self, name: str, group: str, definition: Dict[str, Any]):
+        """Build a collection (or subcollection) from its registry definition"""
+        references = definition.get("references", {})
+        fields = definition.get("fields", {})
+        unknown = set(references) - set(fields)
+        if unknown:
+            raise SchemaError(f"Collection '{name}' references undeclared fields: {sorted(unknown)}")
+
+        self.name = name
+        self.group = group
+        self.description = definition.get("description", "")
+        self.fields = {field: FieldSpec(field, raw, references.get(field)) for field, raw in fields.items()}
+        self.indexes_needed = tuple(definition.get("indexes_needed", ()))
+        self.references = dict(references)
+        # Free-form tuning knobs for tooling, e.g. the shard count of a counter subcollection
+        self.settings = dict(definition.get("settings", {}))
+        # Security rules policy per operation, rendered by firestore_rules.py
+        self.access = dict(definition.get("access", {}))
+        self.subcollections = {
+            sub["name"]: CollectionSpec(sub["name"], group, sub) for sub in definition.get("subcollections", [])
+        }
+
+    def __repr__(self):
+        return f"CollectionSpec({self.name!r})"
+
+    def schema_doc(self) -> Dict[str, Any]:
+        """The ``_schema`` document stored in Firestore for this collection"""
+        doc = {
+            "id": "SCHEMA_DOC",
+            "description": self.description,
+            "fields": {name: field.raw for name, field in self.fields.items()},
+        }
+        if self.indexes_needed:
+            doc["indexes_needed"] = list(self.indexes_needed)
+        if self.settings:
+            doc["settings"] = dict(self.settings)
+        if self.access:
+            doc["access"] = dict(self.access)
+        if self.subcollections:
+            doc["subcollections"] = {}
+            for name, sub in self.subcollections.items():
+                sub_doc = sub.schema_doc()
+                del sub_doc["id"]
+                doc["subcollections"][name] = sub_doc
+        return doc
+
+    def subcollection(self, name: str) -> "CollectionSpec":
+        """Look up a subcollection by name"""
+        try:
+            return self.subcollections[name]
+        except KeyError:
+            raise SchemaError(f"Collection '{self.name}' has no subcollection '{name}'") from None
+
+
+class SchemaRegistry:
+    __slots__ = ("version", "groups", "collections")
+
+    def __init__(self, definition: Dict[str, Any]):
+        """Build the registry from the parsed schema definition"""
+        self.version = definition.get("version", 1)
+        self.groups: Dict[str, Tuple[str, ...]] = {}
+        self.collections: Dict[str, CollectionSpec] = {}
+
+        for group in definition.get("groups", []):
+            names = []
+            for collection in group.get("collections", []):
+                name = collection["name"]
+                if name in self.collections:
+                    raise SchemaError(f"Collection '{name}' is declared twice")
+                self.collections[name] = CollectionSpec(name, group["name"], collection)
+                names.append(name)
+            self.groups[group["name"]] = tuple(names)
+
+        for collection in self.collections.values():
+            for field, target in collection.references.items():
+                if target not in self.collections:
+                    raise SchemaError(f"{collection.name}.{field} references unknown collection '{target}'")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.collections
+
+    def __iter__(self) -> Iterator[CollectionSpec]:
+        return iter(self.collections.values())
+
+    @property
+    def names(self) -> List[str]:
+        """Collection names in declaration order"""
+        return list(self.collections)
+
+    def collection(self, name: str) -> CollectionSpec:
+        """Look up a collection by name"""
+        try:
+            return self.collections[name]
+        except KeyError:
+            raise SchemaError(f"Unknown collection '{name}'") from None
+
+    def group(self, name: str) -> List[CollectionSpec]:
+        """Collections belonging to a setup group, in declaration order"""
+        if name not in self.groups:
+            raise SchemaError(f"Unknown group '{name}'")
+        return [self.collections[collection] for collection in self.groups[name]]
+
+    def references(self) -> List[Tuple[str, str, str]]:
+        """Every (collection, field, target collection) foreign key in the schema"""
+        return [
+            (collection.name, field, target)
+            for collection in self.collections.values()
+            for field, target in collection.references.items()
+        ]
+
+    def referencing(self, target: str) -> List[Tuple[str, str]]:
+        """(collection, field) pairs that point at ``target``"""
+        return [(collection, field) for collection, field, to in self.references() if to == target]
+
+    @classmethod
+    def from_file(cls, path: str) -> "SchemaRegistry":
+        """Load a registry from a JSON, YAML or Python (``SCHEMA = {...}``) file"""
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == ".json":
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f))
+
+        if extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise SchemaError("PyYAML is required to load YAML schema files: pip install pyyaml") from e
+            with open(path, encoding="utf-8") as f:
+                return cls(yaml.safe_load(f))
+
+        if extension == ".py":
+            spec = importlib.util.spec_from_file_location("zygo_schema_definition", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            if not hasattr(module, "SCHEMA"):
+                raise SchemaError(f"{path} does not define SCHEMA")
+            return cls(module.SCHEMA)
+
+        raise SchemaError(f"Unsupported schema file type: {path}")
+
+
+@lru_cache(maxsize=None)
+def load_registry(path: str = DEFAULT_SCHEMA_PATH) -> SchemaRegistry:
+    """Load and cache the registry - repeated calls with the same path are free"""
+    return SchemaRegistry.from_file(path)
+
+
+def main():
+    """Print a summary of the registry"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the Zygo schema registry")
+    parser.add_argument("--schema", help="Path to the schema definition", default=DEFAULT_SCHEMA_PATH)
+    parser.add_argument("--json", help="Dump collections as JSON", action="store_true")
+
+    args = parser.parse_args()
+    registry = load_registry(args.schema)
+
+    if args.json:
+        print(json.dumps({collection.name: collection.schema_doc() for collection in registry}, indent=2))
+        return
+
+    for group, names in registry.groups.items():
+        print(f"📦 {group}")
+        for name in names:
+            collection = registry.collection(name)
+            print(f"   {name}: {len(collection.fields)} fields, {len(collection.references)} references")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Session Rollups for Zygo Platform
+Maintains daily and weekly aggregates of breastfeeding_sessions, sleep_sessions and
+growth_measurements per family member in session_rollups, so dashboards and the
+breastfeeding_daily/breastfeeding_weekly feed items read one document instead of
+scanning raw sessions.
+
+New sessions are applied as deltas (Firestore Increment on the day and week documents,
+no read needed). The rebuild command streams the raw collections and aggregates them
+column-wise with numpy, which is only imported for rebuilds. Days and weeks are UTC;
+weeks start on Monday.
+"""
+
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+from schema_registry import SchemaRegistry, load_registry
+
+GRANULARITIES = ("daily", "weekly")
+
+
+class RollupError(Exception):
+    """Raised when rollups cannot be computed"""
+
+
+class RollupSource:
+    __slots__ = ("collection", "section", "time_field", "type_field", "metrics")
+
+    def __init__(
+        self,
+        collection: str,
+        section: str,
+        time_field: str,
+        type_field: Optional[str],
+        metrics: Tuple[Tuple[str, Callable[[Dict[str, Any]], Optional[float]]], ...],
+    ):
+        """How one raw session collection contributes to a section of the rollup document
+
+        Every metric is stored as sums.{metric} and counts.{metric} (sessions that had a
+        value), so means stay exact under Increment. Sessions with a type are also counted
+        in by_type.{type}.count and by_type.{type}.duration_minutes (the first metric).
+        """
+        self.collection = collection
+        self.section = section
+        self.time_field = time_field
+        self.type_field = type_field
+        self.metrics = metrics
+
+    @property
+    def fields(self) -> List[str]:
+        """Fields to project when streaming the raw collection"""
+        names = ["family_member_id", self.time_field] + [name for name, _ in self.metrics]
+        if self.type_field:
+            names.append(self.type_field)
+        return names
+
+
+def _number(field: str) -> Callable[[Dict[str, Any]], Optional[float]]:
+    def extract(data: Dict[str, Any]) -> Optional[float]:
+        value = data.get(field)
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+    return extract
+
+
+def _wake_ups(data: Dict[str, Any]) -> Optional[float]:
+    wake_ups = data.get("wake_ups")
+    return float(len(wake_ups)) if isinstance(wake_ups, list) else None
+
+
+SOURCES = (
+    RollupSource(
+        "breastfeeding_sessions",
+        "breastfeeding",
+        "start_time",
+        "session_type",
+        (
+            ("duration_minutes", _number("duration_minutes")),
+            ("happiness_level", _number("happiness_level")),
+            ("soreness_level", _number("soreness_level")),
+        ),
+    ),
+    RollupSource(
+        "sleep_sessions",
+        "sleep",
+        "sleep_start",
+        "sleep_type",
+        (
+            ("duration_minutes", _number("duration_minutes")),
+            ("quality_rating", _number("quality_rating")),
+            ("wake_ups", _wake_ups),
+        ),
+    ),
+    RollupSource(
+        "growth_measurements",
+        "growth",
+        "measured_date",
+        None,
+        (
+            ("weight_kg", _number("weight_kg")),
+            ("height_cm", _number("height_cm")),
+            ("head_circumference_cm", _number("head_circumference_cm")),
+        ),
+    ),
+)
+
+SOURCES_BY_COLLECTION = {source.collection: source for source in SOURCES}
+
+
+def _day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def period_of(day: date, granularity: str) -> Tuple[str, datetime]:
+    """(period_key, period_start) of the day or ISO week containing ``day``"""
+    if granularity == "weekly":
+        day = day - timedelta(days=day.weekday())
+        year, week, _ = day.isocalendar()
+        key = f"{year}-W{week:02d}"
+    else:
+        key = day.isoformat()
+    return key, datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+
+
+def rollup_id(family_member_id: str, granularity: str, period_key: str) -> str:
+    return f"{family_member_id}_{granularity}_{period_key}"
+
+
+def summarize(section: Dict[str, Any]) -> Dict[str, Any]:
+    """Totals and means of a rollup section, e.g. for a breastfeeding_daily feed item"""
+    summary: Dict[str, Any] = {"count": section.get("count", 0)}
+    sums = section.get("sums", {})
+    counts = section.get("counts", {})
+    for metric, total in sums.items():
+        summary[f"total_{metric}"] = total
+        summary[f"mean_{metric}"] = total / counts[metric] if counts.get(metric) else None
+    if "by_type" in section:
+        summary["by_type"] = {name: dict(values) for name, values in section["by_type"].items()}
+    return summary
+
+
+class RollupUpdater:
+    def __init__(self, db):
+        """Apply single sessions to the rollups by delta"""
+        self.db = db
+
+    def apply(self, collection: str, data: Dict[str, Any], sign: int = 1, batch=None) -> int:
+        """Add (sign=1) or remove (sign=-1) one session; returns the number of documents touched
+
+        Pass a WriteBatch or Transaction to commit the rollup update with the session write
+        itself. To edit a session, apply the old version with sign=-1 and the new one with 1.
+        """
+        from firebase_admin import firestore
+
+        source = SOURCES_BY_COLLECTION[collection]
+        started = data.get(source.time_field)
+        member_id = data.get("family_member_id")
+        if not member_id or not isinstance(started, datetime):
+            return 0
+
+        section: Dict[str, Any] = {"count": firestore.Increment(sign), "sums": {}, "counts": {}}
+        for metric, extract in source.metrics:
+            value = extract(data)
+            if value is not None:
+                section["sums"][metric] = firestore.Increment(value * sign)
+                section["counts"][metric] = firestore.Increment(sign)
+        session_type = data.get(source.type_field) if source.type_field else None
+        if session_type:
+            duration = source.metrics[0][1](data) or 0
+            section["by_type"] = {
+                session_type: {
+                    "count": firestore.Increment(sign),
+                    "duration_minutes": firestore.Increment(duration * sign),
+                }
+            }
+
+        now = datetime.now(timezone.utc)
+        for granularity in GRANULARITIES:
+            key, period_start = period_of(_day(started), granularity)
+            doc_ref = self.db.collection("session_rollups").document(rollup_id(member_id, granularity, key))
+            update = {
+                "family_member_id": member_id,
+                "granularity": granularity,
+                "period_key": key,
+                "period_start": period_start,
+                source.section: section,
+                "updated_at": now,
+            }
+            if batch is None:
+                doc_ref.set(update, merge=True)
+            else:
+                batch.set(doc_ref, update, merge=True)
+        return len(GRANULARITIES)
+
+
+def _aggregate(
+    source: RollupSource, columns: Dict[str, Any], granularity: str
+) -> Dict[Tuple[str, str], Tuple[datetime, Dict[str, Any]]]:
+    """Group one source's columns by (member, period) with numpy bincount
+
+    Returns {(member_id, period_key): (period_start, section)}.
+    """
+    import numpy as np
+
+    members = np.asarray(columns["member"], dtype=np.int64)
+    days = np.asarray(columns["day"], dtype=np.int64)
+    if granularity == "weekly":
+        # date.toordinal() is 1 for Monday 0001-01-01, so (ordinal - 1) % 7 is the weekday
+        days = days - (days - 1) % 7
+    keys = members * (1 << 32) + days
+    unique_keys, groups = np.unique(keys, return_inverse=True)
+    size = len(unique_keys)
+
+    counts = np.bincount(groups, minlength=size)
+    metric_sums = {}
+    metric_counts = {}
+    for metric, _ in source.metrics:
+        values = np.asarray(columns[metric], dtype=np.float64)
+        present = ~np.isnan(values)
+        metric_sums[metric] = np.bincount(groups, weights=np.where(present, values, 0.0), minlength=size)
+        metric_counts[metric] = np.bincount(groups, weights=present, minlength=size)
+
+    type_names = columns.get("type_names", [])
+    if type_names:
+        types = np.asarray(columns["type"], dtype=np.int64)
+        typed = types >= 0
+        cells = groups[typed] * len(type_names) + types[typed]
+        durations = np.asarray(columns[source.metrics[0][0]], dtype=np.float64)[typed]
+        type_counts = np.bincount(cells, minlength=size * len(type_names)).reshape(size, len(type_names))
+        type_minutes = np.bincount(
+            cells, weights=np.nan_to_num(durations), minlength=size * len(type_names)
+        ).reshape(size, len(type_names))
+
+    member_ids = columns["member_ids"]
+    result = {}
+    for group, key in enumerate(unique_keys.tolist()):
+        member_id = member_ids[key >> 32]
+        section: Dict[str, Any] = {"count": int(counts[group]), "sums": {}, "counts": {}}
+        for metric, _ in source.metrics:
+            if metric_counts[metric][group]:
+                section["sums"][metric] = float(metric_sums[metric][group])
+                section["counts"][metric] = int(metric_counts[metric][group])
+        if type_names:
+            section["by_type"] = {
+                name: {"count": int(type_counts[group, code]), "duration_minutes": float(type_minutes[group, code])}
+                for code, name in enumerate(type_names)
+                if type_counts[group, code]
+            }
+        period_key, period_start = period_of(date.fromordinal(key & 0xFFFFFFFF), granularity)
+        result[(member_id, period_key)] = (period_start, section)
+    return result
+
+
+class RollupRebuilder:
+    def __init__(self, db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE):
+        """Recompute session_rollups from the raw session collections"""
+        self.db = db
+        self.registry = registry or load_registry()
+        self.batch_size = batch_size
+
+    def _columns(self, source: RollupSource, family_member_id: Optional[str]) -> Dict[str, Any]:
+        """Stream the projected raw collection into flat columns"""
+        from array import array
+
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        type_names = []
+        if source.type_field:
+            type_names = list(self.registry.collection(source.collection).fields[source.type_field].enum or ())
+        type_codes = {name: code for code, name in enumerate(type_names)}
+        member_codes: Dict[str, int] = {}
+        columns: Dict[str, Any] = {"member": array("q"), "day": array("q"), "type": array("q")}
+        for metric, _ in source.metrics:
+            columns[metric] = array("d")
+
+        query = self.db.collection(source.collection)
+        if family_member_id:
+            query = query.where(filter=FieldFilter("family_member_id", "==", family_member_id))
+        for snapshot in query.select(source.fields).stream():
+            data = snapshot.to_dict() or {}
+            started = data.get(source.time_field)
+            member_id = data.get("family_member_id")
+            if snapshot.id == "_schema" or not member_id or not isinstance(started, datetime):
+                continue
+            columns["member"].append(member_codes.setdefault(member_id, len(member_codes)))
+            columns["day"].append(_day(started).toordinal())
+            columns["type"].append(type_codes.get(data.get(source.type_field), -1) if source.type_field else -1)
+            for metric, extract in source.metrics:
+                value = extract(data)
+                columns[metric].append(float("nan") if value is None else value)
+
+        columns["member_ids"] = list(member_codes)
+        columns["type_names"] = type_names
+        return columns
+
+    def rebuild(self, family_member_id: Optional[str] = None) -> Dict[str, int]:
+        """Rewrite every rollup document (of one member, if given) and delete stale ones"""
+        try:
+            import numpy  # noqa: F401
+        except ImportError as e:
+            raise RollupError("numpy is required to rebuild rollups: pip install numpy") from e
+
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        docs: Dict[str, Dict[str, Any]] = {}
+        sessions = 0
+        for source in SOURCES:
+            columns = self._columns(source, family_member_id)
+            sessions += len(columns["day"])
+            if not len(columns["day"]):
+                continue
+            for granularity in GRANULARITIES:
+                aggregated = _aggregate(source, columns, granularity)
+                for (member_id, period_key), (period_start, section) in aggregated.items():
+                    doc_id = rollup_id(member_id, granularity, period_key)
+                    if doc_id not in docs:
+                        docs[doc_id] = {
+                            "family_member_id": member_id,
+                            "granularity": granularity,
+                            "period_key": period_key,
+                            "period_start": period_start,
+                        }
+                    docs[doc_id][source.section] = section
+
+        now = datetime.now(timezone.utc)
+        collection = self.db.collection("session_rollups")
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        for doc_id, data in docs.items():
+            writer.set(collection.document(doc_id), {**data, "updated_at": now})
+
+        existing = collection
+        if family_member_id:
+            existing = existing.where(filter=FieldFilter("family_member_id", "==", family_member_id))
+        stale = 0
+        for snapshot in existing.select([]).stream():
+            if snapshot.id not in docs and snapshot.id != "_schema":
+                writer.delete(snapshot.reference)
+                stale += 1
+        writer.flush()
+        return {"sessions": sessions, "rollups": len(docs), "deleted": stale, "writes": writer.committed_writes}
+
+
+def read_rollups(
+    db, family_member_id: str, granularity: str = "daily", since: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """Rollup documents of a family member, oldest first - one indexed query"""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        db.collection("session_rollups")
+        .where(filter=FieldFilter("family_member_id", "==", family_member_id))
+        .where(filter=FieldFilter("granularity", "==", granularity))
+    )
+    if since is not None:
+        query = query.where(filter=FieldFilter("period_start", ">=", since))
+    return [snapshot.to_dict() for snapshot in query.order_by("period_start").stream()]
+
+
+def main():
+    """Rebuild rollups or print a family member's rollups"""
+    import argparse
+    import os
+    import sys
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    parser = argparse.ArgumentParser(description="Maintain Zygo session rollups")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--rebuild", help="Recompute rollups from the raw session collections", action="store_true")
+    parser.add_argument("--family-member", help="Limit --rebuild or --show to one family member", default=None)
+    parser.add_argument("--show", help="Print rollups of --family-member", choices=GRANULARITIES, default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+
+    if args.rebuild:
+        print("📊 Rebuilding session rollups...")
+        try:
+            result = RollupRebuilder(db, batch_size=args.batch_size).rebuild(args.family_member)
+        except RollupError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(
+            f"✅ {result['rollups']:,} rollups from {result['sessions']:,} sessions "
+            f"({result['deleted']:,} stale rollups deleted, {result['writes']:,} writes)"
+        )
+
+    if args.show:
+        if not args.family_member:
+            parser.error("--show requires --family-member")
+        for rollup in read_rollups(db, args.family_member, args.show):
+            print(f"📅 {rollup['period_key']}")
+            for source in SOURCES:
+                if source.section in rollup:
+                    print(f"   {source.section}: {summarize(rollup[source.section])}")
+
+
+if __name__ == "__main__":
+    main()
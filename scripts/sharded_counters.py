@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Sharded Counters for Zygo Platform
+Spreads hot counters (feed item stats, comment reactions) over N shard documents in a
+subcollection so popular posts are not capped by Firestore's ~1 write/sec per document.
+
+Increments go to a random shard; totals are the sum of all shards, cached briefly in memory.
+The shard layout (subcollection name and shard count) comes from the schema registry.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Set, Tuple
+
+from firebase_admin import firestore
+
+from firestore_writer import MAX_BATCH_SIZE, BatchedWriter
+from schema_registry import SchemaRegistry, load_registry
+
+FEED_STATS = ("feed_items", "stat_shards")
+COMMENT_REACTIONS = ("comments", "reaction_shards")
+
+
+def _nested(path: str, value: Any) -> Dict[str, Any]:
+    """Turn "counts.like" into {"counts": {"like": value}} for set(..., merge=True)"""
+    result = value
+    for part in reversed(path.split(".")):
+        result = {part: result}
+    return result
+
+
+def _add(totals: Dict[str, Any], data: Dict[str, Any]):
+    """Sum numeric fields of a shard into ``totals``, recursing into maps"""
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _add(totals.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            totals[key] = totals.get(key, 0) + value
+
+
+class TotalsCache:
+    def __init__(self, ttl_seconds: float = 5.0):
+        """Thread-safe TTL cache of aggregated totals keyed by parent document path"""
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+                return entry[1]
+            return None
+
+    def put(self, key: str, totals: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), totals)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Shared by every counter in the process so repeated reads of a hot post are served from memory
+_cache = TotalsCache()
+
+
+class ShardedCounter:
+    def __init__(self, db, parent_ref, subcollection: str, shard_count: int, cache: TotalsCache = _cache):
+        """Counter stored in ``parent_ref/subcollection/{0..shard_count-1}``"""
+        self.db = db
+        self.parent_ref = parent_ref
+        self.shards = parent_ref.collection(subcollection)
+        self.shard_count = shard_count
+        self.cache = cache
+
+    @classmethod
+    def for_document(cls, db, layout: Tuple[str, str], doc_id: str, registry: SchemaRegistry = None):
+        """Counter for a document using the registry layout, e.g. ``FEED_STATS``"""
+        collection, subcollection = layout
+        spec = (registry or load_registry()).collection(collection).subcollection(subcollection)
+        parent_ref = db.collection(collection).document(doc_id)
+        return cls(db, parent_ref, subcollection, spec.settings.get("shard_count", 10))
+
+    def increment(self, field: str, amount: int = 1, batch=None):
+        """Add ``amount`` to ``field`` (dotted paths allowed) on a random shard
+
+        Pass a WriteBatch or Transaction to make the increment part of a larger write.
+        """
+        shard = self.shards.document(str(random.randrange(self.shard_count)))
+        data = _nested(field, firestore.Increment(amount))
+        if batch is None:
+            shard.set(data, merge=True)
+        else:
+            batch.set(shard, data, merge=True)
+        self.cache.invalidate(self.parent_ref.path)
+
+    def totals(self, use_cache: bool = True) -> Dict[str, Any]:
+        """Sum of every shard - at most ``shard_count`` document reads"""
+        if use_cache:
+            cached = self.cache.get(self.parent_ref.path)
+            if cached is not None:
+                return cached
+
+        totals: Dict[str, Any] = {}
+        for shard in self.shards.stream():
+            _add(totals, shard.to_dict() or {})
+        self.cache.put(self.parent_ref.path, totals)
+        return totals
+
+    def total(self, field: str, use_cache: bool = True) -> int:
+        """Total for a single (dotted) field"""
+        value: Any = self.totals(use_cache)
+        for part in field.split("."):
+            value = value.get(part, 0) if isinstance(value, dict) else 0
+        return value
+
+    def reset(self, values: Dict[str, Any], writer: BatchedWriter):
+        """Queue writes that make the shard totals equal ``values`` - shard 0 holds the
+        value, every other shard is zeroed; fields not in ``values`` are left alone"""
+        zeroed = {key: ({k: 0 for k in value} if isinstance(value, dict) else 0) for key, value in values.items()}
+        for number in range(self.shard_count):
+            writer.set(self.shards.document(str(number)), values if number == 0 else zeroed, merge=True)
+        self.cache.invalidate(self.parent_ref.path)
+
+
+def _counter_parents(db, layout: Tuple[str, str]) -> Set[str]:
+    """IDs of the documents that already have shards in ``layout``, from a keys-only scan"""
+    collection, subcollection = layout
+    parents = set()
+    for shard in db.collection_group(subcollection).select([]).stream():
+        parent_ref = shard.reference.parent.parent
+        if parent_ref is not None and parent_ref.parent.id == collection:
+            parents.add(parent_ref.id)
+    return parents
+
+
+def backfill_from_likes(db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE) -> Dict[str, int]:
+    """Rebuild like and comment counter shards from the likes and comments collections
+
+    Counts are aggregated in memory per target while streaming, so the cost is one read per
+    like/comment and per existing shard plus ``shard_count`` writes per target. Targets whose
+    shards exist but that no longer have any likes or comments are reset to zero. Share
+    counts are not derivable and are left untouched.
+    """
+    registry = registry or load_registry()
+    feed_likes: Dict[str, int] = {}
+    feed_comments: Dict[str, int] = {}
+    comment_likes: Dict[str, int] = {}
+
+    for like in db.collection("likes").select(["target_id", "target_type"]).stream():
+        if like.id == "_schema":
+            continue
+        data = like.to_dict()
+        counts = comment_likes if data.get("target_type") == "comment" else feed_likes
+        counts[data["target_id"]] = counts.get(data["target_id"], 0) + 1
+
+    for comment in db.collection("comments").select(["feed_item_id", "is_deleted"]).stream():
+        if comment.id == "_schema":
+            continue
+        data = comment.to_dict()
+        if not data.get("is_deleted"):
+            feed_comments[data["feed_item_id"]] = feed_comments.get(data["feed_item_id"], 0) + 1
+
+    feed_items = feed_likes.keys() | feed_comments.keys() | _counter_parents(db, FEED_STATS)
+    comments = comment_likes.keys() | _counter_parents(db, COMMENT_REACTIONS)
+
+    writer = BatchedWriter(db, batch_size=batch_size)
+    for feed_item_id in feed_items:
+        counter = ShardedCounter.for_document(db, FEED_STATS, feed_item_id, registry)
+        values = {"likes": feed_likes.get(feed_item_id, 0), "comments": feed_comments.get(feed_item_id, 0)}
+        counter.reset(values, writer)
+    for comment_id in comments:
+        counter = ShardedCounter.for_document(db, COMMENT_REACTIONS, comment_id, registry)
+        counter.reset({"counts": {"like": comment_likes.get(comment_id, 0)}}, writer)
+    writer.flush()
+
+    return {
+        "feed_items": len(feed_items),
+        "comments": len(comments),
+        "likes": sum(feed_likes.values()) + sum(comment_likes.values()),
+        "writes": writer.committed_writes,
+    }
+
+
+def main():
+    """Rebuild counter shards or read a counter"""
+    import argparse
+    import os
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    parser = argparse.ArgumentParser(description="Manage Zygo sharded counters")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--backfill", help="Rebuild all shards from the likes and comments collections", action="store_true")
+    parser.add_argument("--feed-item", help="Print the stats totals of a feed item", default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+
+    if args.backfill:
+        print("🔢 Rebuilding counter shards from likes and comments...")
+        result = backfill_from_likes(db, batch_size=args.batch_size)
+        print(
+            f"✅ Rebuilt {result['feed_items']:,} feed item and {result['comments']:,} comment counters "
+            f"from {result['likes']:,} likes ({result['writes']:,} shard writes)"
+        )
+
+    if args.feed_item:
+        counter = ShardedCounter.for_document(db, FEED_STATS, args.feed_item)
+        print(counter.totals(use_cache=False))
+
+
+if __name__ == "__main__":
+    main()
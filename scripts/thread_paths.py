@@ -0,0 +1,40 @@
+"""
+Comment thread paths for Zygo tooling
+Pure helpers computing a comment's materialized thread position (see comment_threads.py),
+kept free of Firebase imports so data generators and benchmarks can use them cheaply.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+SEPARATOR = "."
+SUBTREE_END = chr(ord(SEPARATOR) + 1)
+MAX_DEPTH = 32
+
+
+def _millis(created_at: Any) -> int:
+    if isinstance(created_at, datetime):
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return max(0, int(created_at.timestamp() * 1000))
+    return 0
+
+
+def path_segment(created_at: Any, comment_id: str) -> str:
+    """Fixed-width sort key of one comment among its siblings"""
+    digest = hashlib.blake2b(comment_id.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{_millis(created_at):013d}{digest}"
+
+
+def thread_position(
+    comment_id: str, created_at: Any, parent: Optional[Tuple[str, str, List[str]]] = None
+) -> Dict[str, Any]:
+    """path, depth and ancestor_ids of a comment; ``parent`` is (parent ID, path, ancestor_ids)"""
+    segment = path_segment(created_at, comment_id)
+    if parent is None:
+        return {"path": segment, "depth": 0, "ancestor_ids": []}
+    parent_id, parent_path, parent_ancestors = parent
+    ancestors = (list(parent_ancestors) + [parent_id])[:MAX_DEPTH]
+    prefix = SEPARATOR.join(parent_path.split(SEPARATOR)[: len(ancestors)])
+    return {"path": f"{prefix}{SEPARATOR}{segment}", "depth": len(ancestors), "ancestor_ids": ancestors}
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Timeline Fan-out for Zygo Platform
+Materializes each actor's feed into timelines/{actor_id}/items so a feed page is one
+indexed query instead of one query per followed actor.
+
+New feed items are fanned out on write to every follower (actor_relationships with
+relationship_type == follows, actor_id_1 following actor_id_2). Authors with more followers
+than the registry's pull_follower_threshold are not fanned out; followers keep them in
+timelines/{actor_id}.pull_authors and their recent items are merged in at read time.
+
+Each author's mode is stored in timelines/{author_id}.fanout_mode. When the follower count
+crosses the threshold every follower is migrated: push -> pull adds the author to their
+pull_authors, pull -> push (once below half the threshold) removes it and copies the recent
+items in. The mode is written after the followers, so an interrupted switch is redone.
+"""
+
+import heapq
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_writer import MAX_BATCH_SIZE, MAX_IN_VALUES, BatchedWriter
+from schema_registry import SchemaRegistry, load_registry
+
+CHECKPOINT_DOC = ("_system", "timeline_fanout")
+
+PUSH = "push"
+PULL = "pull"
+
+# Recent items copied into a timeline when a follower starts receiving an author's pushes
+BACKFILL_ITEMS = 50
+
+
+class TimelineFanout:
+    def __init__(self, db, registry: SchemaRegistry = None, batch_size: int = MAX_BATCH_SIZE):
+        """Fan-out worker over the timelines collection"""
+        self.db = db
+        registry = registry or load_registry()
+        self.pull_threshold = registry.collection("timelines").settings.get("pull_follower_threshold", 10000)
+        self.batch_size = batch_size
+        self._follower_counts: Dict[str, int] = {}
+        self._modes: Dict[str, str] = {}
+
+    def _timeline(self, actor_id: str):
+        return self.db.collection("timelines").document(actor_id)
+
+    def _followers_query(self, author_id: str):
+        return (
+            self.db.collection("actor_relationships")
+            .where(filter=FieldFilter("actor_id_2", "==", author_id))
+            .where(filter=FieldFilter("relationship_type", "==", "follows"))
+            .where(filter=FieldFilter("is_active", "==", True))
+        )
+
+    def followers(self, author_id: str) -> Iterator[str]:
+        """Stream follower actor IDs without loading the whole list"""
+        for relationship in self._followers_query(author_id).select(["actor_id_1"]).stream():
+            yield relationship.get("actor_id_1")
+
+    def follower_count(self, author_id: str) -> int:
+        """Follower count via a COUNT aggregation, cached for the life of the worker"""
+        if author_id not in self._follower_counts:
+            result = self._followers_query(author_id).count().get()
+            self._follower_counts[author_id] = int(result[0][0].value)
+        return self._follower_counts[author_id]
+
+    def fanout_mode(self, author_id: str) -> str:
+        """Stored push/pull mode of an author, switched when the follower count crosses the threshold"""
+        if author_id in self._modes:
+            return self._modes[author_id]
+
+        timeline = self._timeline(author_id).get()
+        stored = (timeline.to_dict() or {}).get("fanout_mode") if timeline.exists else None
+        count = self.follower_count(author_id)
+        # Switching back to push only below half the threshold keeps authors near it from flapping
+        if count > self.pull_threshold or (stored == PULL and count > self.pull_threshold // 2):
+            mode = PULL
+        else:
+            mode = PUSH
+
+        if stored != mode:
+            if mode == PULL:
+                self._migrate_to_pull(author_id)
+            elif stored == PULL:
+                self._migrate_to_push(author_id)
+            self._timeline(author_id).set(
+                {"actor_id": author_id, "fanout_mode": mode, "updated_at": datetime.now(timezone.utc)}, merge=True
+            )
+        self._modes[author_id] = mode
+        return mode
+
+    def is_pull_author(self, author_id: str) -> bool:
+        """High-follower authors are read at query time instead of fanned out"""
+        return self.fanout_mode(author_id) == PULL
+
+    def _migrate_to_pull(self, author_id: str):
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        for follower_id in self.followers(author_id):
+            writer.set(
+                self._timeline(follower_id),
+                {
+                    "actor_id": follower_id,
+                    "pull_authors": firestore.ArrayUnion([author_id]),
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                merge=True,
+            )
+        writer.flush()
+
+    def _migrate_to_push(self, author_id: str):
+        recent = self._recent_items(author_id, BACKFILL_ITEMS)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        # Items posted in pull mode are copied below, so retract() must now reach the followers
+        for feed_item_id, entry in recent:
+            writer.set(self._timeline(author_id).collection("items").document(feed_item_id), entry)
+        for follower_id in self.followers(author_id):
+            writer.set(
+                self._timeline(follower_id),
+                {"pull_authors": firestore.ArrayRemove([author_id]), "updated_at": datetime.now(timezone.utc)},
+                merge=True,
+            )
+            for feed_item_id, entry in recent:
+                writer.set(self._timeline(follower_id).collection("items").document(feed_item_id), entry)
+        writer.flush()
+
+    def _recent_items(self, author_id: str, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        recent = (
+            self.db.collection("feed_items")
+            .where(filter=FieldFilter("author_id", "==", author_id))
+            .order_by("created_at", direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        return [(item.id, self._entry(item.id, item.to_dict(), pushed=True)) for item in recent.stream()]
+
+    @staticmethod
+    def _entry(feed_item_id: str, item: Dict[str, Any], pushed: bool) -> Dict[str, Any]:
+        return {
+            "feed_item_id": feed_item_id,
+            "author_id": item["author_id"],
+            "type": item.get("type"),
+            "created_at": item["created_at"],
+            "fanned_out_at": datetime.now(timezone.utc),
+            "pushed": pushed,
+        }
+
+    def fan_out(self, feed_item_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Write a reference to ``item`` into the author's and every follower's timeline"""
+        author_id = item["author_id"]
+        mode = self.fanout_mode(author_id)
+        entry = self._entry(feed_item_id, item, pushed=mode == PUSH)
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+
+        # Authors always see their own posts
+        writer.set(self._timeline(author_id).collection("items").document(feed_item_id), entry)
+
+        if mode == PULL:
+            writer.flush()
+            return {"mode": PULL, "followers": self.follower_count(author_id), "writes": writer.committed_writes}
+
+        for follower_id in self.followers(author_id):
+            writer.set(self._timeline(follower_id).collection("items").document(feed_item_id), entry)
+        writer.flush()
+        return {"mode": PUSH, "followers": writer.committed_writes - 1, "writes": writer.committed_writes}
+
+    def retract(self, feed_item_id: str, author_id: str) -> int:
+        """Remove a deleted feed item from every timeline it was fanned out to
+
+        Followers hold copies when the item was pushed, whatever the author's mode is now;
+        entries written before the pushed flag existed fall back to the current mode.
+        """
+        entry_ref = self._timeline(author_id).collection("items").document(feed_item_id)
+        entry = entry_ref.get()
+        pushed = (entry.to_dict() or {}).get("pushed") if entry.exists else None
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        writer.delete(entry_ref)
+        if pushed or not self.is_pull_author(author_id):
+            for follower_id in self.followers(author_id):
+                writer.delete(self._timeline(follower_id).collection("items").document(feed_item_id))
+        return writer.flush()
+
+    def on_follow(self, follower_id: str, author_id: str, backfill: int = BACKFILL_ITEMS):
+        """Start following: pull authors are recorded, others get recent items copied in"""
+        if self.is_pull_author(author_id):
+            self._timeline(follower_id).set(
+                {
+                    "actor_id": follower_id,
+                    "pull_authors": firestore.ArrayUnion([author_id]),
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                merge=True,
+            )
+            return
+
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        for feed_item_id, entry in self._recent_items(author_id, backfill):
+            writer.set(self._timeline(follower_id).collection("items").document(feed_item_id), entry)
+        writer.flush()
+
+    def on_unfollow(self, follower_id: str, author_id: str):
+        """Stop following: drop the author from pull_authors and their items from the timeline"""
+        self._timeline(follower_id).set(
+            {"pull_authors": firestore.ArrayRemove([author_id]), "updated_at": datetime.now(timezone.utc)}, merge=True
+        )
+        items = self._timeline(follower_id).collection("items").where(filter=FieldFilter("author_id", "==", author_id))
+        writer = BatchedWriter(self.db, batch_size=self.batch_size)
+        for entry in items.select([]).stream():
+            writer.delete(entry.reference)
+        writer.flush()
+
+    def run_pending(self, limit: int = 500) -> Dict[str, int]:
+        """Fan out feed items created since the last checkpoint, oldest first
+
+        The checkpoint is a (created_at, document ID) cursor, so items sharing a timestamp are
+        not skipped, and it is written once per run. Fan-out is idempotent: a crash mid-run
+        only repeats the items of that run.
+        """
+        checkpoint_ref = self.db.collection(CHECKPOINT_DOC[0]).document(CHECKPOINT_DOC[1])
+        checkpoint = checkpoint_ref.get()
+        state = (checkpoint.to_dict() or {}) if checkpoint.exists else {}
+
+        pending = self.db.collection("feed_items")
+        if state.get("last_created_at") is not None and state.get("last_id") is None:
+            # Checkpoints written before the document ID was recorded
+            pending = pending.where(filter=FieldFilter("created_at", ">", state["last_created_at"]))
+        pending = pending.order_by("created_at").order_by("__name__")
+        if state.get("last_id") is not None:
+            pending = pending.start_after({"created_at": state["last_created_at"], "__name__": state["last_id"]})
+
+        totals = {"items": 0, "push": 0, "pull": 0, "writes": 0}
+        last = None
+        for item in pending.limit(limit).stream():
+            result = self.fan_out(item.id, item.to_dict())
+            totals["items"] += 1
+            totals[result["mode"]] += 1
+            totals["writes"] += result["writes"]
+            last = item
+
+        if last is not None:
+            checkpoint_ref.set(
+                {
+                    "last_created_at": last.get("created_at"),
+                    "last_id": last.id,
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            )
+        return totals
+
+
+def read_timeline(db, actor_id: str, page_size: int = 20, before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """One page of an actor's feed, newest first
+
+    The materialized timeline is a single indexed query; pull authors add one feed_items query
+    per 30 authors, which is served by the (author_id, created_at DESC) index.
+    """
+    timeline_ref = db.collection("timelines").document(actor_id)
+    query = timeline_ref.collection("items").order_by("created_at", direction=firestore.Query.DESCENDING)
+    if before is not None:
+        query = query.where(filter=FieldFilter("created_at", "<", before))
+    pages = [[entry.to_dict() for entry in query.limit(page_size).stream()]]
+
+    timeline = timeline_ref.get()
+    pull_authors = (timeline.to_dict() or {}).get("pull_authors", []) if timeline.exists else []
+    for start in range(0, len(pull_authors), MAX_IN_VALUES):
+        pulled = db.collection("feed_items").where(
+            filter=FieldFilter("author_id", "in", pull_authors[start : start + MAX_IN_VALUES])
+        )
+        if before is not None:
+            pulled = pulled.where(filter=FieldFilter("created_at", "<", before))
+        pulled = pulled.order_by("created_at", direction=firestore.Query.DESCENDING).limit(page_size)
+        pages.append(
+            [
+                {
+                    "feed_item_id": item.id,
+                    "author_id": item.get("author_id"),
+                    "type": item.get("type"),
+                    "created_at": item.get("created_at"),
+                }
+                for item in pulled.stream()
+            ]
+        )
+
+    # Every page is already sorted newest first, so a k-way merge keeps the order
+    merged = heapq.merge(*pages, key=lambda entry: entry["created_at"], reverse=True)
+    seen = set()
+    result = []
+    for entry in merged:
+        if entry["feed_item_id"] not in seen:
+            seen.add(entry["feed_item_id"])
+            result.append(entry)
+        if len(result) == page_size:
+            break
+    return result
+
+
+def main():
+    """Run the fan-out worker or read a timeline"""
+    import argparse
+    import os
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    parser = argparse.ArgumentParser(description="Zygo timeline fan-out worker")
+    parser.add_argument("--service-account", help="Path to Firebase service account JSON file", default=None)
+    parser.add_argument("--project-id", help="Firebase project ID", default=None)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--run", help="Fan out feed items created since the last checkpoint", action="store_true")
+    parser.add_argument("--limit", help="Maximum feed items per --run", type=int, default=500)
+    parser.add_argument("--fan-out", help="Fan out a single feed item by ID", default=None)
+    parser.add_argument("--read", help="Print the first timeline page of an actor", default=None)
+
+    args = parser.parse_args()
+
+    if args.project_id:
+        os.environ["GOOGLE_CLOUD_PROJECT"] = args.project_id
+
+    cred = credentials.Certificate(args.service_account) if args.service_account else credentials.ApplicationDefault()
+    try:
+        firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already initialized
+        pass
+    db = firestore.client()
+    fanout = TimelineFanout(db, batch_size=args.batch_size)
+
+    if args.fan_out:
+        item = db.collection("feed_items").document(args.fan_out).get()
+        if not item.exists:
+            parser.error(f"feed item {args.fan_out} does not exist")
+        result = fanout.fan_out(item.id, item.to_dict())
+        print(f"📣 {args.fan_out}: {result['mode']} mode, {result['writes']} timeline writes")
+
+    if args.run:
+        totals = fanout.run_pending(limit=args.limit)
+        print(
+            f"✅ Fanned out {totals['items']} feed items ({totals['push']} push, {totals['pull']} pull) "
+            f"with {totals['writes']} timeline writes"
+        )
+
+    if args.read:
+        for entry in read_timeline(db, args.read):
+            print(f"   {entry['created_at']}  {entry['author_id']}  {entry['feed_item_id']}")
+
+
+if __name__ == "__main__":
+    main()